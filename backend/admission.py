@@ -0,0 +1,127 @@
+from cache import TTLCache
+from contextlib import asynccontextmanager
+from metrics import ADMISSION_REJECTED
+import time
+
+#* Control de admisión: límites de tamaño, límites de frecuencia por usuario y un presupuesto de bytes de subidas en curso
+#? Ante una sobrecarga se rechaza de inmediato (429, 503 o un evento `error` del socket) en vez de encolar sin límite.
+#? Todo el estado vive en memoria del proceso, con varios workers cada uno aplica sus propios límites.
+
+class RequestTooLarge(Exception):
+    pass
+
+class Overloaded(Exception):
+    pass
+
+class RateLimiter:
+    #* Token bucket por clave (uid): `rate` tokens por segundo y hasta `burst` acumulados
+    #? Un bucket sin uso se llena por completo en burst / rate segundos, pasado ese tiempo da lo mismo olvidarlo,
+    #? así que se guardan en una TTLCache con ese TTL y la memoria queda acotada a `maxsize` usuarios activos
+    def __init__(self, name: str, rate: float, burst: int, maxsize: int = 100000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(maxsize, burst / rate if rate > 0 else 0)
+
+    def take(self, key: str, cost: float = 1) -> float:
+        #* Consume `cost` tokens, retorna 0 si se admitió o los segundos que faltan para poder hacerlo
+        if self.rate <= 0:
+            #? Con rate 0 el límite está desactivado
+            return 0
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < cost:
+            ADMISSION_REJECTED.labels(self.name).inc()
+            self._buckets.set(key, (tokens, now))
+            return (cost - tokens) / self.rate
+        self._buckets.set(key, (tokens - cost, now))
+        return 0
+
+class ByteBudget:
+    #* Presupuesto de bytes en vuelo (p. ej. imágenes que se están procesando y subiendo), compartido por todo el proceso
+    #? Funciona como un semáforo contado en bytes que no espera: si no alcanza se rechaza con Overloaded
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        if size > self.limit:
+            raise RequestTooLarge("Upload is too large.")
+        if self.in_use + size > self.limit:
+            ADMISSION_REJECTED.labels(self.name).inc()
+            raise Overloaded("Server is busy, try again later.")
+        self.in_use += size
+        try:
+            yield
+        finally:
+            self.in_use -= size
+
+def upload_size(file) -> int:
+    #* Tamaño de un UploadFile sin leerlo: Starlette ya lo guardó en un archivo temporal al recibir la petición
+    if getattr(file, "size", None) is not None:
+        return file.size
+    file.file.seek(0, 2)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+class BodySizeLimitMiddleware:
+    #* Middleware ASGI: rechaza con 413 las peticiones HTTP cuyo cuerpo supera `max_bytes`
+    #? Se revisa el Content-Length declarado y además se cuentan los bytes recibidos, por si el cuerpo llega sin él (chunked)
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.max_bytes:
+            return await self.app(scope, receive, send)
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                return await self._reject(send)
+        received = 0
+        exceeded = False
+        responded = False
+
+        async def receive_wrapper():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise RequestTooLarge("Request body is too large.")
+            return message
+
+        async def send_wrapper(message):
+            nonlocal responded
+            #? FastAPI convierte los errores al leer el formulario en un 400, lo reemplazamos por el 413
+            if exceeded:
+                if message["type"] == "http.response.start" and not responded:
+                    await self._reject(send)
+                    responded = True
+                return
+            if message["type"] == "http.response.start":
+                responded = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except RequestTooLarge:
+            #? Si la aplicación ya respondió, la respuesta fue reemplazada por el 413 y no hay nada más que hacer
+            if exceeded and responded:
+                return
+            if responded:
+                raise
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = b'{"status":"error","message":"Request body is too large."}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({ "type": "http.response.body", "body": body })
@@ -6,43 +6,126 @@
 #*                   https://fly.io/
 #*                   https://www.netlify.com/
 
-from fastapi import APIRouter, Depends, FastAPI, Header, File, UploadFile, Response, status, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, FastAPI, Header, File, UploadFile, Request, Response, status, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from starlette.responses import Response as RawResponse
+from typing import Optional, List, Union
 import socketio
-from db import db
-from auth import check_if_user_exists, register_user_if_not_exist, get_user_by_email, get_user_by_uid, get_user_by_username
-from models import User, _User, Post, Chat, Message
-from firebase_admin import auth
+from db import db, ensure_indexes, close_client, use_database
+from auth import register_user_if_not_exist, get_user_by_uid, get_user_by_username
+from models import User, UserRef, _User, Post, Message, Comment, ErrorResponse, PostPage, FriendsPage, ChatList, MessagePage, UserSearchPage, CommentPage
+from responses import etag_response
 from firebase import init_firebase
-from bson.json_util import dumps
-from util import generate_wavebond, get_wavebond, decrypt_aes, get_user_from_wavebond, upload_image, update_posts_author, get_user_post_likes
-import os
-from pydantic import BaseModel
+from token_verifier import InvalidTokenError, KeySet, TokenVerifier
+from env_handler import env
+from util import rotate_wavebond, get_wavebond, get_wavebond_content, get_user_from_wavebond, get_users_from_wavebonds, get_user_post_likes, toggle_like
+from images import InvalidImageError, UploadError, close_upload_client, image_cache_hit_rate, process_and_upload, process_image, upload_image
+from profiles import PROFILE_PROJECTION, get_profiles, hydrate_authors, invalidate_profile
+from friends import add_friendship, get_friend_uids, get_friends_page, is_chat_member
+from message_writer import MessageWriter
+from realtime import create_client_manager, create_presence
+from inbox import get_inbox_page, mark_read
+from search import search_posts, search_users
+from comments import add_comment, can_view_post, comment_projection, delete_comment, delete_post_comments, get_comments_page
+from timeline import backfill, fan_out_post, get_home_page, on_friendship, remove_post
+from admission import BodySizeLimitMiddleware, ByteBudget, Overloaded, RateLimiter, RequestTooLarge, upload_size
+from metrics import SOCKET_CONNECTIONS, TOKEN_VERIFY_SECONDS, MetricsMiddleware, gauge_from, instrument_event, refresh_gauges_forever, render_metrics
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, cursor_of, decode_cursor, keyset_filter, paginate
+import asyncio
+import json
+from contextlib import asynccontextmanager
+import logging
+import math
+from urllib.parse import quote
+from pydantic import BaseModel, Field
 from pymongo import DESCENDING, ASCENDING
+from pymongo.errors import DuplicateKeyError
 
-# Creamos la aplicación FastAPI e inicializamos Firebase
-app = FastAPI()
-init_firebase()
+logging.basicConfig(level=env.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("wavenet")
+
+#* Las rutas se registran en un router, la aplicación se arma en create_app (al final del archivo)
+router = APIRouter()
+
+def create_token_verifier() -> TokenVerifier:
+    #* Verificador local de los ID tokens de Firebase, con las llaves de firma precargadas y una caché de tokens ya verificados
+    #? Solo se inicializa Firebase (con el certificado de /etc/secrets) para obtener el project_id si no viene en FIREBASE_PROJECT_ID
+    project_id = env.FIREBASE_PROJECT_ID or init_firebase().project_id
+    return TokenVerifier(
+        project_id=project_id,
+        keys=KeySet(),
+        cache_size=env.TOKEN_CACHE_SIZE,
+        cache_ttl=env.TOKEN_CACHE_TTL,
+    )
+
+#? Se asigna en create_app
+token_verifier = None
+
+#* Los mensajes del chat se persisten por lotes en segundo plano
+message_writer = MessageWriter(
+    flush_interval=env.MESSAGE_FLUSH_INTERVAL_MS / 1000,
+    batch_size=env.MESSAGE_BATCH_SIZE,
+)
+
+#* Control de admisión: límites de frecuencia por usuario y bytes de imágenes en proceso de subida
+post_limiter = RateLimiter("posts", env.POST_RATE, env.POST_BURST, env.RATE_LIMIT_KEYS)
+like_limiter = RateLimiter("likes", env.LIKE_RATE, env.LIKE_BURST, env.RATE_LIMIT_KEYS)
+message_limiter = RateLimiter("socket_messages", env.SOCKET_MESSAGE_RATE, env.SOCKET_MESSAGE_BURST, env.RATE_LIMIT_KEYS)
+upload_budget = ByteBudget("upload_bytes", env.UPLOAD_INFLIGHT_BYTES)
 
 # Integrar Socket.IO con FastAPI
+#* Con SOCKETIO_MESSAGE_QUEUE definido los emits se reparten entre todos los procesos, sin él se trabaja con un solo proceso
 sio = socketio.AsyncServer(
     async_mode="asgi",
     cors_allowed_origins="*",
+    client_manager=create_client_manager(env.SOCKETIO_MESSAGE_QUEUE),
+    #? Tamaño máximo de un paquete (incluye los archivos adjuntos de send_message), los más grandes cierran la conexión
+    max_http_buffer_size=env.SOCKET_MAX_PAYLOAD_BYTES,
 )
-# sio.attach(app)
-# Montamos la aplicación FastAPI en el servidor de Socket.IO
-app.mount("/socket.io", socketio.ASGIApp(sio))
-
-# Configurar CORS para aceptar cualquier origen (por ahora, en desarrollo)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+#* Membresía de los rooms (en memoria o compartida en Redis)
+#? Con SOCKETIO_MESSAGE_QUEUE debe ser Redis (PRESENCE_URL, o la misma cola si es redis://), si no la app no arranca
+presence = create_presence(env.PRESENCE_URL, env.SOCKETIO_MESSAGE_QUEUE)
+
+#* Gauges que se calculan a partir del estado del proceso (ver metrics.gauge_from)
+gauge_from("message_writer_queue_depth", "Chat messages waiting to be persisted", lambda: message_writer.depth)
+#? Una proporción no se puede sumar entre workers, se expone una serie por proceso
+gauge_from("image_cache_hit_ratio", "Share of image uploads served from the content-hash cache", image_cache_hit_rate, multiprocess_mode="liveall")
+gauge_from("upload_inflight_bytes", "Bytes of images being processed or uploaded", lambda: upload_budget.in_use)
+gauge_from("token_cache_size", "Verified Firebase tokens cached in this process", lambda: token_verifier.stats()["size"])
+if hasattr(presence, "room_count"):
+    gauge_from("socketio_rooms", "Chat rooms with at least one connected user", presence.room_count)
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return RawResponse(body, media_type=content_type)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #* Arranque y apagado de la aplicación
+    #? El apagado corre aunque el arranque falle a medias, así el pool de conexiones de Motor siempre se cierra
+    gauges = None
+    try:
+        if app.state.create_indexes:
+            #* Creamos los índices que necesitan las consultas de la aplicación
+            await ensure_indexes()
+        await token_verifier.keys.start()
+        message_writer.start()
+        gauges = asyncio.create_task(refresh_gauges_forever(env.METRICS_REFRESH_SECONDS))
+        yield
+    finally:
+        try:
+            if gauges:
+                gauges.cancel()
+            await token_verifier.keys.stop()
+            #? Vaciamos la cola de mensajes antes de cerrar la conexión con la base de datos
+            await message_writer.stop()
+            await close_upload_client()
+            await presence.close()
+        finally:
+            close_client()
 
 #* Middleware
 async def get_current_user(response: Response, authorization: Optional[str] = Header(None)):
@@ -54,339 +137,715 @@ async def get_current_user(response: Response, authorization: Optional[str] = He
     #? Extraemos el token de la cabecera
     token = authorization.split("Bearer ")[1]
     try:
-        #? Verificamos el token con Firebase y además, lo decodificamos para obtener el userid (correo)
-        decoded_token = auth.verify_id_token(token, clock_skew_seconds=60)
+        #? Verificamos el token localmente con las llaves de Firebase y además, lo decodificamos para obtener el userid
+        with TOKEN_VERIFY_SECONDS.time():
+            decoded_token = token_verifier.verify(token)
         uid = decoded_token["uid"]
         return uid
-    except Exception as e:
+    except InvalidTokenError:
         response.status_code = status.HTTP_401_UNAUTHORIZED
         return { "status": "error", "message": "BEARER Token not found" }
 
 #* Rutas normales
-@app.post("/auth/register")
+#* Respuestas del control de admisión
+def too_many_requests(response: Response, retry_after: float):
+    response.status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    response.headers["Retry-After"] = str(math.ceil(retry_after))
+    return { "status": "error", "message": "Too many requests, try again later." }
+
+def rejected_upload(response: Response, error: Exception):
+    #? Un archivo demasiado grande es culpa del cliente (413), quedarse sin presupuesto es una sobrecarga temporal (503)
+    response.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE if isinstance(error, RequestTooLarge) else status.HTTP_503_SERVICE_UNAVAILABLE
+    return { "status": "error", "message": str(error) }
+
+def check_upload_sizes(files: list) -> int:
+    #* Valida la cantidad y el tamaño de los archivos sin leerlos, retorna el total de bytes a reservar
+    if len(files) > env.UPLOAD_MAX_FILES:
+        raise RequestTooLarge(f"Too many files, the limit is {env.UPLOAD_MAX_FILES}.")
+    sizes = [upload_size(file) for file in files]
+    if any(size > env.UPLOAD_MAX_FILE_BYTES for size in sizes):
+        raise RequestTooLarge(f"Files can't be larger than {env.UPLOAD_MAX_FILE_BYTES // (1024 * 1024)} MB.")
+    return sum(sizes)
+
+@router.post("/auth/register")
 async def register(user: _User):
-    registered = register_user_if_not_exist(user)
+    registered = await register_user_if_not_exist(user)
     return { "status": "error" if not registered else "success" }
 
-@app.get("/auth/user")
+@router.get("/auth/user")
 async def user(response: Response, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "User not found." }
     return { "user": user }
 
-@app.patch("/auth/user")
+@router.patch("/auth/user")
 async def user(response: Response, username: str = Form(...), public_profile: bool = Form(...), file: Optional[UploadFile] = File(None), uid: str = Depends(get_current_user)):
-    userToUpdate = get_user_by_uid(uid)
+    userToUpdate = await get_user_by_uid(uid)
     if not userToUpdate:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "User not found." }
-    usernameExists = get_user_by_username(username)
+    usernameExists = await get_user_by_username(username)
     if usernameExists and usernameExists.uid != userToUpdate.uid:
         response.status_code = status.HTTP_400_BAD_REQUEST
         return { "status": "error", "message": "Username already exists." }
     #? Si es que NO se recibió un archivo, se mantiene la imagen de perfil actual
     newPfp = userToUpdate.profile_picture if not file else "/no_pfp.webp"
     if file:
-        #* Obtenemos los Bytes del archivo y lo subimos a la API de ImgBB con nuestra función auxiliar.
-        file_content = await file.read()
-        url = upload_image(file_content)
-        newPfp = url
-    #? Actualizamos los datos del usuario
+        #* Procesamos la imagen (WebP, sin metadatos, tamaño máximo) y la subimos a la API de ImgBB con nuestra función auxiliar.
+        try:
+            async with upload_budget.reserve(check_upload_sizes([file])):
+                full, _ = await process_image(await file.read())
+                newPfp = await upload_image(full)
+        except (RequestTooLarge, Overloaded) as e:
+            return rejected_upload(response, e)
+        except InvalidImageError as e:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return { "status": "error", "message": str(e) }
+        except UploadError as e:
+            response.status_code = status.HTTP_502_BAD_GATEWAY
+            return { "status": "error", "message": str(e) }
+    #? Actualizamos los datos del usuario (solo los campos del perfil, la lista de amigos no se reescribe)
+    visibilityChanged = userToUpdate.public_profile != public_profile
     userToUpdate.username = username
     userToUpdate.profile_picture = newPfp
     userToUpdate.public_profile = public_profile
-    db.users.update_one({ "uid": userToUpdate.uid }, { "$set": userToUpdate.dict() })
-    #* Actualizamos los Posts que pertenecen al usuario para que reflejen los cambios.
-    #! Actualmente hay una mala práctica, y es que guardamos la instancia de Usuario en cada Post, lo cual puede crear documentos MUY grandes. Esto será cambiado luego.
-    update_posts_author(userToUpdate)
+    try:
+        await db.users.update_one({ "uid": userToUpdate.uid }, { "$set": { "username": username, "username_lower": username.lower(), "profile_picture": newPfp, "public_profile": public_profile } })
+    except DuplicateKeyError:
+        #? El índice único de username también cubre el caso de dos cambios simultáneos al mismo nombre
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Username already exists." }
+    #* Los Posts solo guardan el uid del autor, por lo que basta con invalidar su perfil en caché.
+    invalidate_profile(userToUpdate.uid)
+    #? La única copia del perfil en los Posts es la visibilidad, y solo se reescribe cuando cambia
+    if visibilityChanged:
+        await db.posts.update_many({ "user": userToUpdate.uid }, { "$set": { "public": public_profile } })
+        #* Los posts públicos no estaban en los timelines, al volverse privados hay que repartirlos a los amigos
+        if not public_profile:
+            await backfill(userToUpdate.uid, await get_friend_uids(userToUpdate.uid))
     return { "status": "success", "user": userToUpdate }
 
-@app.get("/likes/user")
+@router.get("/likes/user")
 async def user(response: Response, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "User not found." }
     #* Usamos la función auxiliar para obtener los Likes de los Posts de un Usuario
-    likes = get_user_post_likes(user)
+    likes = await get_user_post_likes(user)
     return { "likes": likes }
 
-@app.get("/friends/")
-async def user(response: Response, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+@router.get("/friends/", response_model=Union[FriendsPage, ErrorResponse])
+async def user(response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "User not found." }
-    #* Buscamos los Usuarios que son amigos del Usuario actual
-    friends = list(db.users.find({ "uid": { "$in": user.friends } }, { "_id": 0 }))
-    return { "friends": dumps(friends) }
+    position = decode_cursor(cursor) if cursor else None
+    if cursor and not position:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Invalid cursor." }
+    #* Buscamos los Usuarios que son amigos del Usuario actual, una página a la vez desde el índice de amistades
+    friend_uids, next_cursor = await get_friends_page(user.uid, limit, position)
+    found = { friend["uid"]: friend async for friend in db.users.find({ "uid": { "$in": friend_uids } }, PROFILE_PROJECTION) }
+    friends = [found[friend_uid] for friend_uid in friend_uids if friend_uid in found]
+    return { "friends": friends, "next_cursor": next_cursor }
 
 #* Mensajes
-@app.get("/chats/")
-async def chat_with_user(response: Response, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+@router.get("/chats/", response_model=Union[ChatList, ErrorResponse])
+async def chat_with_user(request: Request, response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
-    #* Obtenemos los Chats en los cuales esté el usuario actual
-    chat = db.chat.find(
-        { "users.uid": user.uid },
-        { "_id": 0 } 
-    )
-    if not chat:
-        chat = []
-    return { "status": "success", "result": dumps(chat) }
+    position = decode_cursor(cursor) if cursor else None
+    if cursor and not position:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Invalid cursor." }
+    #* Obtenemos los Chats del usuario actual desde su bandeja, con el más reciente primero
+    chats, next_cursor = await get_inbox_page(user.uid, limit, position)
+    for chat in chats:
+        chat["id"] = chat.pop("chat")
+    await hydrate_authors(chats, "peer")
+    #* Con ETag, si la lista no cambió el cliente recibe un 304 sin cuerpo
+    return etag_response(request, ChatList(result=chats, next_cursor=next_cursor))
 
-@app.get("/messages/{chat_id}")
-async def user(response: Response, chat_id: str, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+@router.post("/chats/{chat_id}/read")
+async def read_chat(response: Response, chat_id: str, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
-    chat_to_search = db.chat.find_one({ "id": chat_id }, { "_id": 0 })
-    if not chat_to_search:
+    if not await is_chat_member(chat_id, user.uid):
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Chat not found." }
+    await mark_read(chat_id, user.uid)
+    return { "status": "success" }
+
+MESSAGE_PROJECTION = { "_id": 0, "id": 1, "fecha": 1, "content": 1, "files": 1, "chat": 1, "user": 1 }
+
+@router.get("/messages/{chat_id}", response_model=Union[MessagePage, ErrorResponse])
+async def user(response: Response, chat_id: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), before: Optional[str] = None, since: Optional[str] = None, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    if before and since:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Use either before or since, not both." }
+    position = decode_cursor(before or since) if before or since else None
+    if (before or since) and not position:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Invalid cursor." }
+    #? Solo los participantes pueden leer el chat, para el resto es como si no existiera
+    if not await is_chat_member(chat_id, user.uid):
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Chat not found." }
-    #* Retornamos los mensajes del Chat ordenados por fecha de forma ascendente
-    messages = list(db.messages.find({ "chat": chat_id }, { "_id": 0 }).sort("fecha", ASCENDING))
-    # messages = list(db.messages.find({ "users": { "$all": [user.uid, userToSearch.uid] } }).sort("fecha", DESCENDING))
-    return { "status": "success", "result": dumps(messages) }
+    query = { "chat": chat_id }
+    if since:
+        #* Modo "since": los mensajes posteriores al cursor en orden ascendente, para que un cliente que se reconecta recupere solo lo que se perdió
+        query.update(keyset_filter(position, descending=False))
+        messages = await db.messages.find(query, MESSAGE_PROJECTION).sort([("fecha", ASCENDING), ("id", ASCENDING)]).limit(limit + 1).to_list(length=None)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        #? Si no hay mensajes nuevos el cliente sigue usando el mismo cursor
+        next_cursor = cursor_of(messages[-1]) if messages else since
+        prev_cursor = None
+    else:
+        #* Por defecto retornamos los últimos N mensajes, y con "before" la página anterior a ese cursor
+        if before:
+            query.update(keyset_filter(position))
+        messages = await db.messages.find(query, MESSAGE_PROJECTION).sort([("fecha", DESCENDING), ("id", DESCENDING)]).limit(limit + 1).to_list(length=None)
+        has_more = len(messages) > limit
+        messages, prev_cursor = paginate(messages, limit)
+        #* Retornamos los mensajes del Chat ordenados por fecha de forma ascendente
+        messages.reverse()
+        next_cursor = cursor_of(messages[-1]) if messages else None
+    #* Agregamos el perfil de los autores con una sola consulta por página
+    await hydrate_authors(messages)
+    return { "status": "success", "result": messages, "prev_cursor": prev_cursor, "next_cursor": next_cursor, "has_more": has_more }
 
 #* Posts
-@app.get("/posts/")
-async def user(response: Response, user: str, uid: str = Depends(get_current_user)):
-    selfUser = get_user_by_uid(uid)
+def post_projection(uid: str) -> dict:
+    #* Solo los campos que muestra el feed, y de la lista de likes únicamente si el usuario actual está en ella
+    return {
+        "_id": 0, "id": 1, "fecha": 1, "title": 1, "content": 1, "files": 1, "user": 1, "like_count": 1, "comment_count": 1, "pinned": 1,
+        "likes": { "$elemMatch": { "$eq": uid } }
+    }
+
+async def prepare_posts(posts: list) -> list:
+    for post in posts:
+        post["liked"] = bool(post.pop("likes", None))
+    return await hydrate_authors(posts)
+
+@router.get("/posts/", response_model=Union[PostPage, ErrorResponse])
+async def user(request: Request, response: Response, user: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, uid: str = Depends(get_current_user)):
+    selfUser = await get_user_by_uid(uid)
     if not selfUser:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
-    #* Acá corroboramos si es que se solicitó los posts públicos y/o los de amigos y los retornamos en orden descendente
+    #* Paginación por cursor sobre (fecha, id), así el costo de cada página no depende de qué tan profundo se haya llegado
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if not position:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return { "status": "error", "message": "Invalid cursor." }
+    #* Acá corroboramos si es que se solicitó los posts públicos y/o los de amigos, se leen desde el timeline precalculado
     if user == "public-friends":
-        posts = list(db.posts.find({
-                    "$or": [
-                        { "user.uid": { "$in": selfUser.friends } },
-                        { "user.public_profile": True }
-                    ]
-                }).sort("fecha", DESCENDING))
-    else:
-        #* En caso de que no, se buscan los posts del usuario solicitado y se retornan en orden descendente
-        userToSearch = get_user_by_uid(user)
-        if not userToSearch:
-            response.status_code = status.HTTP_404_NOT_FOUND
-            return { "status": "error", "message": "User not found." }
-        posts = list(db.posts.find({"user.uid": userToSearch.uid}).sort("fecha", DESCENDING))
-    return { "result": dumps(posts) }
+        posts, next_cursor = await get_home_page(selfUser.uid, limit, position, post_projection(selfUser.uid))
+        await prepare_posts(posts)
+        return etag_response(request, PostPage(result=posts, next_cursor=next_cursor))
+    #* En caso de que no, se buscan los posts del usuario solicitado y se retornan en orden descendente
+    userToSearch = await get_user_by_uid(user)
+    if not userToSearch:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "User not found." }
+    query = { "user": userToSearch.uid }
+    if position:
+        query = { "$and": [query, keyset_filter(position)] }
+    posts = await (
+        db.posts.find(query, post_projection(selfUser.uid))
+            .sort([("fecha", DESCENDING), ("id", DESCENDING)])
+            .limit(limit + 1)
+            .to_list(length=None)
+    )
+    posts, next_cursor = paginate(posts, limit)
+    await prepare_posts(posts)
+    return etag_response(request, PostPage(result=posts, next_cursor=next_cursor))
 
-@app.delete("/post/{post_id}")
+@router.delete("/post/{post_id}")
 async def delete_post(response: Response, post_id: str, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
-    postToDelete = db.posts.find_one({ "id": post_id })
+    postToDelete = await db.posts.find_one({ "id": post_id })
     if not postToDelete:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Post not found." }
-    if postToDelete["user"]["uid"] != user.uid:
+    if postToDelete["user"] != user.uid:
         response.status_code = status.HTTP_401_UNAUTHORIZED
         return { "status": "error", "message": "You can't delete a post that doesn't belong to you." }
-    db.posts.delete_one({ "id": post_id })
+    await db.posts.delete_one({ "id": post_id })
+    await remove_post(post_id)
+    await delete_post_comments(post_id)
     return { "status": "success", "message": "Post deleted." }
 
-@app.post("/create-post/")
+@router.post("/create-post/")
 async def create_post(response: Response, title: str = Form(...), content: str = Form(...), files: Optional[List[UploadFile]] = File(None), uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
-    #* Iteramos los archivos recibidos y los subimos a la API de ImgBB, luego los adjuntamos al Post a modo de URLs.
+    retry_after = post_limiter.take(user.uid)
+    if retry_after:
+        return too_many_requests(response, retry_after)
+    #* Procesamos los archivos recibidos y los subimos a la API de ImgBB en paralelo, luego los adjuntamos al Post (imagen y miniatura).
+    #? Antes de leerlos reservamos sus bytes, si ya hay demasiadas subidas en curso se rechaza en vez de esperar
     files_urls = []
     if files:
-        for file in files:
-            file_content = await file.read()
-            url = upload_image(file_content)
-            files_urls.append(url)
-    newPost = Post(title=title, content=content, files=files_urls, user=user)
-    createdPost = db.posts.insert_one(newPost.model_dump())
+        try:
+            async with upload_budget.reserve(check_upload_sizes(files)):
+                files_urls = await asyncio.gather(*(process_and_upload(file) for file in files))
+        except (RequestTooLarge, Overloaded) as e:
+            return rejected_upload(response, e)
+        except InvalidImageError as e:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return { "status": "error", "message": str(e) }
+        except UploadError as e:
+            response.status_code = status.HTTP_502_BAD_GATEWAY
+            return { "status": "error", "message": str(e) }
+    newPost = Post(title=title, content=content, files=files_urls, user=user.uid, public=user.public_profile)
+    createdPost = await db.posts.insert_one(newPost.model_dump())
     if not createdPost:
         response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
         return { "status": "error", "message": "Error creating the post." }
-    return { "status": "success", "post": newPost }
+    await fan_out_post(newPost.model_dump())
+    return { "status": "success", "post": { **newPost.model_dump(), "user": UserRef(**user.model_dump()) } }
+
+#* Búsqueda
+@router.get("/search/", response_model=Union[PostPage, UserSearchPage, ErrorResponse])
+async def search(response: Response, q: str = Query(..., min_length=1, max_length=100), type: str = "posts", limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    if type not in ("posts", "users"):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Invalid search type." }
+    #? Un texto de puros espacios quedaría vacío y el prefijo vacío coincide con todos los usuarios
+    text = q.strip()
+    if not text:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Search query can't be empty." }
+    #* Solo se buscan perfiles públicos, amigos y uno mismo, igual que en el feed
+    friends = await get_friend_uids(user.uid)
+    try:
+        if type == "users":
+            users, next_cursor = await search_users(user.uid, friends, text, limit, cursor)
+            return { "result": users, "next_cursor": next_cursor }
+        posts, next_cursor = await search_posts(user.uid, friends, text, limit, cursor, post_projection(user.uid))
+    except ValueError as e:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": str(e) }
+    await prepare_posts(posts)
+    return { "result": posts, "next_cursor": next_cursor }
 
 #* Cuerpo de Like (body de petición)
 class LikeBody(BaseModel):
-    type: str #* A futuro, para saber si Likeo un Post, un Comentario o una Respuesta.
+    type: str #* Para saber si Likeo un Post o un Comentario (las respuestas también son comentarios).
     id: str
 
-@app.post("/like/")
+#* Colecciones a las que se les puede dar like, según el type recibido
+LIKEABLE_COLLECTIONS = { "posts": "posts", "comments": "comments" }
+
+@router.post("/like/")
 async def like(response: Response, body: LikeBody, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
-    obj = db[body.type].find_one({ "id": body.id }, { "_id": 0 })
-    if not obj:
+    collection = LIKEABLE_COLLECTIONS.get(body.type)
+    if not collection:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return { "status": "error", "message": "Invalid like type." }
+    retry_after = like_limiter.take(user.uid)
+    if retry_after:
+        return too_many_requests(response, retry_after)
+    #* El like se da o se quita en la base de datos, solo retornamos el nuevo estado y el contador
+    result = await toggle_like(db[collection], body.id, user.uid)
+    if not result:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Post not found." if collection == "posts" else "Comment not found." }
+    liked, like_count = result
+    return { "status": "success", "action": "like" if liked else "dislike", "liked": liked, "like_count": like_count }
+
+#* Comentarios
+class CommentBody(BaseModel):
+    content: str = Field(..., min_length=1, max_length=2000)
+    parent: Optional[str] = None #* ID del comentario al que se responde
+
+async def prepare_comments(comments: list) -> list:
+    for comment in comments:
+        comment["liked"] = bool(comment.pop("likes", None))
+    return await hydrate_authors(comments)
+
+async def find_visible_post(post_id: str, uid: str):
+    post = await db.posts.find_one({ "id": post_id }, { "_id": 0, "id": 1, "user": 1, "public": 1 })
+    if not post or not await can_view_post(post, uid):
+        return None
+    return post
+
+async def comments_page(response: Response, post_id: str, parent, uid: str, limit: int, cursor: Optional[str]):
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if not position:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return { "status": "error", "message": "Invalid cursor." }
+    if not await find_visible_post(post_id, uid):
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Post not found." }
-    if user.uid in obj["likes"]:
-        obj["likes"].remove(user.uid)
-        like = False
-    else:
-        obj["likes"].append(user.uid)
-        like = True
-    db[body.type].update_one({ "id": obj["id"] }, { "$set": { "likes": obj["likes"] } })
-    return { "status": "success", "action": "like" if like else "dislike", "object": obj }
+    comments, next_cursor = await get_comments_page(post_id, parent, limit, position, comment_projection(uid))
+    await prepare_comments(comments)
+    return { "status": "success", "result": comments, "next_cursor": next_cursor }
+
+@router.get("/posts/{post_id}/comments", response_model=Union[CommentPage, ErrorResponse])
+async def get_comments(response: Response, post_id: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    #* Comentarios del post, paginados por cursor. Las respuestas se piden aparte, cada comentario trae su reply_count
+    return await comments_page(response, post_id, None, user.uid, limit, cursor)
+
+@router.get("/comments/{comment_id}/replies", response_model=Union[CommentPage, ErrorResponse])
+async def get_replies(response: Response, comment_id: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    comment = await db.comments.find_one({ "id": comment_id }, { "_id": 0, "post": 1 })
+    if not comment:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Comment not found." }
+    return await comments_page(response, comment["post"], comment_id, user.uid, limit, cursor)
+
+@router.post("/posts/{post_id}/comments", status_code=201)
+async def create_comment(response: Response, post_id: str, body: CommentBody, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    if not await find_visible_post(post_id, user.uid):
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Post not found." }
+    parent = None
+    if body.parent:
+        parentComment = await db.comments.find_one({ "id": body.parent, "post": post_id }, { "_id": 0, "id": 1, "parent": 1 })
+        if not parentComment:
+            response.status_code = status.HTTP_404_NOT_FOUND
+            return { "status": "error", "message": "Comment not found." }
+        #? Las respuestas a una respuesta quedan en el mismo hilo, bajo el comentario original
+        parent = parentComment["parent"] or parentComment["id"]
+    newComment = Comment(post=post_id, parent=parent, content=body.content, user=user.uid)
+    if not await add_comment(newComment.model_dump()):
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Comment not found." }
+    comment = newComment.model_dump(exclude={ "likes" })
+    return { "status": "success", "comment": { **comment, "liked": False, "user": UserRef(**user.model_dump()) } }
+
+@router.delete("/comment/{comment_id}")
+async def remove_comment(response: Response, comment_id: str, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    commentToDelete = await db.comments.find_one({ "id": comment_id }, { "_id": 0, "id": 1, "post": 1, "parent": 1, "user": 1 })
+    if not commentToDelete:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Comment not found." }
+    #* Puede eliminarlo su autor o el autor del post
+    if commentToDelete["user"] != user.uid:
+        post = await db.posts.find_one({ "id": commentToDelete["post"] }, { "_id": 0, "user": 1 })
+        if not post or post["user"] != user.uid:
+            response.status_code = status.HTTP_401_UNAUTHORIZED
+            return { "status": "error", "message": "You can't delete a comment that doesn't belong to you." }
+    deleted = await delete_comment(commentToDelete)
+    return { "status": "success", "message": "Comment deleted.", "deleted": deleted }
 
 #* Wavebond
-@app.get("/wavebond/")
+def wavebond_response(user: User, content: bytes) -> Response:
+    #* El wavebond se envía directo desde memoria a modo de archivo, sin escribirlo en disco
+    filename = f"{user.username}.wavebond"
+    quoted = quote(filename)
+    disposition = f'attachment; filename="{filename}"' if quoted == filename else f"attachment; filename*=utf-8''{quoted}"
+    return Response(content=content, media_type="application/octet-stream", headers={ "Content-Disposition": disposition })
+
+@router.get("/wavebond/")
 async def wavebond(response: Response, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
-    #* Obtenemos el Wavebond del usuario actual, en caso de que no exista, lo generamos desde cero.
-    actual_wavebond = get_wavebond(user)
-    generateFromZero = False
-    if not actual_wavebond:
-        generateFromZero = True
-    #* Generamos el Wavebond, lo almacenamos y lo retornamos a modo de archivo.
-    file_path = generate_wavebond(user, actual_wavebond, generateFromZero)
-    if not os.path.exists(file_path):
-        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-        return { "status": "error", "message": "Error generating a wavebond." }
+    #* Obtenemos el Wavebond actual del usuario, en caso de que no exista, lo generamos desde cero.
+    current = await get_wavebond_content(user)
+    if current:
+        _, content = current
+    else:
+        content = (await rotate_wavebond(user)).wave
+    return wavebond_response(user, content)
 
-    return FileResponse(
-        path=file_path,
-        filename=f"{user.username}.wavebond",
-        media_type="application/octet-stream"
-    )
+@router.post("/wavebond/rotate")
+async def rotate(response: Response, uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    #* Generamos una nueva versión del Wavebond, las anteriores quedan obsoletas
+    wavebond = await rotate_wavebond(user, await get_wavebond(user))
+    return wavebond_response(user, wavebond.wave)
 
-@app.post("/wavebond/", status_code=201)
+async def bond_with(user: User, wavebondUser: User):
+    #* Agrega a ambos usuarios como amigos y crea un chat entre ellos, retorna un mensaje de error si no se puede
+    if not wavebondUser:
+        return "That wavebond is outdated or doesn't belong to anybody."
+    if wavebondUser.uid == user.uid:
+        return "Sadly, you can't share a wavebond with yourself."
+    #? add_friendship es idempotente, si la amistad ya existía (incluso creada por un canje simultáneo) no escribe nada
+    if not await add_friendship(user.uid, wavebondUser.uid):
+        return "You already share a wavebond with that user."
+    #* Cada uno recibe en su timeline los posts recientes del otro
+    await on_friendship(user.uid, wavebondUser.uid)
+    #* Reflejamos la amistad en los objetos que se retornan
+    if user.uid not in wavebondUser.friends:
+        wavebondUser.friends.append(user.uid)
+    if wavebondUser.uid not in user.friends:
+        user.friends.append(wavebondUser.uid)
+    return None
+
+@router.post("/wavebond/", status_code=201)
 async def insert_wavebond(response: Response, file: UploadFile, uid: str = Depends(get_current_user)):
-    user = get_user_by_uid(uid)
+    user = await get_user_by_uid(uid)
     if not user:
         response.status_code = status.HTTP_404_NOT_FOUND
         return { "status": "error", "message": "Invalid session." }
     #* Leemos el contenido del wavebond y obtenemos el usuario al que pertenece con nuestra función auxiliar.
     wavebond_content = await file.read()
-    wavebondUser = get_user_from_wavebond(wavebond_content)
-    if not wavebondUser:
+    wavebondUser = await get_user_from_wavebond(wavebond_content)
+    error = await bond_with(user, wavebondUser)
+    if error:
         response.status_code = status.HTTP_400_BAD_REQUEST
-        return { "status": "error", "message": "That wavebond is outdated or doesn't belong to anybody." }
-    if wavebondUser.uid == user.uid:
-        response.status_code = status.HTTP_400_BAD_REQUEST
-        return { "status": "error", "message": "Sadly, you can't share a wavebond with yourself." }
-    if user.uid in wavebondUser.friends:
-        response.status_code = status.HTTP_400_BAD_REQUEST
-        return { "status": "error", "message": "You already share a wavebond with that user." }
-    #* Agregamos a ambos usuarios como amigos y creamos un chat entre ellos.
-    wavebondUser.friends.append(user.uid)
-    user.friends.append(wavebondUser.uid)
-    db.users.update_one({ "uid": user.uid }, { "$set": { "friends": user.friends } })
-    db.users.update_one({ "uid": wavebondUser.uid }, { "$set": { "friends": wavebondUser.friends } })
-    chat = Chat(users=[user, wavebondUser])
-    db.chat.insert_one(chat.model_dump())
+        return { "status": "error", "message": error }
     return { "status": "success", "wavebond_user": wavebondUser, "updated_user": user }
 
-#* WebSockets Socket.IO
-# Diccionario para rastrear usuarios y sus rooms
-connected_users = {}
-room_users = {}
+@router.post("/wavebond/bulk", status_code=201)
+async def insert_wavebonds(response: Response, files: List[UploadFile], uid: str = Depends(get_current_user)):
+    user = await get_user_by_uid(uid)
+    if not user:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return { "status": "error", "message": "Invalid session." }
+    #* Canjeamos varios wavebonds a la vez, los dueños de todos se resuelven con las mismas consultas
+    contents = [await file.read() for file in files]
+    wavebondUsers = await get_users_from_wavebonds(contents)
+    results = []
+    for file, wavebondUser in zip(files, wavebondUsers):
+        error = await bond_with(user, wavebondUser)
+        if error:
+            results.append({ "file": file.filename, "status": "error", "message": error })
+        else:
+            results.append({ "file": file.filename, "status": "success", "wavebond_user": wavebondUser })
+    return { "status": "success", "results": results, "updated_user": user }
 
-# Eventos de conexión y desconexión
+#* WebSockets Socket.IO
+#? La membresía de los rooms vive en `presence`, así cualquier proceso puede consultarla
 @sio.event
-async def connect(sid, environ):
-    #* Agregamos al usuario a la lista de conectados junto con su información
-    connected_users[sid] = {"room": None, "uid": None, "email": None, "username": None}
+@instrument_event
+async def connect(sid, environ, auth):
+    #* La autenticación se hace una sola vez al conectarse: el cliente envía su ID token de Firebase en `auth`
+    token = (auth or {}).get("token")
+    if not token:
+        raise socketio.exceptions.ConnectionRefusedError("Authentication required")
+    try:
+        with TOKEN_VERIFY_SECONDS.time():
+            uid = token_verifier.verify(token)["uid"]
+    except InvalidTokenError:
+        raise socketio.exceptions.ConnectionRefusedError("Invalid token")
+    user = await get_user_by_uid(uid)
+    if not user:
+        raise socketio.exceptions.ConnectionRefusedError("User not found")
+    #* Guardamos el perfil en la sesión, así los eventos siguientes no vuelven a consultar al usuario
+    #? Si el usuario edita su perfil, el cambio se refleja en sus mensajes desde la siguiente conexión
+    await sio.save_session(sid, { "user": UserRef(**user.model_dump()).model_dump() })
+    SOCKET_CONNECTIONS.inc()
     await sio.emit("message", {"info": f"Usuario conectado: {sid}"}, to=sid)
 
+async def emit_presence(room: str, uid: str, online: bool):
+    #* Avisamos al room solo cuando el usuario entra con su primer sid o sale con el último
+    await sio.emit("presence", {"room": room, "uid": uid, "online": online}, to=room)
+
 @sio.event
+@instrument_event
 async def disconnect(sid):
-    #* Eliminamos al usuario de la lista de conectados y de su room
-    if sid in connected_users:
-        room = connected_users[sid]["room"]
-        if room:
-            sio.leave_room(sid, room)
-            room_users[room].remove(sid)
-            await sio.emit("message", {"info": f"{sid} salió del room {room}"}, to=room)
-            if not room_users[room]:
-                del room_users[room]
-        del connected_users[sid]
+    #* Sacamos al usuario de todos sus rooms (el servidor ya lo saca de los rooms de Socket.IO)
+    SOCKET_CONNECTIONS.dec()
+    uid, rooms = await presence.disconnect(sid)
+    for room in rooms:
+        await emit_presence(room, uid, False)
 
 # Evento para unirse a un room
 @sio.event
+@instrument_event
 async def join_room(sid, data):
     room = data.get("room")
-    uid = data.get("uid")
-
-    if not room or not uid:
-        await sio.emit("error", {"error": "Room, UID no especificado"}, to=sid)
-        return
-    
-    if uid in connected_users.values():
-        # await sio.emit("error", {"error": "Usuario ya conectado"}, to=sid)
-        return
-
-    user = get_user_by_uid(uid)
-    if not user:
-        await sio.emit("error", {"error": "Usuario no encontrado"}, to=sid)
+    if not room:
+        await sio.emit("error", {"error": "Room no especificado"}, to=sid)
         return
 
-    if sid not in connected_users:
-        await sio.emit("error", {"error": f"SID {sid} no encontrado en connected_users"}, to=sid)
+    #* El usuario sale de la sesión autenticada, nunca del payload
+    uid = (await sio.get_session(sid))["user"]["uid"]
+    if not await is_chat_member(room, uid):
+        await sio.emit("error", {"error": "No perteneces a este chat"}, to=sid)
         return
 
     try:
         #* Lo ingresamos al room.
-        sio.enter_room(sid, room)
-        connected_users[sid].update({"room": room, "user": user, "email": user.email})
-        room_users[room] = room_users.get(room, []) + [sid]
-        # await sio.emit("message", {"info": f"{user.username} se unió al room {room}"}, to=room)
+        await sio.enter_room(sid, room)
+        joined = await presence.join(sid, room, uid)
     except Exception as e:
-        print(f"Error al intentar unirse al room: {e}")
+        logger.exception("Error joining room %s", room)
         await sio.emit("error", {"error": f"Error al unirse al room: {str(e)}"}, to=sid)
         return
+    if joined:
+        await emit_presence(room, uid, True)
+    #* Abrir el chat lo marca como leído
+    await mark_read(room, uid)
+    #* Le enviamos al usuario quiénes están conectados en el room
+    members = await presence.members(room)
+    profiles = await get_profiles(members)
+    await sio.emit("room_users", {"room": room, "users": [profiles[uid] for uid in members if uid in profiles]}, to=sid)
 
 # Evento para salir de un room
 @sio.event
+@instrument_event
 async def leave_room(sid, data):
     room = data.get("room")
     if not room:
         await sio.emit("error", {"error": "Room no especificado"}, to=sid)
         return
-    if room not in room_users:
-        await sio.emit("room_users", {"room": room, "users": []}, to=sid)
-        return
     #* Sacamos al usuario del room
-    users_in_room = [
-        {
-            "uid": connected_users[user]["uid"],
-            "email": connected_users[user]["email"],
-            "username": connected_users[user]["username"],
-        }
-        for user in room_users[room]
-    ]
-    await sio.emit("room_users", {"room": room, "users": users_in_room}, to=sid)
+    await sio.leave_room(sid, room)
+    uid = await presence.uid_of(sid)
+    if await presence.leave(sid, room):
+        await emit_presence(room, uid, False)
+    #? Los mensajes que llegaron mientras el chat estaba abierto ya se leyeron
+    if uid:
+        await mark_read(room, uid)
+
+# Evento de "escribiendo...", se reenvía al resto del room sin guardarse
+@sio.event
+@instrument_event
+async def typing(sid, data):
+    room = data.get("room")
+    if not room or room not in sio.rooms(sid):
+        return
+    uid = await presence.uid_of(sid)
+    await sio.emit("typing", {"room": room, "uid": uid, "typing": bool(data.get("typing"))}, to=room, skip_sid=sid)
 
 # Evento para enviar mensajes a un room
 @sio.event
+@instrument_event
 async def send_message(sid, data):
     room = data.get("room")
     message = data.get("content")
     file_content = data.get("file_content")
-    user_uid = data.get("user")
-    if not room or not message or not user_uid:
+    if not room or not message:
         await sio.emit("error", {"error": "Room o mensaje no especificado"}, to=sid)
         return
-    #* En caso de que haya un archivo, lo subimos a ImgBB y obtenemos la URL
+    if len(str(message)) > env.MESSAGE_MAX_LENGTH:
+        await sio.emit("error", {"error": f"El mensaje supera los {env.MESSAGE_MAX_LENGTH} caracteres"}, to=sid)
+        return
+    #? Solo se puede escribir en un room al que se entró con join_room (que ya verificó la membresía)
+    if room not in sio.rooms(sid):
+        await sio.emit("error", {"error": "No perteneces a este chat"}, to=sid)
+        return
+    #* El autor es el usuario de la sesión, sin consultar la base de datos
+    sender = (await sio.get_session(sid))["user"]
+    #* Control de admisión: frecuencia por usuario, y si la base de datos no da abasto con la cola de escritura se rechaza
+    if message_limiter.take(sender["uid"]):
+        await sio.emit("error", {"error": "Demasiados mensajes, espera un momento", "code": 429}, to=sid)
+        return
+    if message_writer.depth >= env.MESSAGE_QUEUE_LIMIT:
+        await sio.emit("error", {"error": "Servidor ocupado, intenta más tarde", "code": 503}, to=sid)
+        return
+    #* En caso de que haya un archivo, lo procesamos igual que las imágenes de los posts (WebP, sin metadatos, tamaño máximo),
+    #* lo subimos a ImgBB y obtenemos la URL
     if file_content:
-        file_url = upload_image(file_content)
+        if not isinstance(file_content, (bytes, bytearray)) or len(file_content) > env.UPLOAD_MAX_FILE_BYTES:
+            await sio.emit("error", {"error": "Archivo inválido o demasiado grande", "code": 413}, to=sid)
+            return
+        try:
+            async with upload_budget.reserve(len(file_content)):
+                full, _ = await process_image(bytes(file_content))
+                file_url = await upload_image(full)
+        except Overloaded:
+            await sio.emit("error", {"error": "Servidor ocupado, intenta más tarde", "code": 503}, to=sid)
+            return
+        except InvalidImageError as e:
+            await sio.emit("error", {"error": str(e), "code": 400}, to=sid)
+            return
+        except UploadError as e:
+            await sio.emit("error", {"error": str(e)}, to=sid)
+            return
     else:
         file_url = ""
-    user = get_user_by_uid(user_uid)
-    messageObj = Message(content=str(message), files=file_url, user=user, chat=room)
-    #* Enviamos el mensaje a todos los usuarios del room y lo almacenamos en la base de datos.
-    await sio.emit("message", {"sender": sid, "message": messageObj.model_dump_json()}, to=room)
-    db.messages.insert_one(messageObj.model_dump())
-    db.chat.update_one({ "id": room }, { "$set": { "last_message": messageObj.model_dump() } })
\ No newline at end of file
+    messageObj = Message(content=str(message), files=file_url, user=sender["uid"], chat=room)
+    #* Enviamos el mensaje (con el perfil del autor) a todos los usuarios del room y lo dejamos en la cola para almacenarlo en la base de datos.
+    payload = { **messageObj.model_dump(mode="json"), "user": sender }
+    await sio.emit("message", {"sender": sid, "message": json.dumps(payload)}, to=room)
+    #? Quienes están en el room lo leen en vivo, así cerrar la pestaña con el chat abierto no deja mensajes vistos como no leídos
+    message_writer.enqueue(messageObj.model_dump(), readers=await presence.members(room))
+
+#* Aplicación
+def create_app(database=None, verifier=None, create_indexes: bool = True) -> FastAPI:
+    #* Arma la aplicación FastAPI. Por defecto usa los servicios reales (MongoDB de DB_URL y los tokens de Firebase),
+    #* las pruebas de carga (bench/) inyectan una base de datos local y un verificador de tokens falso
+    #? El host de imágenes se cambia con IMGDB_URL. Los sockets, la cola de mensajes y los límites son globales del módulo,
+    #? así que se espera una sola aplicación activa por proceso
+    global token_verifier
+    if database is not None:
+        use_database(database)
+    token_verifier = verifier or create_token_verifier()
+
+    #* Las respuestas se serializan con orjson
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.state.create_indexes = create_indexes
+    app.include_router(router)
+    # Montamos el servidor de Socket.IO en la aplicación FastAPI
+    app.mount("/socket.io", socketio.ASGIApp(sio))
+
+    # Configurar CORS para aceptar cualquier origen (por ahora, en desarrollo)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    #* Compresión de las respuestas grandes (páginas de posts, mensajes y chats), con brotli si está instalado
+    try:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(BrotliMiddleware, minimum_size=env.COMPRESSION_MIN_SIZE)
+    except ImportError:
+        app.add_middleware(GZipMiddleware, minimum_size=env.COMPRESSION_MIN_SIZE)
+    #* Las peticiones con un cuerpo más grande que MAX_REQUEST_BYTES se rechazan con 413 sin terminar de leerlas
+    app.add_middleware(BodySizeLimitMiddleware, max_bytes=env.MAX_REQUEST_BYTES)
+    #* Latencia por ruta, va al final para envolver a todos los demás middlewares
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+app = create_app()
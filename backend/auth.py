@@ -1,24 +1,28 @@
 from db import db
+from pymongo.errors import DuplicateKeyError
 from models import User
+import logging
 
-def get_user_by_uid(uid):
+logger = logging.getLogger(__name__)
+
+async def get_user_by_uid(uid):
     #* Buscamos el usuario por su UID
-    user = db.users.find_one({ 'uid': uid }, { '_id': 0 })
+    user = await db.users.find_one({ 'uid': uid }, { '_id': 0 })
     return User(**user) if user else None
 
-def get_user_by_username(username):
+async def get_user_by_username(username):
     #* Buscamos el usuario por su username
-    user = db.users.find_one({ 'username': username })
+    user = await db.users.find_one({ 'username': username })
     return User(**user) if user else None
 
-def get_user_by_email(email):
+async def get_user_by_email(email):
     #* Buscamos el usuario por su email
-    user = db.users.find_one({ 'email': email })
+    user = await db.users.find_one({ 'email': email })
     return User(**user) if user else None
 
-def check_if_user_exists(uid, email, username):
+async def check_if_user_exists(uid, email, username):
     #* Corroboramos si el usuario existe
-    user = db.users.find_one({
+    user = await db.users.find_one({
         '$or': [
             { 'uid': uid },
             { 'email': email },
@@ -27,10 +31,10 @@ def check_if_user_exists(uid, email, username):
     })
     return User(**user) if user else None
 
-def register_user_if_not_exist(user):
+async def register_user_if_not_exist(user):
     #* Registramos al usuario si no existe
-    if not check_if_user_exists(user.uid, user.email, user.username):
-        print("Registrando usuario...")
+    if not await check_if_user_exists(user.uid, user.email, user.username):
+        logger.info("Registering user %s", user.uid)
         _user = User(
             uid=user.uid,
             username=user.username,
@@ -38,6 +42,11 @@ def register_user_if_not_exist(user):
             friends=[],
             profile_picture="no_pfp.webp"
         )
-        db.users.insert_one(_user.model_dump())
+        try:
+            #* username_lower alimenta la búsqueda de usuarios por prefijo
+            await db.users.insert_one({ **_user.model_dump(), "username_lower": _user.username.lower() })
+        except DuplicateKeyError:
+            #? uid, username y email son únicos: otro registro simultáneo ganó
+            return False
         return True
     return False
\ No newline at end of file
@@ -0,0 +1,123 @@
+#* Reemplazos locales de los servicios externos para las pruebas de carga
+#* - FakeTokenVerifier: acepta tokens "bench:<uid>" en vez de ID tokens de Firebase
+#* - open_database: un mongod local (recomendado, los números son comparables con producción) o mongomock_motor en memoria
+#* - image_host: imita la API de subida de ImgBB (IMGDB_URL), con una latencia configurable
+#? Uso del host de imágenes por separado: python -m bench.backends --port 8002 --latency-ms 50
+from token_verifier import InvalidTokenError
+import argparse
+import asyncio
+import itertools
+
+TOKEN_PREFIX = "bench:"
+
+def token_for(uid: str) -> str:
+    return TOKEN_PREFIX + uid
+
+class StaticKeys:
+    #* Misma interfaz que KeySet para el arranque y apagado de la aplicación, sin descargar llaves
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+class FakeTokenVerifier:
+    #* Misma interfaz que TokenVerifier, el token es el uid con un prefijo
+    def __init__(self):
+        self.keys = StaticKeys()
+        self.verified = 0
+
+    def verify(self, token: str) -> dict:
+        if not token or not token.startswith(TOKEN_PREFIX):
+            raise InvalidTokenError("Invalid token.")
+        self.verified += 1
+        uid = token[len(TOKEN_PREFIX):]
+        return { "uid": uid, "sub": uid }
+
+    def stats(self):
+        return { "size": 0 }
+
+def _ignore_sort(method):
+    def wrapper(self, *args, sort=None, **kwargs):
+        return method(self, *args, **kwargs)
+    return wrapper
+
+def _after_by_id(method):
+    from mongomock.collection import ReturnDocument
+
+    def wrapper(self, query, projection=None, update=None, upsert=False, sort=None, return_document=ReturnDocument.BEFORE, **kwargs):
+        if return_document is not ReturnDocument.AFTER or projection is None:
+            return method(self, query, projection, update, upsert, sort, return_document, **kwargs)
+        doc = method(self, query, None, update, upsert, sort, return_document, **kwargs)
+        return doc if doc is None else self.find_one({ "_id": doc["_id"] }, projection)
+    return wrapper
+
+def _scalar_elem_match(filter_applies):
+    def wrapper(search_filter, document, *args, **kwargs):
+        if not isinstance(document, dict) and isinstance(search_filter, dict):
+            return filter_applies({ "value": search_filter }, { "value": document }, *args, **kwargs)
+        return filter_applies(search_filter, document, *args, **kwargs)
+    return wrapper
+
+def patch_mongomock():
+    #* Corrige diferencias de mongomock con MongoDB que rompen rutas de la aplicación
+    import mongomock.collection
+    from mongomock.collection import BulkOperationBuilder, Collection
+    if getattr(Collection._find_and_modify, "patched", False):
+        return
+    #? pymongo >= 4.9 le pasa `sort` a UpdateOne/ReplaceOne dentro de bulk_write y mongomock todavía no lo acepta.
+    #? La aplicación nunca usa ese sort, así que basta con descartarlo
+    BulkOperationBuilder.add_update = _ignore_sort(BulkOperationBuilder.add_update)
+    BulkOperationBuilder.add_replace = _ignore_sort(BulkOperationBuilder.add_replace)
+    #? Con ReturnDocument.AFTER y una proyección sin _id, mongomock vuelve a buscar el documento con el filtro original,
+    #? que tras el update ya no coincide (p. ej. toggle_like con "likes": { "$ne": uid }) y retorna None
+    Collection._find_and_modify = _after_by_id(Collection._find_and_modify)
+    Collection._find_and_modify.patched = True
+    #? La proyección { "likes": { "$elemMatch": { "$eq": uid } } } sobre un arreglo de strings falla en mongomock
+    #? ("unknown top level operator"), así que cada elemento escalar se compara como { value: elemento }
+    mongomock.collection.filter_applies = _scalar_elem_match(mongomock.collection.filter_applies)
+
+def open_database(mongo_url: str, name: str, mongomock: bool = False):
+    #* Retorna (cliente, base de datos) asíncronos
+    if mongomock:
+        #? Sin índices reales ni $text: sirve para probar el flujo completo, no para medir
+        from mongomock_motor import AsyncMongoMockClient
+        patch_mongomock()
+        client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(mongo_url)
+    return client, client[name]
+
+def image_host(latency: float = 0.0):
+    #* Aplicación ASGI que responde como ImgBB: recibe el campo "image" y retorna { data: { url, expiration } }
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    counter = itertools.count()
+
+    async def upload(request):
+        form = await request.form()
+        image = form.get("image")
+        if image is None:
+            return JSONResponse({ "error": { "message": "Missing image" } }, status_code=400)
+        await image.read()
+        if latency:
+            await asyncio.sleep(latency)
+        url = f"{request.base_url}i/{next(counter)}.webp"
+        return JSONResponse({ "data": { "url": url, "expiration": 0 } })
+
+    return Starlette(routes=[Route("/upload", upload, methods=["POST"])])
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Fake ImgBB upload API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    uvicorn.run(image_host(args.latency_ms / 1000), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
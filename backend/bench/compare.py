@@ -0,0 +1,35 @@
+#* Compara dos resultados de bench.run: throughput y percentiles por operación, con la variación porcentual
+#? Uso: python -m bench.compare bench/results/antes.json bench/results/despues.json
+import json
+import sys
+
+COLUMNS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "errors")
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "    -"
+    return f"{(after - before) / before * 100:+6.1f}%"
+
+def main(before_path: str, after_path: str):
+    with open(before_path) as file:
+        before = json.load(file)
+    with open(after_path) as file:
+        after = json.load(file)
+    print(f"{'operation':40} " + " ".join(f"{column:>24}" for column in COLUMNS))
+    for name in sorted(set(before["operations"]) | set(after["operations"])):
+        a = before["operations"].get(name, {})
+        b = after["operations"].get(name, {})
+        cells = []
+        for column in COLUMNS:
+            x, y = a.get(column, 0), b.get(column, 0)
+            cells.append(f"{x:>8} -> {y:>8} {change(x, y)}")
+        print(f"{name:40} " + " ".join(f"{cell:>24}" for cell in cells))
+    for label, report in (("before", before), ("after", after)):
+        rss = report.get("server_rss_mb")
+        if rss:
+            print(f"server RSS {label}: {rss}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python -m bench.compare <before.json> <after.json>")
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,561 @@
+#* Microbenchmarks de antes y después: cada medición corre la ruta original (tal como estaba antes del cambio) y la actual
+#* sobre los mismos datos, y guarda percentiles y throughput por operación en el mismo formato que bench.run
+#? Uso: python -m bench.micro --list
+#?      python -m bench.micro <medición> [opciones]    (python -m bench.micro <medición> --help para ver las opciones)
+#?      python -m bench.compare bench/baseline/micro-<medición>.json bench/results/micro-<medición>-<fecha>.json
+#? bench.server aplica el entorno de las pruebas de carga (BENCH_ENV) al importarse, antes que cualquier módulo de la aplicación
+from bench.server import BENCH_ENV
+from datetime import datetime, timezone
+from bench.run import BACKEND_DIR, git_commit, percentile
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+MEASUREMENTS = {}
+
+def measurement(name: str, description: str, arguments=()):
+    #* Registra una medición: una corrutina (args, timings) que llena `timings` con las operaciones de antes y después
+    def register(function):
+        MEASUREMENTS[name] = (function, description, arguments)
+        return function
+    return register
+
+def argument(*flags, **options):
+    return flags, options
+
+class Timings:
+    #* Latencias por operación, con el mismo resumen por operación que Recorder.report en bench.run
+    def __init__(self):
+        self.operations = {}
+        self.details = {}
+
+    def add(self, name: str, samples: list, duration: float = None, errors: int = 0):
+        values = sorted(samples)
+        #? Si las muestras se tomaron en secuencia, el tiempo total es la suma de ellas
+        duration = duration if duration is not None else sum(values)
+        self.operations[name] = {
+            "count": len(values),
+            "errors": errors,
+            "throughput_rps": round(len(values) / duration, 2) if duration else 0.0,
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+            "statuses": {},
+        }
+
+    async def measure(self, name: str, function, repeat: int, warmup: int = 3):
+        #* Corre `function` (síncrona o corrutina) `repeat` veces en secuencia y registra cada duración
+        samples = []
+        for i in range(warmup + repeat):
+            started = time.perf_counter()
+            result = function()
+            if asyncio.iscoroutine(result):
+                await result
+            if i >= warmup:
+                samples.append(time.perf_counter() - started)
+        self.add(name, samples)
+
+async def open_micro_database(args):
+    #* Base de datos limpia para la medición: un mongod con --mongo-url, o mongomock si no se indicó
+    from bench.backends import open_database
+    from db import use_database, ensure_indexes
+    client, database = open_database(args.mongo_url, args.db, mongomock=not args.mongo_url)
+    if "bench" not in args.db:
+        sys.exit("Refusing to drop a database whose name doesn't contain 'bench'")
+    for name in await database.list_collection_names():
+        await database.drop_collection(name)
+    use_database(database, client)
+    await ensure_indexes()
+    return client, database
+
+def print_table(name: str, timings: Timings):
+    print(f"# {name}")
+    for operation, stats in timings.operations.items():
+        print(f"{operation:60} {stats['throughput_rps']:>11.1f} ops/s  p50 {stats['p50_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms")
+    for key, value in timings.details.items():
+        print(f"{key}: {json.dumps(value)}")
+
+#* Mediciones
+
+async def _open_loop(duration: float, workload: dict):
+    #* Llegadas a tasa fija por operación ({ nombre: (por segundo, corrutina) }), sin esperar a que terminen las anteriores
+    #? La latencia se cuenta desde la llegada programada, así incluye el tiempo que la petición esperó a que el loop se liberara
+    arrivals = sorted(
+        (i / rate, name, operation)
+        for name, (rate, operation) in workload.items()
+        for i in range(int(duration * rate))
+    )
+    samples = { name: [] for name in workload }
+    started = time.perf_counter()
+
+    async def request(name, operation, arrival):
+        await operation()
+        samples[name].append(time.perf_counter() - arrival)
+
+    tasks = []
+    for offset, name, operation in arrivals:
+        arrival = started + offset
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(request(name, operation, arrival)))
+    await asyncio.gather(*tasks)
+    return samples, time.perf_counter() - started
+
+@measurement("event-loop", "p99 of concurrent /posts/ reads and send_message writes: blocking pymongo calls vs awaited Motor calls (user-002)", [
+    argument("--read-rate", type=float, default=300, help="GET /posts/ arrivals per second"),
+    argument("--send-rate", type=float, default=100, help="send_message arrivals per second"),
+    argument("--duration", type=float, default=5.0, help="seconds per variant"),
+    argument("--db-latency-ms", type=float, default=2.0, help="round trip of the simulated database when no --mongo-url is given"),
+])
+async def event_loop(args, timings):
+    #? mongomock es síncrono aun detrás de mongomock_motor, así que sin --mongo-url cada consulta se simula con su latencia:
+    #? time.sleep (bloquea el loop, como pymongo dentro de un endpoint async) contra asyncio.sleep (como await sobre Motor)
+    latency = args.db_latency_ms / 1000
+    if args.mongo_url:
+        from pymongo import MongoClient, DESCENDING
+        from bench.seed import uid_of
+        client, database = await open_micro_database(args)
+        sync_db = MongoClient(args.mongo_url)[args.db]
+        now = datetime.now(timezone.utc)
+        await database.posts.insert_many([
+            { "id": f"p{i}", "fecha": now, "title": "t", "content": "c", "files": [], "user": uid_of(i % 100), "public": False, "likes": [], "like_count": 0 }
+            for i in range(5000)
+        ])
+        counter = iter(range(10 ** 9))
+
+        def message():
+            return { "id": f"m{next(counter)}", "fecha": datetime.now(timezone.utc), "content": "hola", "files": "", "user": uid_of(0), "chat": "c" }
+
+        async def blocking_read():
+            sync_db.posts.find({ "user": uid_of(1) }).sort("fecha", DESCENDING).limit(20).to_list()
+
+        async def blocking_send():
+            sync_db.messages.insert_one(message())
+
+        async def async_read():
+            await database.posts.find({ "user": uid_of(1) }).sort("fecha", DESCENDING).limit(20).to_list(length=None)
+
+        async def async_send():
+            await database.messages.insert_one(message())
+    else:
+        async def blocking_read():
+            time.sleep(latency)
+
+        blocking_send = blocking_read
+
+        async def async_read():
+            await asyncio.sleep(latency)
+
+        async_send = async_read
+
+    for label, read, send in (("before (blocking)", blocking_read, blocking_send), ("after (awaited)", async_read, async_send)):
+        samples, duration = await _open_loop(args.duration, { "GET /posts/": (args.read_rate, read), "send_message": (args.send_rate, send) })
+        for name, values in samples.items():
+            timings.add(f"{label}: {name}", values, duration)
+    timings.details["db"] = args.mongo_url or f"simulated {args.db_latency_ms} ms round trip"
+
+@measurement("chat-writes", "messages/sec per room: insert_one + chat update_one per message vs the batched MessageWriter (user-004)", [
+    argument("--rooms", type=int, default=20),
+    argument("--messages", type=int, default=300, help="messages sent to each room"),
+])
+async def chat_writes(args, timings):
+    from inbox import open_operations
+    from message_writer import MessageWriter
+    from models import Message
+    _, database = await open_micro_database(args)
+    now = datetime.now(timezone.utc)
+    rooms = [f"room-{i}" for i in range(args.rooms)]
+    for room in rooms:
+        members = [f"{room}-a", f"{room}-b"]
+        await database.chat.insert_one({ "id": room, "fecha": now, "users": members, "last_message": None })
+        await database.inbox.bulk_write(open_operations(room, members, now), ordered=False)
+
+    def message(room: str, i: int) -> dict:
+        return Message(content=f"mensaje {i}", files="", user=f"{room}-{'ab'[i % 2]}", chat=room).model_dump()
+
+    async def before(room: str, samples: list):
+        #* Ruta original: cada mensaje espera su insert y la actualización del último mensaje del chat
+        for i in range(args.messages):
+            started = time.perf_counter()
+            doc = message(room, i)
+            await database.messages.insert_one(doc)
+            await database.chat.update_one({ "id": room }, { "$set": { "last_message": doc } })
+            samples.append(time.perf_counter() - started)
+
+    writer = MessageWriter()
+
+    async def after(room: str, samples: list):
+        for i in range(args.messages):
+            started = time.perf_counter()
+            writer.enqueue(message(room, i))
+            samples.append(time.perf_counter() - started)
+            #? Como el handler de send_message, cada mensaje cede el loop antes del siguiente
+            await asyncio.sleep(0)
+
+    for label, send in (("before (insert per message)", before), ("after (MessageWriter)", after)):
+        await database.messages.delete_many({})
+        samples = []
+        started = time.perf_counter()
+        if send is after:
+            writer.start()
+        await asyncio.gather(*(send(room, samples) for room in rooms))
+        if send is after:
+            #? El throughput cuenta hasta que el último mensaje quedó escrito, no solo encolado
+            await writer.stop()
+        duration = time.perf_counter() - started
+        written = await database.messages.count_documents({})
+        timings.add(f"{label}: send_message", samples, duration, errors=len(samples) - written)
+        timings.details[f"{label}: messages/sec per room"] = round(written / args.rooms / duration, 1)
+
+@measurement("author-storage", "post/message document size and profile-update cost: embedded User vs author uid (user-006)", [
+    argument("--friends", type=int, nargs="+", default=[10, 100, 1000, 5000], help="friend list sizes of the embedded author"),
+    argument("--posts", type=int, default=2000, help="posts by the author whose profile is updated"),
+    argument("--repeat", type=int, default=5),
+])
+async def author_storage(args, timings):
+    from bson import encode
+    from models import User, Post, Message
+    from profiles import get_profiles, invalidate_profile
+    from bench.seed import uid_of
+    _, database = await open_micro_database(args)
+
+    #* Tamaño en BSON de cada documento: antes el autor completo (con su lista de amigos) iba embebido en cada post y mensaje
+    author = lambda friends: User(uid=uid_of(0), username="autor", email="autor@wavenet.dev", friends=[uid_of(i) for i in range(1, friends + 1)])
+    sizes = {}
+    for friends in args.friends:
+        embedded = author(friends).model_dump()
+        post = Post(title="Hola", content="Un post de largo normal " * 4, files=[], user=uid_of(0)).model_dump()
+        message = Message(content="hola!", files="", user=uid_of(0), chat="chat").model_dump()
+        sizes[f"{friends} friends"] = {
+            "post_bytes": { "before": len(encode({ **post, "user": embedded, "comments": [] })), "after": len(encode(post)) },
+            "message_bytes": { "before": len(encode({ **message, "user": embedded })), "after": len(encode(message)) },
+        }
+    timings.details["document_size"] = sizes
+
+    #* Costo de editar el perfil del autor
+    friends = max(args.friends)
+    user = author(friends)
+    await database.users.insert_one(user.model_dump())
+    legacy = []
+    current = []
+    for i in range(args.posts):
+        post = Post(title=f"post {i}", content="contenido", files=[], user=user.uid).model_dump()
+        current.append(post)
+        legacy.append({ **post, "user": user.model_dump(), "comments": [] })
+    await database.legacy_posts.insert_many(legacy)
+    await database.posts.insert_many(current)
+    await database.legacy_posts.create_index("user.uid")
+    counter = iter(range(10 ** 9))
+
+    async def before():
+        #? Ruta original (update_posts_author): se reescribe el User embebido en todos los posts del autor
+        user.username = f"autor-{next(counter)}"
+        await database.users.update_one({ "uid": user.uid }, { "$set": { "username": user.username } })
+        await database.legacy_posts.update_many({ "user.uid": user.uid }, { "$set": { "user": user.model_dump() } })
+
+    async def after():
+        #? Ruta actual: un solo update al usuario, se invalida el perfil en caché y la siguiente lectura lo vuelve a buscar
+        user.username = f"autor-{next(counter)}"
+        await database.users.update_one({ "uid": user.uid }, { "$set": { "username": user.username, "username_lower": user.username.lower() } })
+        invalidate_profile(user.uid)
+        await get_profiles([user.uid])
+
+    await timings.measure(f"before (embedded User): profile update ({args.posts} posts, {friends} friends)", before, args.repeat, warmup=1)
+    await timings.measure(f"after (author uid): profile update ({args.posts} posts, {friends} friends)", after, args.repeat, warmup=1)
+
+def _photo(width: int, height: int, format: str) -> bytes:
+    #* Imagen parecida a una foto (degradados con grano), que se comprime como una foto real y no como ruido puro
+    from PIL import Image
+    import io
+    base = Image.merge("RGB", [Image.linear_gradient("L").rotate(angle).resize((width, height)) for angle in (0, 90, 45)])
+    grain = Image.effect_noise((width, height), 32).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(base, grain, 0.2).save(buffer, format=format, **({ "quality": 92 } if format == "JPEG" else {}))
+    return buffer.getvalue()
+
+@measurement("images", "bytes stored and time per image: raw uploads vs process_image (WebP, capped size, thumbnail) (user-010)", [
+    argument("--repeat", type=int, default=5),
+])
+async def images(args, timings):
+    from images import process_image
+    samples = {
+        "12MP JPEG (4000x3000)": _photo(4000, 3000, "JPEG"),
+        "1080p JPEG (1920x1080)": _photo(1920, 1080, "JPEG"),
+        "screenshot PNG (1280x800)": _photo(1280, 800, "PNG"),
+    }
+    #? El primer envío arranca el pool de procesos, no lo contamos
+    await process_image(samples["screenshot PNG (1280x800)"])
+    sizes = {}
+    for name, data in samples.items():
+        full, thumbnail = await process_image(data)
+        #? Antes se subían los bytes recibidos tal cual, sin procesar
+        sizes[name] = { "before_bytes": len(data), "after_bytes": len(full) + len(thumbnail), "after_full_bytes": len(full), "after_thumbnail_bytes": len(thumbnail) }
+        await timings.measure(f"after: process_image {name}", lambda: process_image(data), args.repeat, warmup=1)
+    timings.details["bytes_stored"] = sizes
+
+def _legacy_decrypt_aes(secret_key: str, encrypted_content: bytes) -> str:
+    #* decrypt_aes original: deriva la clave y arma el algoritmo y el padding en cada llamada
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.padding import PKCS7
+    aes_key = secret_key.encode('utf-8').ljust(16)[:16]
+    iv = encrypted_content[:16]
+    ciphertext = encrypted_content[16:]
+    decryptor = Cipher(algorithms.AES(aes_key), modes.CBC(iv)).decryptor()
+    padded_content = decryptor.update(ciphertext) + decryptor.finalize()
+    unpadder = PKCS7(algorithms.AES.block_size).unpadder()
+    return (unpadder.update(padded_content) + unpadder.finalize()).decode('utf-8')
+
+@measurement("wavebond-redeem", "wavebond redemptions/sec: per-call key setup, lambda parsing and unindexed email lookup vs the current read + (uid, version) lookup (user-012)", [
+    argument("--users", type=int, default=10000),
+    argument("--repeat", type=int, default=200),
+    argument("--bulk", type=int, default=100, help="wavebonds per /wavebond/bulk request"),
+])
+async def wavebond_redeem(args, timings):
+    import random
+    from models import User
+    from util import SECRET_KEY, decrypt_aes, encrypt_aes, get_user_from_wavebond, get_users_from_wavebonds, rotate_wavebond
+    from bench.seed import uid_of
+    _, database = await open_micro_database(args)
+    users = [User(uid=uid_of(i), username=f"user{i}", email=f"user{i}@wavenet.dev") for i in range(args.users)]
+    await database.users.insert_many([user.model_dump() for user in users])
+    #? La colección original no tenía índices: la copia sin índices reproduce la búsqueda por email de entonces
+    await database.legacy_users.insert_many([user.model_dump() for user in users])
+    rng = random.Random(args.random_seed)
+    holders = rng.sample(users, min(args.bulk, args.users))
+    legacy = [encrypt_aes(f"username={user.username};email={user.email};version=0.1") for user in holders]
+    current = [(await rotate_wavebond(user)).wave for user in holders]
+    picks = iter(rng.choices(range(len(holders)), k=10 ** 6))
+
+    await timings.measure("before: decrypt_aes", lambda: _legacy_decrypt_aes(SECRET_KEY, legacy[0]), args.repeat * 10)
+    await timings.measure("after: decrypt_aes", lambda: decrypt_aes(current[0]), args.repeat * 10)
+
+    async def before():
+        content = _legacy_decrypt_aes(SECRET_KEY, legacy[next(picks)])
+        data = dict(map(lambda x: x.split("="), content.split(";")))
+        user = await database.legacy_users.find_one({ 'email': data["email"] })
+        assert User(**user)
+
+    async def after():
+        assert await get_user_from_wavebond(current[next(picks)])
+
+    await timings.measure("before: redeem one wavebond", before, args.repeat)
+    await timings.measure("after: redeem one wavebond", after, args.repeat)
+
+    async def before_bulk():
+        for wave in legacy:
+            content = _legacy_decrypt_aes(SECRET_KEY, wave)
+            data = dict(map(lambda x: x.split("="), content.split(";")))
+            await database.legacy_users.find_one({ 'email': data["email"] })
+
+    async def after_bulk():
+        assert all(await get_users_from_wavebonds(current))
+
+    await timings.measure(f"before: redeem {len(holders)} wavebonds", before_bulk, max(args.repeat // 20, 3), warmup=1)
+    await timings.measure(f"after: redeem {len(holders)} wavebonds", after_bulk, max(args.repeat // 20, 3), warmup=1)
+    timings.details["users"] = args.users
+
+@measurement("home-feed", "home feed latency at 10, 1k and 10k friends: $or/$in query over every post vs the materialized timeline (user-014)", [
+    argument("--friends", type=int, nargs="+", default=[10, 1000, 10000]),
+    argument("--posts-per-friend", type=int, default=2),
+    argument("--public-posts", type=int, default=500, help="posts by public profiles that aren't friends"),
+    argument("--repeat", type=int, default=5),
+])
+async def home_feed(args, timings):
+    from datetime import timedelta
+    from pymongo import DESCENDING
+    from timeline import get_home_page
+    from bench.seed import uid_of
+    _, database = await open_micro_database(args)
+    reader = "reader"
+    now = datetime.now(timezone.utc)
+    for friends in args.friends:
+        for name in ("posts", "legacy_posts", "friendships", "timelines"):
+            await database[name].delete_many({})
+        friend_uids = [uid_of(i) for i in range(friends)]
+        await database.friendships.insert_many(
+            [{ "user": reader, "friend": uid, "fecha": now } for uid in friend_uids] +
+            [{ "user": uid, "friend": reader, "fecha": now } for uid in friend_uids]
+        )
+        posts = [
+            { "id": f"f{friends}-{i}", "fecha": now - timedelta(seconds=i), "title": "t", "content": "c", "files": [], "user": friend_uids[i % friends], "public": False, "likes": [], "like_count": 0, "comment_count": 0 }
+            for i in range(friends * args.posts_per_friend)
+        ] + [
+            { "id": f"p{friends}-{i}", "fecha": now - timedelta(seconds=i, milliseconds=500), "title": "t", "content": "c", "files": [], "user": f"public-{i % 50}", "public": True, "likes": [], "like_count": 0, "comment_count": 0 }
+            for i in range(args.public_posts)
+        ]
+        await database.posts.insert_many([dict(post) for post in posts])
+        #? Los posts originales embebían el User del autor, y la consulta filtraba por user.uid y user.public_profile
+        await database.legacy_posts.insert_many([{ **post, "user": { "uid": post["user"], "public_profile": post["public"] } } for post in posts])
+        await database.legacy_posts.create_index([("fecha", DESCENDING)])
+
+        async def before():
+            #? Ruta original: todos los posts de los amigos y públicos, ordenados y sin límite
+            await database.legacy_posts.find({
+                "$or": [
+                    { "user.uid": { "$in": friend_uids } },
+                    { "user.public_profile": True }
+                ]
+            }).sort("fecha", DESCENDING).to_list(length=None)
+
+        async def after():
+            page, _ = await get_home_page(reader, 20)
+            assert len(page) == 20
+
+        #? El primer get_home_page arma el timeline, queda dentro del calentamiento
+        await timings.measure(f"before ($or/$in, all posts): home feed ({friends} friends)", before, args.repeat, warmup=1)
+        await timings.measure(f"after (timeline, 20 posts): home feed ({friends} friends)", after, args.repeat, warmup=1)
+        timings.details[f"{friends} friends"] = { "posts": len(posts) }
+
+@measurement("serialization", "serialization of a realistic 20-post page: full documents through bson.json_util.dumps + JSONResponse vs PostPage with pydantic-core (user-018)", [
+    argument("--page-size", type=int, default=20),
+    argument("--author-friends", type=int, default=300, help="friend list of the embedded author in the original documents"),
+    argument("--max-likes", type=int, default=300, help="likes per post are drawn from 0..max"),
+    argument("--max-comments", type=int, default=10, help="embedded comments per post in the original documents"),
+    argument("--repeat", type=int, default=300),
+])
+async def serialization(args, timings):
+    import random
+    from bson.json_util import dumps
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from starlette.requests import Request
+    from models import User, Post, PostPage, ImageFile
+    from responses import etag_response
+    from bench.seed import VOCABULARY, uid_of
+    rng = random.Random(args.random_seed)
+    text = lambda words: " ".join(rng.choice(VOCABULARY) for _ in range(words))
+    author = User(uid=uid_of(0), username="autor", email="autor@wavenet.dev", friends=[uid_of(i) for i in range(1, args.author_friends + 1)])
+    commenter = User(uid=uid_of(1), username="amigo", email="amigo@wavenet.dev", friends=[uid_of(i) for i in range(2, args.author_friends + 2)])
+    legacy = []
+    current = []
+    for i in range(args.page_size):
+        likes = [uid_of(j) for j in rng.sample(range(10000), rng.randint(0, args.max_likes))]
+        files = [ImageFile(url=f"https://i.ibb.co/{i}/{j}.webp", thumbnail=f"https://i.ibb.co/{i}/{j}-t.webp") for j in range(rng.randint(0, 3))]
+        post = Post(title=text(5), content=text(rng.randint(10, 80)), files=files, user=author.uid, likes=likes, like_count=len(likes), comment_count=rng.randint(0, args.max_comments))
+        #? El documento original, tal como lo guardaba y retornaba la ruta: User embebido, lista de likes completa y comentarios adentro
+        comments = [
+            { "id": f"c{i}-{j}", "fecha": post.fecha, "content": text(12), "files": [], "user": commenter.model_dump(), "likes": likes[:5], "responses": [] }
+            for j in range(post.comment_count)
+        ]
+        legacy.append({ **post.model_dump(), "files": [f.url for f in files], "user": author.model_dump(), "comments": comments })
+        #? La página actual: proyección del feed, perfil del autor hidratado y solo si el usuario le dio like
+        current.append({
+            **post.model_dump(include={ "id", "fecha", "title", "content", "files", "like_count", "comment_count", "pinned" }),
+            "user": { "uid": author.uid, "username": author.username, "profile_picture": author.profile_picture },
+            "liked": bool(likes) and rng.random() < 0.3,
+        })
+    request = Request({ "type": "http", "method": "GET", "path": "/posts/", "headers": [] })
+
+    def before():
+        #? La ruta original retornaba { "result": dumps(posts) } sin response_model: FastAPI pasaba el dict por jsonable_encoder
+        #? y JSONResponse volvía a codificar el string JSON ya armado
+        return JSONResponse(jsonable_encoder({ "result": dumps(legacy) })).body
+
+    def before_projected():
+        #? La serialización original sobre la página ya proyectada, para separar el costo de la serialización del tamaño de los documentos
+        return JSONResponse(jsonable_encoder({ "result": dumps(current) })).body
+
+    def after():
+        return etag_response(request, PostPage(result=current)).body
+
+    await timings.measure(f"before (json_util.dumps + JSONResponse): {args.page_size}-post page", before, args.repeat)
+    await timings.measure(f"before (json_util.dumps + JSONResponse): {args.page_size}-post projected page", before_projected, args.repeat)
+    await timings.measure(f"after (PostPage + pydantic-core): {args.page_size}-post page", after, args.repeat)
+    timings.details["response_bytes"] = { "before": len(before()), "before_projected": len(before_projected()), "after": len(after()) }
+
+@measurement("search", "post and user search over a generated corpus: pulling the whole feed and filtering on the client vs the $text and prefix indexes (user-021)", [
+    argument("--posts", type=int, default=1000000, help="size of the generated posts corpus"),
+    argument("--users", type=int, default=20000),
+    argument("--friends", type=int, default=100),
+    argument("--repeat", type=int, default=20),
+])
+async def search(args, timings):
+    from pymongo import DESCENDING
+    from db import ensure_indexes
+    from friends import get_friend_uids
+    from search import search_posts, search_users
+    from bench import seed as seeding
+    _, database = await open_micro_database(args)
+    parser = argparse.ArgumentParser()
+    seeding.add_arguments(parser)
+    config = parser.parse_args([
+        "--users", str(args.users), "--friends", str(args.friends), "--posts", str(args.posts), "--comments", "0",
+        "--chats-per-user", "0", "--long-chats", "0", "--random-seed", str(args.random_seed),
+    ])
+    await seeding.seed(database, config)
+    #? seed borra las colecciones, así que los índices (incluido el de texto) se vuelven a crear
+    await ensure_indexes()
+    reader = seeding.uid_of(1)
+    friends = await get_friend_uids(reader)
+    words = iter(seeding.VOCABULARY * 1000)
+
+    async def before_posts():
+        #? Sin búsqueda, el cliente traía el feed completo de amigos y públicos y lo filtraba
+        word = next(words)
+        posts = await database.posts.find({ "$or": [{ "user": { "$in": friends + [reader] } }, { "public": True }] }, { "_id": 0 }) \
+            .sort("fecha", DESCENDING) \
+            .to_list(length=None)
+        return [post for post in posts if word in post["title"] or word in post["content"]][:20]
+
+    async def after_posts():
+        await search_posts(reader, friends, next(words), 20)
+
+    await timings.measure(f"before (whole feed, client filter): search posts ({args.posts} posts)", before_posts, max(args.repeat // 10, 2), warmup=1)
+    if args.mongo_url:
+        await timings.measure(f"after ($text index): search posts ({args.posts} posts)", after_posts, args.repeat)
+    else:
+        timings.details["search posts"] = "skipped: mongomock has no $text, use --mongo-url"
+    prefixes = iter([f"user{i}" for i in range(1, 10)] * 1000)
+    await timings.measure(f"after (username_lower prefix): search users ({args.users} users)", lambda: search_users(reader, friends, next(prefixes), 20), args.repeat)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Before/after micro-benchmarks for individual optimizations")
+    parser.add_argument("--list", action="store_true", help="list the measurements and exit")
+    subparsers = parser.add_subparsers(dest="measurement")
+    for name, (_, description, arguments) in MEASUREMENTS.items():
+        subparser = subparsers.add_parser(name, help=description, description=description)
+        subparser.add_argument("--mongo-url", help="local mongod to measure against (default: mongomock, not for absolute numbers)")
+        subparser.add_argument("--db", default="wavenet_bench_micro")
+        subparser.add_argument("--random-seed", type=int, default=1)
+        subparser.add_argument("--out", help="results file (default bench/results/micro-<name>-<timestamp>.json)")
+        for flags, options in arguments:
+            subparser.add_argument(*flags, **options)
+    args = parser.parse_args()
+    if args.list or not args.measurement:
+        for name, (_, description, _) in MEASUREMENTS.items():
+            print(f"{name:20} {description}")
+        return
+
+    function = MEASUREMENTS[args.measurement][0]
+    timings = Timings()
+    started_at = datetime.now(timezone.utc).isoformat()
+    await function(args, timings)
+
+    result = {
+        "meta": {
+            "started_at": started_at,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "measurement": args.measurement,
+            "args": vars(args),
+            "env": { key: os.environ.get(key) for key in BENCH_ENV },
+        },
+        "operations": timings.operations,
+        "details": timings.details,
+    }
+    out = args.out or os.path.join(BACKEND_DIR, "bench", "results", f"micro-{args.measurement}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as file:
+        json.dump(result, file, indent=2, default=str)
+    print_table(args.measurement, timings)
+    print(f"Resultados guardados en {out}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,421 @@
+#* Prueba de carga de punta a punta: levanta el host de imágenes falso y la aplicación (bench.server) con datos de prueba,
+#* genera una carga mixta de HTTP y Socket.IO, y guarda throughput y percentiles (p50/p95/p99) por endpoint y evento en un JSON
+#? Uso: python -m bench.run --scenario mixed --duration 60 --vus 50 --socket-users 100
+#?      python -m bench.run --url http://127.0.0.1:8001 --manifest bench/manifest.json   (contra un servidor ya levantado)
+#?      python -m bench.compare bench/results/antes.json bench/results/despues.json
+from collections import defaultdict
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#* Peso de cada operación HTTP por escenario (chat solo usa sockets)
+SCENARIOS = {
+    "mixed": {
+        "GET /posts/ (home)": 30, "GET /posts/ (profile)": 10, "POST /like/": 10,
+        "GET /posts/{post_id}/comments": 8, "POST /posts/{post_id}/comments": 3, "POST /create-post/": 2,
+        "GET /chats/": 10, "GET /messages/{chat_id}": 10, "GET /search/ (posts)": 4, "GET /search/ (users)": 3,
+        "GET /friends/": 5, "GET /auth/user": 5,
+    },
+    "feed": { "GET /posts/ (home)": 70, "GET /posts/ (profile)": 20, "POST /like/": 10 },
+    #? Ráfaga de posts con imágenes grandes, para revisar la memoria del servidor y el control de admisión
+    "uploads": { "POST /create-post/ (image)": 1 },
+    "chat": {},
+}
+
+def percentile(values: list, p: float) -> float:
+    #* Percentil por rango más cercano sobre una lista ordenada
+    if not values:
+        return 0.0
+    index = max(int(round(p / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+class Recorder:
+    #* Latencias por operación, solo se registran pasado el calentamiento
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.recording = False
+        self.started_at = None
+        self.stopped_at = None
+
+    def start(self):
+        self.recording = True
+        self.started_at = time.perf_counter()
+
+    def stop(self):
+        self.recording = False
+        self.stopped_at = time.perf_counter()
+
+    def record(self, name: str, seconds: float, ok: bool, status=None):
+        if not self.recording:
+            return
+        if status is not None:
+            self.statuses[name][str(status)] += 1
+        if ok:
+            self.samples[name].append(seconds)
+        else:
+            self.errors[name] += 1
+
+    def report(self) -> dict:
+        duration = (self.stopped_at or time.perf_counter()) - self.started_at
+        operations = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            values = sorted(self.samples[name])
+            operations[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(values) / duration, 2),
+                "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+                "statuses": dict(self.statuses[name]),
+            }
+        total = sum(len(values) for values in self.samples.values())
+        return {
+            "duration_s": round(duration, 2),
+            "total_requests": total,
+            "total_errors": sum(self.errors.values()),
+            "throughput_rps": round(total / duration, 2),
+            "operations": operations,
+        }
+
+def make_images(count: int, size: int) -> list:
+    #* Imágenes JPEG con ruido (no se comprimen, así pesan como una foto real), distintas entre sí
+    from PIL import Image
+    images = []
+    for i in range(count):
+        image = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+class HttpUser:
+    #* Usuario virtual de HTTP: elige operaciones según los pesos del escenario y recuerda los posts que vio en el feed
+    def __init__(self, client, uid: str, manifest: dict, chats: list, weights: dict, images: list, rng: random.Random, recorder: Recorder):
+        from bench.backends import token_for
+        self.client = client
+        self.uid = uid
+        self.manifest = manifest
+        self.chats = chats
+        self.names = list(weights)
+        self.weights = list(weights.values())
+        self.images = images
+        self.rng = rng
+        self.recorder = recorder
+        self.headers = { "Authorization": f"Bearer {token_for(uid)}" }
+        self.seen_posts = []
+        self.home_cursor = None
+
+    async def request(self, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except Exception:
+            self.recorder.record(name, time.perf_counter() - started, False, "transport_error")
+            return None
+        elapsed = time.perf_counter() - started
+        self.recorder.record(name, elapsed, response.status_code < 400, response.status_code)
+        return response
+
+    def post_id(self) -> str:
+        return self.rng.choice(self.seen_posts or self.manifest["recent_posts"])
+
+    async def run(self, stop_at: float):
+        while time.perf_counter() < stop_at:
+            name = self.rng.choices(self.names, self.weights)[0]
+            await getattr(self, OPERATIONS[name])(name)
+
+    async def home(self, name):
+        #? Tres de cada diez veces se sigue a la página siguiente del feed
+        params = { "user": "public-friends", "limit": 20 }
+        if self.home_cursor and self.rng.random() < 0.3:
+            params["cursor"] = self.home_cursor
+            name = "GET /posts/ (home, next page)"
+        response = await self.request(name, "GET", "/posts/", params=params)
+        if response is not None and response.status_code == 200:
+            body = response.json()
+            self.home_cursor = body.get("next_cursor")
+            self.seen_posts = [post["id"] for post in body.get("result", [])] or self.seen_posts
+
+    async def profile(self, name):
+        await self.request(name, "GET", "/posts/", params={ "user": self.rng.choice(self.manifest["users"]), "limit": 20 })
+
+    async def like(self, name):
+        await self.request(name, "POST", "/like/", json={ "type": "posts", "id": self.post_id() })
+
+    async def comments(self, name):
+        await self.request(name, "GET", f"/posts/{self.post_id()}/comments", params={ "limit": 20 })
+
+    async def comment(self, name):
+        content = " ".join(self.rng.choice(self.manifest["words"]) for _ in range(10))
+        await self.request(name, "POST", f"/posts/{self.post_id()}/comments", json={ "content": content })
+
+    async def create_post(self, name):
+        words = self.manifest["words"]
+        data = { "title": " ".join(self.rng.choice(words) for _ in range(4)), "content": " ".join(self.rng.choice(words) for _ in range(30)) }
+        files = None
+        if name.endswith("(image)"):
+            files = [("files", ("image.jpg", self.rng.choice(self.images), "image/jpeg"))]
+        await self.request(name, "POST", "/create-post/", data=data, files=files)
+
+    async def chats_list(self, name):
+        await self.request(name, "GET", "/chats/", params={ "limit": 20 })
+
+    async def messages(self, name):
+        if not self.chats:
+            return await self.chats_list("GET /chats/")
+        await self.request(name, "GET", f"/messages/{self.rng.choice(self.chats)}", params={ "limit": 50 })
+
+    async def search_posts(self, name):
+        await self.request(name, "GET", "/search/", params={ "q": self.rng.choice(self.manifest["words"]), "type": "posts" })
+
+    async def search_users(self, name):
+        await self.request(name, "GET", "/search/", params={ "q": f"user{self.rng.randrange(100)}", "type": "users" })
+
+    async def friends(self, name):
+        await self.request(name, "GET", "/friends/", params={ "limit": 50 })
+
+    async def me(self, name):
+        await self.request(name, "GET", "/auth/user")
+
+OPERATIONS = {
+    "GET /posts/ (home)": "home", "GET /posts/ (profile)": "profile", "POST /like/": "like",
+    "GET /posts/{post_id}/comments": "comments", "POST /posts/{post_id}/comments": "comment",
+    "POST /create-post/": "create_post", "POST /create-post/ (image)": "create_post",
+    "GET /chats/": "chats_list", "GET /messages/{chat_id}": "messages",
+    "GET /search/ (posts)": "search_posts", "GET /search/ (users)": "search_users",
+    "GET /friends/": "friends", "GET /auth/user": "me",
+}
+
+async def socket_user(url: str, uid: str, chat_id: str, rate: float, rng: random.Random, recorder: Recorder, stop_at: float):
+    #* Usuario de Socket.IO: se conecta, entra al chat y envía mensajes a `rate` por segundo
+    #? La latencia de send_message es desde el emit hasta que el propio mensaje vuelve por el room
+    import socketio
+    from bench.backends import token_for
+    client = socketio.AsyncClient(reconnection=False)
+    pending = {}
+    joined = asyncio.Event()
+
+    @client.on("message")
+    async def on_message(data):
+        if "message" not in data:
+            return
+        content = json.loads(data["message"]).get("content")
+        started = pending.pop(content, None)
+        if started is not None:
+            recorder.record("socket send_message", time.perf_counter() - started, True)
+
+    @client.on("room_users")
+    async def on_room_users(data):
+        joined.set()
+
+    @client.on("error")
+    async def on_error(data):
+        recorder.record("socket error event", 0, False)
+
+    started = time.perf_counter()
+    try:
+        #? wait_timeout es de 1 segundo por defecto, con el servidor bajo carga el connect del namespace puede tardar más
+        await client.connect(url, auth={ "token": token_for(uid) }, transports=["websocket"], wait_timeout=10)
+    except Exception:
+        recorder.record("socket connect", time.perf_counter() - started, False)
+        return
+    recorder.record("socket connect", time.perf_counter() - started, True)
+    try:
+        started = time.perf_counter()
+        await client.emit("join_room", { "room": chat_id })
+        try:
+            await asyncio.wait_for(joined.wait(), timeout=10)
+            recorder.record("socket join_room", time.perf_counter() - started, True)
+        except asyncio.TimeoutError:
+            recorder.record("socket join_room", time.perf_counter() - started, False)
+            return
+        sequence = 0
+        while time.perf_counter() < stop_at:
+            #? Intervalos exponenciales: los mensajes de todos los usuarios llegan como un proceso de Poisson
+            await asyncio.sleep(rng.expovariate(rate))
+            content = f"bench {uid} {sequence}"
+            sequence += 1
+            pending[content] = time.perf_counter()
+            await client.emit("send_message", { "room": chat_id, "content": content })
+        await asyncio.sleep(1)
+        for _ in pending:
+            recorder.record("socket send_message", 0, False)
+    finally:
+        await client.disconnect()
+
+async def sample_memory(pid: int, samples: list, stop: asyncio.Event):
+    #* RSS del proceso del servidor cada medio segundo (solo en Linux, desde /proc)
+    path = f"/proc/{pid}/status"
+    while not stop.is_set():
+        try:
+            with open(path) as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        samples.append(int(line.split()[1]) / 1024)
+        except OSError:
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+async def wait_ready(client, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/metrics")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(1)
+    raise RuntimeError("The server did not start in time")
+
+def spawn(module: str, args: list) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", module, *args], cwd=BACKEND_DIR)
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def drive(args, manifest: dict, server_pid=None) -> dict:
+    import httpx
+    weights = SCENARIOS[args.scenario]
+    if args.mongomock:
+        #? mongomock no implementa $text, la búsqueda de posts solo se mide contra un mongod
+        weights = { name: weight for name, weight in weights.items() if name != "GET /search/ (posts)" }
+    rng = random.Random(args.random_seed)
+    recorder = Recorder()
+    users = manifest["users"]
+    chats_of = defaultdict(list)
+    for chat_id, a, b in manifest["chats"]:
+        chats_of[a].append(chat_id)
+        chats_of[b].append(chat_id)
+    images = make_images(args.image_variants, args.image_size) if any("(image)" in name for name in weights) else []
+
+    limits = httpx.Limits(max_connections=max(args.vus, 1), max_keepalive_connections=max(args.vus, 1))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        await wait_ready(client, args.ready_timeout)
+        stop_at = time.perf_counter() + args.warmup + args.duration
+        tasks = []
+        for i in range(args.vus if weights else 0):
+            uid = users[(i * 7919) % len(users)]
+            user = HttpUser(client, uid, manifest, chats_of[uid], weights, images, random.Random(rng.random()), recorder)
+            tasks.append(asyncio.create_task(user.run(stop_at)))
+        socket_users = args.socket_users if args.socket_users is not None else (0 if args.scenario in ("feed", "uploads") else 50)
+        for i in range(min(socket_users, len(manifest["chats"]) * 2)):
+            chat_id, a, b = manifest["chats"][i // 2]
+            uid = a if i % 2 == 0 else b
+            tasks.append(asyncio.create_task(socket_user(args.url, uid, chat_id, args.message_rate, random.Random(rng.random()), recorder, stop_at)))
+
+        memory = []
+        stop_memory = asyncio.Event()
+        sampler = asyncio.create_task(sample_memory(server_pid, memory, stop_memory)) if server_pid else None
+        await asyncio.sleep(args.warmup)
+        baseline = memory[-1] if memory else None
+        recorder.start()
+        await asyncio.gather(*tasks)
+        recorder.stop()
+        stop_memory.set()
+        if sampler:
+            await sampler
+
+    report = recorder.report()
+    if memory:
+        report["server_rss_mb"] = { "after_warmup": round(baseline or memory[0], 1), "peak": round(max(memory), 1), "end": round(memory[-1], 1) }
+    return report
+
+async def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test for the WaveNet backend")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="seconds before measuring (timelines and caches get built)")
+    parser.add_argument("--vus", type=int, default=50, help="concurrent HTTP users")
+    parser.add_argument("--socket-users", type=int, default=None, help="concurrent Socket.IO users (default 50, none for feed/uploads)")
+    parser.add_argument("--message-rate", type=float, default=1, help="messages per second per socket user")
+    parser.add_argument("--image-size", type=int, default=2000, help="side in px of the uploaded JPEGs")
+    parser.add_argument("--image-variants", type=int, default=20)
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--url", help="drive an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--image-host-port", type=int, default=8002)
+    parser.add_argument("--image-latency-ms", type=float, default=50)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="wavenet_bench")
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data (and manifest) of a previous run")
+    parser.add_argument("--seed-args", default="", help='extra seed options, e.g. "--posts 1000000 --users 20000"')
+    parser.add_argument("--manifest", default="bench/manifest.json")
+    parser.add_argument("--ready-timeout", type=float, default=3600, help="seconds to wait for seeding and startup")
+    parser.add_argument("--out", help="results file (default bench/results/<timestamp>-<scenario>.json)")
+    args = parser.parse_args()
+
+    processes = []
+    server_pid = None
+    try:
+        if not args.url:
+            args.url = f"http://127.0.0.1:{args.port}"
+            processes.append(spawn("bench.backends", ["--port", str(args.image_host_port), "--latency-ms", str(args.image_latency_ms)]))
+            os.environ.setdefault("IMGDB_URL", f"http://127.0.0.1:{args.image_host_port}/upload")
+            server_args = ["--port", str(args.port), "--mongo-url", args.mongo_url, "--db", args.db, "--manifest", args.manifest]
+            if args.mongomock:
+                server_args.append("--mongomock")
+            if args.mongomock or not args.no_seed:
+                #? Con mongomock los datos viven en el proceso del servidor, así que siempre se generan
+                if os.path.exists(os.path.join(BACKEND_DIR, args.manifest)):
+                    os.remove(os.path.join(BACKEND_DIR, args.manifest))
+                server_args += ["--seed", *args.seed_args.split()]
+            server = spawn("bench.server", server_args)
+            processes.append(server)
+            server_pid = server.pid
+            #* El manifiesto aparece cuando termina el seed
+            deadline = time.monotonic() + args.ready_timeout
+            while not os.path.exists(os.path.join(BACKEND_DIR, args.manifest)):
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The server exited (or timed out) before seeding finished")
+                await asyncio.sleep(1)
+        with open(os.path.join(BACKEND_DIR, args.manifest)) as file:
+            manifest = json.load(file)
+        report = await drive(args, manifest, server_pid)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    result = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "args": vars(args),
+            "seed": manifest.get("summary"),
+        },
+        **report,
+    }
+    out = args.out or os.path.join(BACKEND_DIR, "bench", "results", f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{args.scenario}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as file:
+        json.dump(result, file, indent=2)
+    for name, stats in report["operations"].items():
+        print(f"{name:40} {stats['throughput_rps']:>9.1f} rps  p50 {stats['p50_ms']:>8.1f} ms  p95 {stats['p95_ms']:>8.1f} ms  p99 {stats['p99_ms']:>8.1f} ms  errors {stats['errors']}")
+    print(f"Resultados guardados en {out}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,209 @@
+#* Datos de prueba para las pruebas de carga: usuarios con muchos amigos (y algunos con miles), posts, comentarios y chats largos
+#* Los datos son deterministas (misma semilla, mismos datos) y se escriben por lotes. Al terminar se guarda un manifiesto
+#* (uids, chats, posts recientes y vocabulario) que usa run.py para armar las peticiones sin consultar la base de datos.
+#? Uso: python -m bench.seed --mongo-url mongodb://localhost:27017 --db wavenet_bench --posts 1000000 --manifest bench/manifest.json
+#! Borra todas las colecciones de la base de datos indicada, solo acepta nombres que contengan "bench"
+from datetime import datetime, timedelta, timezone
+from env_handler import env
+from friends import chat_id_for
+from inbox import preview_of
+import argparse
+import asyncio
+import json
+import random
+import time
+
+BATCH_SIZE = 5000
+
+VOCABULARY = [
+    "wave", "bond", "retro", "pixel", "megaman", "starforce", "brother", "band", "signal", "network",
+    "música", "juego", "noche", "ciudad", "amigos", "proyecto", "hackathon", "código", "sol", "lluvia",
+    "coffee", "weekend", "synth", "arcade", "neon", "cartridge", "dial-up", "modem", "floppy", "cassette",
+]
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--friends", type=int, default=100, help="random friends per user")
+    parser.add_argument("--celebrities", type=int, default=2, help="users that are friends with everybody")
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--chats-per-user", type=int, default=3)
+    parser.add_argument("--messages-per-chat", type=int, default=50)
+    parser.add_argument("--long-chats", type=int, default=2)
+    parser.add_argument("--long-chat-messages", type=int, default=20000)
+    parser.add_argument("--random-seed", type=int, default=1)
+
+def uid_of(i: int) -> str:
+    return f"bench-user-{i:06d}"
+
+def post_id_of(i: int) -> str:
+    #? El índice 0 es el post más reciente
+    return f"bench-post-{i:09d}"
+
+async def _insert(collection, docs, batch_size: int = BATCH_SIZE) -> int:
+    batch = []
+    total = 0
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            await collection.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        total += len(batch)
+    return total
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+async def seed(db, config) -> dict:
+    #* Retorna el manifiesto con lo necesario para armar la carga
+    if "bench" not in db.name:
+        raise ValueError(f"Refusing to seed database {db.name!r}, its name must contain 'bench'")
+    rng = random.Random(config.random_seed)
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    for name in await db.list_collection_names():
+        await db.drop_collection(name)
+
+    #* Grafo de amistades: amigos al azar por usuario más las celebridades, que son amigas de todos
+    n = config.users
+    friends = [set() for _ in range(n)]
+    for i in range(n):
+        for j in rng.sample(range(n), min(config.friends, n - 1)):
+            if j != i:
+                friends[i].add(j)
+                friends[j].add(i)
+    for c in range(min(config.celebrities, n)):
+        for i in range(n):
+            if i != c:
+                friends[c].add(i)
+                friends[i].add(c)
+    public = [i % 3 == 0 for i in range(n)]
+    #? Los autores con más amigos que TIMELINE_FANOUT_LIMIT se leen al armar el feed, igual que en timeline.py
+    pull = { i for i in range(n) if len(friends[i]) > env.TIMELINE_FANOUT_LIMIT }
+
+    await _insert(db.users, ({
+        "uid": uid_of(i),
+        "username": f"user{i}",
+        "username_lower": f"user{i}",
+        "email": f"user{i}@bench.wavenet",
+        "profile_picture": "/no_pfp.webp",
+        "public_profile": public[i],
+        "friends": [uid_of(j) for j in friends[i]],
+    } for i in range(n)))
+    edges = await _insert(db.friendships, ({
+        "user": uid_of(i),
+        "friend": uid_of(j),
+        "fecha": now - timedelta(minutes=i + j),
+        **({ "pull": True } if j in pull else {}),
+    } for i in range(n) for j in friends[i]))
+
+    #* Posts: uno de cada cinco es de una celebridad, repartidos en el último año (el índice 0 es el más reciente)
+    step = timedelta(days=365) / max(config.posts, 1)
+    celebrities = max(min(config.celebrities, n), 1)
+    authors = [rng.randrange(celebrities) if rng.random() < 0.2 else rng.randrange(n) for _ in range(config.posts)]
+    #? Los comentarios se concentran en los posts recientes, que son los que se leen
+    recent = max(config.posts // 10, 1)
+    commented = [rng.randrange(recent) for _ in range(config.comments)] if config.posts else []
+    comment_counts = {}
+    for p in commented:
+        comment_counts[p] = comment_counts.get(p, 0) + 1
+    posts = await _insert(db.posts, ({
+        "id": post_id_of(p),
+        "fecha": now - step * p,
+        "title": _text(rng, 4),
+        "content": _text(rng, 30),
+        "files": [],
+        "user": uid_of(authors[p]),
+        "public": public[authors[p]],
+        "likes": [],
+        "like_count": 0,
+        "comment_count": comment_counts.get(p, 0),
+        "pinned": False,
+    } for p in range(config.posts)))
+
+    def comment_docs():
+        for k, p in enumerate(commented):
+            yield {
+                "id": f"bench-comment-{k:09d}",
+                "fecha": now - step * p + timedelta(seconds=k % 3600),
+                "post": post_id_of(p),
+                "parent": None,
+                "content": _text(rng, 12),
+                "user": uid_of(rng.randrange(n)),
+                "likes": [],
+                "like_count": 0,
+                "reply_count": 0,
+            }
+    comments = await _insert(db.comments, comment_docs())
+
+    #* Chats: unos pocos por usuario con mensajes cortos, y algunos chats muy largos con las celebridades
+    pairs = set()
+    for i in range(n):
+        for j in sorted(friends[i])[:config.chats_per_user]:
+            pairs.add((min(i, j), max(i, j)))
+    long_pairs = { (0, j) for j in range(1, min(config.long_chats, n - 1) + 1) } if n > 1 else set()
+    pairs |= long_pairs
+    chats = []
+    last_messages = {}
+
+    def message_docs():
+        for a, b in sorted(pairs):
+            chat_id = chat_id_for(uid_of(a), uid_of(b))
+            chats.append([chat_id, uid_of(a), uid_of(b)])
+            count = config.long_chat_messages if (a, b) in long_pairs else config.messages_per_chat
+            message = None
+            for m in range(count):
+                message = {
+                    "id": f"{chat_id}-{m:08d}",
+                    "fecha": now - timedelta(seconds=count - m),
+                    "content": _text(rng, 8),
+                    "files": "",
+                    "user": uid_of(a if m % 2 else b),
+                    "chat": chat_id,
+                }
+                yield message
+            last_messages[chat_id] = message
+    messages = await _insert(db.messages, message_docs())
+    await _insert(db.chat, ({ "id": chat_id, "fecha": now - timedelta(days=30), "users": [a, b] } for chat_id, a, b in chats))
+    await _insert(db.inbox, ({
+        "chat": chat_id,
+        "owner": owner,
+        "peer": b if owner == a else a,
+        "last_activity": last_messages[chat_id]["fecha"] if last_messages[chat_id] else now - timedelta(days=30),
+        "last_message": preview_of(last_messages[chat_id]) if last_messages[chat_id] else None,
+        "unread": 0,
+    } for chat_id, a, b in chats for owner in (a, b)))
+
+    summary = {
+        "users": n, "friendships": edges, "posts": posts, "comments": comments,
+        "chats": len(chats), "messages": messages, "seconds": round(time.perf_counter() - started, 1),
+    }
+    print(f"seed: {summary}")
+    return {
+        "summary": summary,
+        "users": [uid_of(i) for i in range(n)],
+        "celebrities": [uid_of(i) for i in range(min(config.celebrities, n))],
+        "chats": chats,
+        "recent_posts": [post_id_of(p) for p in range(min(recent, 2000))],
+        "words": VOCABULARY,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Seed a WaveNet database for load tests")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="wavenet_bench")
+    parser.add_argument("--manifest", default="bench/manifest.json")
+    add_arguments(parser)
+    args = parser.parse_args()
+    from bench.backends import open_database
+    client, db = open_database(args.mongo_url, args.db)
+    manifest = await seed(db, args)
+    with open(args.manifest, "w") as file:
+        json.dump(manifest, file)
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
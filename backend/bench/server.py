@@ -0,0 +1,64 @@
+#* Servidor de la aplicación para las pruebas de carga: la misma app de app.py armada con create_app, pero con una base de
+#* datos local, el verificador de tokens falso y el host de imágenes falso (IMGDB_URL, por defecto el de bench.backends)
+#? Los límites de frecuencia (POST_RATE, LIKE_RATE, SOCKET_MESSAGE_RATE) quedan desactivados salvo que se definan en el entorno,
+#? para medir la aplicación y no el control de admisión
+#? Uso: python -m bench.server --mongo-url mongodb://localhost:27017 --seed --manifest bench/manifest.json
+import argparse
+import asyncio
+import json
+import os
+
+#* Entorno por defecto de las pruebas de carga, se puede sobrescribir con variables de entorno
+#? Se aplica antes de importar cualquier módulo de la aplicación, porque env_handler lee el entorno al importarse
+BENCH_ENV = {
+    #? db.py crea el cliente global con DB_NAME al importarse, aunque después create_app use la base de datos del benchmark
+    "DB_NAME": "wavenet_bench",
+    "FIREBASE_PROJECT_ID": "wavenet-bench",
+    "CYPH_SECRET_KEY": "wavenet-bench-key",
+    "IMGDB_URL": "http://127.0.0.1:8002/upload",
+    "IMGDB_KEY": "bench",
+    "POST_RATE": "0",
+    "LIKE_RATE": "0",
+    "SOCKET_MESSAGE_RATE": "0",
+    "SLOW_REQUEST_MS": "0",
+    "DB_SLOW_QUERY_MS": "0",
+    "LOG_LEVEL": "WARNING",
+}
+for key, value in BENCH_ENV.items():
+    os.environ.setdefault(key, value)
+
+from bench import seed as seeding
+
+async def serve(args):
+    import uvicorn
+    from bench.backends import FakeTokenVerifier, open_database
+    from app import create_app
+
+    client, database = open_database(args.mongo_url, args.db, args.mongomock)
+    if args.seed:
+        manifest = await seeding.seed(database, args)
+        #? Se escribe completo y recién entonces se renombra: run.py espera a que el manifiesto exista para empezar
+        with open(args.manifest + ".tmp", "w") as file:
+            json.dump(manifest, file)
+        os.replace(args.manifest + ".tmp", args.manifest)
+    app = create_app(database=database, verifier=FakeTokenVerifier(), create_indexes=not args.mongomock)
+    #* Todo corre en el mismo event loop que el seed (Motor queda ligado al loop de su primera operación)
+    server = uvicorn.Server(uvicorn.Config(app, host=args.host, port=args.port, log_level="warning", lifespan="on"))
+    await server.serve()
+    client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run WaveNet against local stand-ins for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="wavenet_bench")
+    parser.add_argument("--mongomock", action="store_true", help="in-memory database (functional smoke runs, not for numbers)")
+    parser.add_argument("--seed", action="store_true", help="drop and seed the database before serving")
+    parser.add_argument("--manifest", default="bench/manifest.json")
+    seeding.add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+if __name__ == "__main__":
+    main()
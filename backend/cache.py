@@ -0,0 +1,53 @@
+from collections import OrderedDict
+import time
+
+class TTLCache:
+    #* Caché LRU acotada en memoria, cada entrada expira pasado su TTL
+    #? No es thread-safe, está pensada para usarse desde el event loop
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            #? La entrada expiró, la eliminamos y la contamos como un miss
+            del self._data[key]
+            self.misses += 1
+            return default
+        #* Marcamos la entrada como la más reciente para el LRU
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        #* El TTL de una entrada puede ser menor al de la caché (p. ej. el exp de un token), pero nunca mayor
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        #* Si nos pasamos del tamaño máximo, eliminamos las entradas usadas hace más tiempo
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return { "hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize }
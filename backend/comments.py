@@ -0,0 +1,61 @@
+from pymongo import ASCENDING, DESCENDING
+from db import db
+from friends import are_friends
+from pagination import keyset_filter, paginate
+
+#* Comentarios y respuestas en su propia colección, un documento por comentario
+#* { id, fecha, post, parent, content, user, likes, like_count, reply_count }
+#? Las respuestas tienen un solo nivel: parent es None en los comentarios del post y el id del comentario en las respuestas.
+#? El post guarda solo comment_count (con $inc), así las páginas del feed nunca cargan el cuerpo de los comentarios.
+
+def comment_projection(uid: str) -> dict:
+    #* Igual que con los posts, de la lista de likes solo nos interesa si el usuario actual está en ella
+    return {
+        "_id": 0, "id": 1, "fecha": 1, "post": 1, "parent": 1, "content": 1, "user": 1, "like_count": 1, "reply_count": 1,
+        "likes": { "$elemMatch": { "$eq": uid } }
+    }
+
+async def can_view_post(post: dict, uid: str) -> bool:
+    #* Mismas reglas que el feed: posts públicos, propios o de amigos
+    return bool(post.get("public")) or post["user"] == uid or await are_friends(uid, post["user"])
+
+async def add_comment(comment: dict) -> bool:
+    #* Inserta el comentario y actualiza los contadores, retorna False si el comentario al que responde ya no existe
+    if comment["parent"]:
+        #? El $inc sobre el padre confirma que sigue existiendo al momento de escribir (pudo borrarse después de validarlo)
+        result = await db.comments.update_one({ "id": comment["parent"], "post": comment["post"] }, { "$inc": { "reply_count": 1 } })
+        if not result.matched_count:
+            return False
+    await db.comments.insert_one(dict(comment))
+    await db.posts.update_one({ "id": comment["post"] }, { "$inc": { "comment_count": 1 } })
+    return True
+
+async def delete_comment(comment: dict) -> int:
+    #* Elimina el comentario junto con sus respuestas y descuenta todos ellos del post, retorna cuántos se eliminaron
+    result = await db.comments.delete_one({ "id": comment["id"] })
+    if not result.deleted_count:
+        return 0
+    deleted = 1
+    if comment.get("parent"):
+        await db.comments.update_one({ "id": comment["parent"] }, { "$inc": { "reply_count": -1 } })
+    else:
+        deleted += (await db.comments.delete_many({ "post": comment["post"], "parent": comment["id"] })).deleted_count
+    await db.posts.update_one({ "id": comment["post"] }, { "$inc": { "comment_count": -deleted } })
+    return deleted
+
+async def delete_post_comments(post_id: str):
+    await db.comments.delete_many({ "post": post_id })
+
+async def get_comments_page(post_id: str, parent, limit: int, cursor=None, projection: dict = None):
+    #* Comentarios de un post (los más recientes primero) o respuestas a un comentario (en orden de llegada), retorna (comentarios, next_cursor)
+    #? Ambos recorren el índice (post, parent, fecha, id), en una u otra dirección
+    descending = parent is None
+    query = { "post": post_id, "parent": parent }
+    if cursor:
+        query.update(keyset_filter(cursor, descending=descending))
+    order = DESCENDING if descending else ASCENDING
+    comments = await db.comments.find(query, projection or { "_id": 0, "likes": 0 }) \
+        .sort([("fecha", order), ("id", order)]) \
+        .limit(limit + 1) \
+        .to_list(length=None)
+    return paginate(comments, limit)
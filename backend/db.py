@@ -1,5 +1,49 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from env_handler import env
+from indexes import apply_indexes
+from metrics import MongoCommandListener
 
-client = MongoClient(env.DB_URL)
-db = client[env.DB_NAME]
\ No newline at end of file
+#* Cliente asíncrono, las consultas se hacen con await y no bloquean el event loop
+#? Motor enlaza el cliente al event loop en la primera operación, por lo que se puede crear al importar
+client = AsyncIOMotorClient(
+    env.DB_URL,
+    maxPoolSize=env.DB_MAX_POOL_SIZE,
+    minPoolSize=env.DB_MIN_POOL_SIZE,
+    maxIdleTimeMS=env.DB_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=env.DB_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=env.DB_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=env.DB_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=env.DB_SOCKET_TIMEOUT_MS,
+    #* Tiempo de cada comando por colección y operación (ver metrics.py)
+    event_listeners=[MongoCommandListener()],
+)
+
+class DatabaseProxy:
+    #* Referencia a la base de datos en uso, todos los módulos importan este mismo objeto
+    #? Permite que create_app (p. ej. en las pruebas de carga) cambie la base de datos sin tocar cada import
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+    def __getitem__(self, name):
+        return self._database[name]
+
+db = DatabaseProxy(client[env.DB_NAME])
+
+def use_database(database, database_client=None):
+    #* Reemplaza la base de datos de la aplicación (una de Motor o un reemplazo compatible, como mongomock_motor)
+    global client
+    db._database = database
+    if database_client is not None:
+        client = database_client
+
+async def ensure_indexes():
+    #* Los índices se declaran en indexes.py, acá solo se aplican al arrancar
+    #? create_indexes es idempotente, por lo que se puede llamar en cada arranque sin problemas
+    return await apply_indexes(db)
+
+def close_client():
+    #* Cerramos las conexiones del pool al apagar la aplicación
+    client.close()
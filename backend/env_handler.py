@@ -1,14 +1,88 @@
 from dotenv import load_dotenv
+from types import SimpleNamespace
 import os
 
 # Load environment variables from the .env file (if present)
 load_dotenv()
 
 # Access environment variables as if they came from the actual environment
-env = {
+env = SimpleNamespace(**{
     "DB_URL": os.getenv('DATABASE_URL'),
     "DB_NAME": os.getenv('DB_NAME'),
+    # Connection pool and timeouts for the Mongo client (milliseconds)
+    "DB_MAX_POOL_SIZE": int(os.getenv('DB_MAX_POOL_SIZE', 100)),
+    "DB_MIN_POOL_SIZE": int(os.getenv('DB_MIN_POOL_SIZE', 0)),
+    "DB_MAX_IDLE_TIME_MS": int(os.getenv('DB_MAX_IDLE_TIME_MS', 60000)),
+    "DB_WAIT_QUEUE_TIMEOUT_MS": int(os.getenv('DB_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+    "DB_SERVER_SELECTION_TIMEOUT_MS": int(os.getenv('DB_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    "DB_CONNECT_TIMEOUT_MS": int(os.getenv('DB_CONNECT_TIMEOUT_MS', 5000)),
+    "DB_SOCKET_TIMEOUT_MS": int(os.getenv('DB_SOCKET_TIMEOUT_MS', 10000)),
+    # Firebase ID token verification
+    "FIREBASE_PROJECT_ID": os.getenv('FIREBASE_PROJECT_ID'),
+    "TOKEN_CACHE_SIZE": int(os.getenv('TOKEN_CACHE_SIZE', 10000)),
+    "TOKEN_CACHE_TTL": int(os.getenv('TOKEN_CACHE_TTL', 3600)),
+    # Write-behind persistence of chat messages
+    "MESSAGE_FLUSH_INTERVAL_MS": int(os.getenv('MESSAGE_FLUSH_INTERVAL_MS', 50)),
+    "MESSAGE_BATCH_SIZE": int(os.getenv('MESSAGE_BATCH_SIZE', 500)),
+    # Author profiles cache used when hydrating posts, messages and chats
+    "PROFILE_CACHE_SIZE": int(os.getenv('PROFILE_CACHE_SIZE', 10000)),
+    "PROFILE_CACHE_TTL": int(os.getenv('PROFILE_CACHE_TTL', 60)),
+    # Home timelines: entries kept per user and the friend count above which an author's posts are pulled instead of fanned out
+    "TIMELINE_CAP": int(os.getenv('TIMELINE_CAP', 800)),
+    "TIMELINE_FANOUT_LIMIT": int(os.getenv('TIMELINE_FANOUT_LIMIT', 5000)),
+    # Confirmed chat memberships, checked when a socket joins a chat room
+    "CHAT_MEMBER_CACHE_SIZE": int(os.getenv('CHAT_MEMBER_CACHE_SIZE', 50000)),
+    "CHAT_MEMBER_CACHE_TTL": int(os.getenv('CHAT_MEMBER_CACHE_TTL', 600)),
+    # Responses smaller than this (bytes) are sent uncompressed
+    "COMPRESSION_MIN_SIZE": int(os.getenv('COMPRESSION_MIN_SIZE', 1000)),
+    # Characters of the last message kept in each chat inbox summary
+    "INBOX_PREVIEW_LENGTH": int(os.getenv('INBOX_PREVIEW_LENGTH', 120)),
+    # Deepest result reachable when paging through relevance-ranked post search
+    "SEARCH_MAX_RESULTS": int(os.getenv('SEARCH_MAX_RESULTS', 500)),
+    # Logging and instrumentation: slow request/query thresholds (ms, 0 disables) and the share of requests profiled with pyinstrument
+    "LOG_LEVEL": os.getenv('LOG_LEVEL', 'INFO'),
+    "SLOW_REQUEST_MS": int(os.getenv('SLOW_REQUEST_MS', 1000)),
+    "DB_SLOW_QUERY_MS": int(os.getenv('DB_SLOW_QUERY_MS', 100)),
+    "PROFILE_SAMPLE_RATE": float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+    "METRICS_REFRESH_SECONDS": float(os.getenv('METRICS_REFRESH_SECONDS', 5)),
     "CYPH_SECRET_KEY": os.getenv('CYPH_SECRET_KEY'),
+    # In-process cache of encrypted wavebonds, keyed by (uid, version)
+    "WAVEBOND_CACHE_SIZE": int(os.getenv('WAVEBOND_CACHE_SIZE', 10000)),
+    "WAVEBOND_CACHE_TTL": int(os.getenv('WAVEBOND_CACHE_TTL', 3600)),
+    # Socket.IO across several worker processes: message queue for emits (redis:// or amqp://) and shared room membership store (redis://, required whenever the message queue is set)
+    "SOCKETIO_MESSAGE_QUEUE": os.getenv('SOCKETIO_MESSAGE_QUEUE'),
+    "PRESENCE_URL": os.getenv('PRESENCE_URL', os.getenv('SOCKETIO_MESSAGE_QUEUE')),
+    # Admission control: request/upload size limits (bytes), in-flight upload bytes per process and the message queue depth at which chat messages are refused
+    "MAX_REQUEST_BYTES": int(os.getenv('MAX_REQUEST_BYTES', 50 * 1024 * 1024)),
+    "UPLOAD_MAX_FILE_BYTES": int(os.getenv('UPLOAD_MAX_FILE_BYTES', 10 * 1024 * 1024)),
+    "UPLOAD_MAX_FILES": int(os.getenv('UPLOAD_MAX_FILES', 10)),
+    "UPLOAD_INFLIGHT_BYTES": int(os.getenv('UPLOAD_INFLIGHT_BYTES', 128 * 1024 * 1024)),
+    "SOCKET_MAX_PAYLOAD_BYTES": int(os.getenv('SOCKET_MAX_PAYLOAD_BYTES', 5 * 1024 * 1024)),
+    "MESSAGE_MAX_LENGTH": int(os.getenv('MESSAGE_MAX_LENGTH', 4000)),
+    "MESSAGE_QUEUE_LIMIT": int(os.getenv('MESSAGE_QUEUE_LIMIT', 50000)),
+    # Per-user token buckets: sustained rate (per second, 0 disables) and burst size for posts, likes and chat messages
+    "POST_RATE": float(os.getenv('POST_RATE', 0.2)),
+    "POST_BURST": int(os.getenv('POST_BURST', 5)),
+    "LIKE_RATE": float(os.getenv('LIKE_RATE', 2)),
+    "LIKE_BURST": int(os.getenv('LIKE_BURST', 30)),
+    "SOCKET_MESSAGE_RATE": float(os.getenv('SOCKET_MESSAGE_RATE', 5)),
+    "SOCKET_MESSAGE_BURST": int(os.getenv('SOCKET_MESSAGE_BURST', 20)),
+    "RATE_LIMIT_KEYS": int(os.getenv('RATE_LIMIT_KEYS', 100000)),
     "IMGDB_KEY": os.getenv('IMGDB_KEY'),
     "IMGDB_URL": os.getenv('IMGDB_URL'),
-}
\ No newline at end of file
+    # Image uploads: global concurrency, timeouts (seconds) and retries with exponential backoff
+    "UPLOAD_CONCURRENCY": int(os.getenv('UPLOAD_CONCURRENCY', 8)),
+    "UPLOAD_TIMEOUT": float(os.getenv('UPLOAD_TIMEOUT', 30)),
+    "UPLOAD_CONNECT_TIMEOUT": float(os.getenv('UPLOAD_CONNECT_TIMEOUT', 5)),
+    "UPLOAD_RETRIES": int(os.getenv('UPLOAD_RETRIES', 2)),
+    "UPLOAD_BACKOFF": float(os.getenv('UPLOAD_BACKOFF', 0.5)),
+    # Content-addressed cache of uploaded images: in-process LRU size and URL lifetime (seconds)
+    "IMAGE_CACHE_SIZE": int(os.getenv('IMAGE_CACHE_SIZE', 5000)),
+    "IMAGE_URL_TTL": int(os.getenv('IMAGE_URL_TTL', 30 * 24 * 3600)),
+    # Image processing before upload: max dimensions (px), thumbnail size (px), WebP quality, worker processes and the total pixels of all frames of an animation (larger ones are scaled down)
+    "IMAGE_MAX_SIZE": int(os.getenv('IMAGE_MAX_SIZE', 1600)),
+    "IMAGE_THUMBNAIL_SIZE": int(os.getenv('IMAGE_THUMBNAIL_SIZE', 320)),
+    "IMAGE_QUALITY": int(os.getenv('IMAGE_QUALITY', 80)),
+    "IMAGE_WORKERS": int(os.getenv('IMAGE_WORKERS', 2)),
+    "IMAGE_MAX_ANIMATION_PIXELS": int(os.getenv('IMAGE_MAX_ANIMATION_PIXELS', 20_000_000)),
+})
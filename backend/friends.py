@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from pymongo import UpdateOne, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from uuid import NAMESPACE_URL, uuid5
+from cache import TTLCache
+from db import db
+from inbox import open_operations
+from env_handler import env
+from models import Chat
+from pagination import keyset_filter, paginate
+
+#* Las amistades se guardan como aristas dirigidas { user, friend, fecha } en la colección friendships (una por cada sentido)
+#? Índices: (user, friend) único para que las escrituras sean idempotentes, y (user, fecha, friend) para paginar los amigos
+
+def chat_id_for(uid: str, other_uid: str) -> str:
+    #* El id del chat entre dos usuarios es determinista, así dos canjes simultáneos nunca crean dos chats
+    return str(uuid5(NAMESPACE_URL, "wavenet:chat:" + ":".join(sorted([uid, other_uid]))))
+
+def _only_duplicates(error: BulkWriteError) -> bool:
+    return all(e.get("code") == 11000 for e in error.details.get("writeErrors", []))
+
+async def add_friendship(uid: str, other_uid: str) -> bool:
+    #* Crea la amistad y el chat entre ambos usuarios, retorna False si ya eran amigos
+    #? Todas las escrituras son upserts o $addToSet, así que repetirlas (o correrlas en paralelo) no duplica ni pisa nada
+    now = datetime.now(timezone.utc)
+    try:
+        result = await db.friendships.bulk_write([
+            UpdateOne({ "user": uid, "friend": other_uid }, { "$setOnInsert": { "fecha": now } }, upsert=True),
+            UpdateOne({ "user": other_uid, "friend": uid }, { "$setOnInsert": { "fecha": now } }, upsert=True),
+        ], ordered=False)
+        created = result.upserted_count > 0
+    except BulkWriteError as e:
+        #? Un canje concurrente insertó la misma arista primero
+        if not _only_duplicates(e):
+            raise
+        created = e.details.get("nUpserted", 0) > 0
+    if not created:
+        return False
+
+    #* Mantenemos users.friends con $addToSet (sin reescribir el arreglo) para quienes todavía lo leen
+    await db.users.bulk_write([
+        UpdateOne({ "uid": uid }, { "$addToSet": { "friends": other_uid } }),
+        UpdateOne({ "uid": other_uid }, { "$addToSet": { "friends": uid } }),
+    ], ordered=False)
+    chat = Chat(id=chat_id_for(uid, other_uid), users=[uid, other_uid]).model_dump()
+    chat_id = chat.pop("id")
+    try:
+        await db.chat.update_one({ "id": chat_id }, { "$setOnInsert": chat }, upsert=True)
+    except DuplicateKeyError:
+        #? Otro canje simultáneo (del otro sentido) creó el chat primero
+        pass
+    #* Cada uno recibe el chat en su bandeja
+    try:
+        await db.inbox.bulk_write(open_operations(chat_id, [uid, other_uid], now), ordered=False)
+    except BulkWriteError as e:
+        if not _only_duplicates(e):
+            raise
+    return True
+
+async def are_friends(uid: str, other_uid: str) -> bool:
+    return await db.friendships.find_one({ "user": uid, "friend": other_uid }, { "_id": 1 }) is not None
+
+#* Membresías de chat ya confirmadas (chat, uid), para no consultar db.chat cada vez que alguien entra a un room
+#? Solo se guardan las positivas: un chat recién creado debe poder abrirse de inmediato
+_chat_members = TTLCache(env.CHAT_MEMBER_CACHE_SIZE, env.CHAT_MEMBER_CACHE_TTL)
+
+async def is_chat_member(chat_id: str, uid: str) -> bool:
+    if _chat_members.get((chat_id, uid)):
+        return True
+    if await db.chat.find_one({ "id": chat_id, "users": uid }, { "_id": 1 }) is None:
+        return False
+    _chat_members.set((chat_id, uid), True)
+    return True
+
+async def get_friend_uids(uid: str) -> list:
+    return [edge["friend"] async for edge in db.friendships.find({ "user": uid }, { "_id": 0, "friend": 1 })]
+
+async def get_friends_page(uid: str, limit: int, cursor=None):
+    #* Página de amigos (los más recientes primero) servida desde el índice de aristas, retorna (uids, next_cursor)
+    query = { "user": uid }
+    if cursor:
+        query.update(keyset_filter(cursor, key="friend"))
+    edges = await db.friendships.find(query, { "_id": 0, "friend": 1, "fecha": 1 }) \
+        .sort([("fecha", DESCENDING), ("friend", DESCENDING)]) \
+        .limit(limit + 1) \
+        .to_list(length=None)
+    edges, next_cursor = paginate(edges, limit, key="friend")
+    return [edge["friend"] for edge in edges], next_cursor
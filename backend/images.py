@@ -0,0 +1,252 @@
+from cache import TTLCache
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from db import db
+from env_handler import env
+from metrics import UPLOAD_SECONDS
+from PIL import Image, ImageOps, ImageSequence, UnidentifiedImageError
+import asyncio
+import hashlib
+import httpx
+import io
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger(__name__)
+
+class UploadError(Exception):
+    pass
+
+class InvalidImageError(Exception):
+    pass
+
+#* Formatos de entrada aceptados, todo se vuelve a codificar como WebP
+ALLOWED_FORMATS = { "JPEG", "PNG", "WEBP", "GIF", "BMP" }
+
+#* Límite global de subidas simultáneas a ImgBB, compartido por todas las peticiones del proceso
+_upload_slots = asyncio.Semaphore(env.UPLOAD_CONCURRENCY)
+_client = None
+_process_pool = None
+
+#* Caché de imágenes ya subidas indexada por el hash de su contenido: LRU en memoria delante de la colección images
+_url_cache = TTLCache(env.IMAGE_CACHE_SIZE, env.IMAGE_URL_TTL)
+#? Subidas en curso por hash, si llegan los mismos bytes a la vez se espera a la primera en vez de subirlos dos veces
+_inflight = {}
+image_cache_stats = { "memory_hits": 0, "db_hits": 0, "misses": 0 }
+
+def _get_client() -> httpx.AsyncClient:
+    #* Cliente HTTP con pool de conexiones, se crea una sola vez y se reutiliza entre subidas
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(env.UPLOAD_TIMEOUT, connect=env.UPLOAD_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=env.UPLOAD_CONCURRENCY, max_keepalive_connections=env.UPLOAD_CONCURRENCY),
+        )
+    return _client
+
+async def close_upload_client():
+    global _client, _process_pool
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+def _encode_webp(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+def _read_animation(source, max_pixels: int) -> tuple:
+    #* Retorna (cuadros, duraciones, loop) de una imagen animada, cada cuadro ya compuesto sobre los anteriores (Pillow lo hace al recorrerlos)
+    #? Una animación larga y grande ocuparía mucha memoria en el worker, así que los cuadros se reducen hasta que
+    #? la suma de sus píxeles no pase de max_pixels
+    scale = min(1.0, (max_pixels / (source.n_frames * source.width * source.height)) ** 0.5)
+    size = (max(int(source.width * scale), 1), max(int(source.height * scale), 1))
+    frames = []
+    durations = []
+    for frame in ImageSequence.Iterator(source):
+        durations.append(frame.info.get("duration", 100))
+        frame = frame.convert("RGBA")
+        if scale < 1:
+            frame = frame.resize(size, Image.LANCZOS)
+        frame.info = {}
+        frames.append(frame)
+    return frames, durations, source.info.get("loop", 0)
+
+def _encode_animation(frames: list, durations: list, loop: int, size: tuple, quality: int) -> bytes:
+    resized = []
+    for frame in frames:
+        frame = frame.copy()
+        frame.thumbnail(size, Image.LANCZOS)
+        resized.append(frame)
+    buffer = io.BytesIO()
+    resized[0].save(buffer, "WEBP", save_all=True, append_images=resized[1:], duration=durations, loop=loop, quality=quality, method=4)
+    return buffer.getvalue()
+
+def _process_image(data: bytes, max_size: tuple, thumbnail_size: tuple, quality: int, max_animation_pixels: int) -> tuple:
+    #! Corre en un proceso aparte, por lo que no puede usar nada del event loop
+    animation = None
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            if source.format not in ALLOWED_FORMATS:
+                raise InvalidImageError(f"Unsupported image format: {source.format}")
+            if getattr(source, "is_animated", False):
+                #* Los GIF (y WebP o PNG) animados se conservan animados, como WebP animado, en vez de quedarse con el primer cuadro
+                animation = _read_animation(source, max_animation_pixels)
+            else:
+                #* Aplicamos la orientación EXIF antes de descartar los metadatos para que la imagen no quede rotada
+                image = ImageOps.exif_transpose(source)
+                image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        raise InvalidImageError(f"Invalid image: {e}")
+    if animation:
+        frames, durations, loop = animation
+        return _encode_animation(frames, durations, loop, max_size, quality), _encode_animation(frames, durations, loop, thumbnail_size, quality)
+    #? Al volver a codificar sin pasar exif/icc_profile la imagen final no lleva metadatos
+    image.info = {}
+    image.thumbnail(max_size, Image.LANCZOS)
+    full = _encode_webp(image, quality)
+    image.thumbnail(thumbnail_size, Image.LANCZOS)
+    thumbnail = _encode_webp(image, quality)
+    return full, thumbnail
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        #! Con fork (el método por defecto en Linux) los workers heredarían una copia del proceso con el event loop,
+        #! los hilos de Motor y sus locks a medio tomar, y pueden quedar bloqueados. spawn arranca cada worker desde cero
+        _process_pool = ProcessPoolExecutor(max_workers=env.IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+async def process_image(data: bytes) -> tuple:
+    #* Valida la imagen, descarta sus metadatos, la reduce a IMAGE_MAX_SIZE y la codifica como WebP junto a su miniatura
+    #* (las imágenes animadas quedan como WebP animado)
+    #? Decodificar imágenes es pesado, así que se hace en un pool de procesos y el event loop sigue atendiendo
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_process_pool(), _process_image, data,
+        (env.IMAGE_MAX_SIZE, env.IMAGE_MAX_SIZE), (env.IMAGE_THUMBNAIL_SIZE, env.IMAGE_THUMBNAIL_SIZE), env.IMAGE_QUALITY,
+        env.IMAGE_MAX_ANIMATION_PIXELS
+    )
+
+def _hash_image(image) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        digest.update(image)
+    else:
+        image.seek(0)
+        for chunk in iter(lambda: image.read(1 << 16), b""):
+            digest.update(chunk)
+        image.seek(0)
+    return digest.hexdigest()
+
+def image_cache_hit_rate() -> float:
+    hits = image_cache_stats["memory_hits"] + image_cache_stats["db_hits"]
+    total = hits + image_cache_stats["misses"]
+    return hits / total if total else 0.0
+
+async def upload_image(image) -> str:
+    #* Sube una imagen a ImgBB y retorna su URL, si esos mismos bytes ya se subieron se retorna la URL existente sin tocar la red
+    #? image puede ser bytes o un archivo (p. ej. UploadFile.file), en cuyo caso se envía por partes sin cargarlo completo en memoria
+    digest = await asyncio.to_thread(_hash_image, image)
+    url = _url_cache.get(digest)
+    if url:
+        image_cache_stats["memory_hits"] += 1
+        return url
+    if digest in _inflight:
+        return await asyncio.shield(_inflight[digest])
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[digest] = future
+    try:
+        url = await _lookup_or_upload(digest, image)
+        future.set_result(url)
+        return url
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        #? Marcamos la excepción como recuperada por si nadie más estaba esperando esta subida
+        future.exception()
+        raise
+    finally:
+        del _inflight[digest]
+
+async def _lookup_or_upload(digest: str, image) -> str:
+    now = datetime.now(timezone.utc)
+    stored = await db.images.find_one({ "hash": digest, "expires_at": { "$gt": now } }, { "_id": 0, "url": 1, "expires_at": 1 })
+    if stored:
+        image_cache_stats["db_hits"] += 1
+        expires_at = stored["expires_at"].replace(tzinfo=timezone.utc)
+        _url_cache.set(digest, stored["url"], ttl=(expires_at - now).total_seconds())
+        return stored["url"]
+
+    image_cache_stats["misses"] += 1
+    data = await _upload(image)
+    #* Las URLs se dan por vencidas pasado IMAGE_URL_TTL, o antes si ImgBB indica que la imagen expira
+    ttl = env.IMAGE_URL_TTL
+    expiration = int(data.get("expiration") or 0)
+    if expiration > 0:
+        ttl = min(ttl, expiration)
+    await db.images.update_one(
+        { "hash": digest },
+        { "$set": { "url": data["url"], "fecha": now, "expires_at": now + timedelta(seconds=ttl) } },
+        upsert=True
+    )
+    _url_cache.set(digest, data["url"], ttl=ttl)
+    return data["url"]
+
+async def forget_image(url: str):
+    #* Para cuando se detecta que una URL ya no sirve: la siguiente subida de esos bytes vuelve a ImgBB
+    async for stored in db.images.find({ "url": url }, { "_id": 0, "hash": 1 }):
+        _url_cache.pop(stored["hash"])
+    await db.images.delete_many({ "url": url })
+
+async def _upload(image) -> dict:
+    client = _get_client()
+    async with _upload_slots:
+        error = None
+        for attempt in range(env.UPLOAD_RETRIES + 1):
+            if attempt:
+                #* Reintentamos con backoff exponencial
+                await asyncio.sleep(env.UPLOAD_BACKOFF * 2 ** (attempt - 1))
+            if hasattr(image, "seek"):
+                image.seek(0)
+            started = time.perf_counter()
+            try:
+                response = await client.post(env.IMGDB_URL, data={ "key": env.IMGDB_KEY }, files={ "image": ("image", image) })
+            except httpx.TransportError as e:
+                #? Incluye timeouts y errores de conexión, se pueden reintentar
+                UPLOAD_SECONDS.labels("transport_error").observe(time.perf_counter() - started)
+                error = e
+                continue
+            UPLOAD_SECONDS.labels(str(response.status_code)).observe(time.perf_counter() - started)
+            #? Los errores 5xx y 429 son temporales, el resto (p. ej. imagen inválida) no tiene sentido reintentarlos
+            if response.status_code >= 500 or response.status_code == 429:
+                error = UploadError(f"ImgBB responded with {response.status_code}")
+                continue
+            if response.status_code >= 400:
+                raise UploadError(f"ImgBB rejected the image ({response.status_code})")
+            try:
+                data = response.json()["data"]
+            except (ValueError, KeyError, TypeError):
+                data = None
+            if not isinstance(data, dict) or not data.get("url"):
+                raise UploadError("Unexpected response from ImgBB")
+            return data
+        logger.warning("Image upload failed after %d attempts: %s", env.UPLOAD_RETRIES + 1, error)
+        raise UploadError("Image upload failed") from error
+
+async def upload_images(images: list) -> list:
+    #* Sube varias imágenes en paralelo (respetando el límite global) y retorna sus URLs en el mismo orden
+    return list(await asyncio.gather(*(upload_image(image) for image in images)))
+
+async def process_and_upload(file) -> dict:
+    #* Etapa completa para un UploadFile: procesar, y subir la imagen y su miniatura en paralelo
+    full, thumbnail = await process_image(await file.read())
+    url, thumbnail_url = await upload_images([full, thumbnail])
+    return { "url": url, "thumbnail": thumbnail_url }
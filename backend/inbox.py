@@ -0,0 +1,75 @@
+from pymongo import UpdateMany, UpdateOne, DESCENDING
+from db import db
+from env_handler import env
+from pagination import keyset_filter, paginate
+
+#* Bandeja de chats: un resumen por (participante, chat) en la colección inbox
+#* { owner, chat, peer, last_activity, last_message: { id, fecha, content, files, user }, unread }
+#? Se mantiene de forma incremental al escribir los mensajes, así la lista de chats es una sola consulta paginada
+#? sobre el índice (owner, last_activity, chat) sin tocar los chats ni los mensajes.
+
+INBOX_PROJECTION = { "_id": 0, "chat": 1, "peer": 1, "last_activity": 1, "last_message": 1, "unread": 1 }
+
+def preview_of(message: dict) -> dict:
+    #* Vista previa del último mensaje, con el contenido recortado
+    return {
+        "id": message["id"],
+        "fecha": message["fecha"],
+        "content": message["content"][:env.INBOX_PREVIEW_LENGTH],
+        "files": message.get("files") or "",
+        "user": message["user"],
+    }
+
+def open_operations(chat_id: str, users: list, now) -> list:
+    #* Un resumen vacío por participante, idempotente para poder repetirse al crear el chat
+    return [
+        UpdateOne(
+            { "chat": chat_id, "owner": owner },
+            { "$setOnInsert": {
+                "peer": next((user for user in users if user != owner), owner),
+                "last_activity": now,
+                "last_message": None,
+                "unread": 0,
+            } },
+            upsert=True
+        )
+        for owner in users
+    ]
+
+def message_operations(batch: list, readers: dict = None) -> list:
+    #* Actualizaciones de la bandeja para un lote de mensajes: una vista previa por chat y un $inc de no leídos por autor
+    #* readers: id del mensaje -> uids que estaban en el room al enviarlo (ya lo vieron en vivo)
+    last_messages = {}
+    counts = {}
+    for message in batch:
+        last_messages[message["chat"]] = message
+        seen = { message["user"], *(readers or {}).get(message["id"], ()) }
+        key = (message["chat"], tuple(sorted(seen)))
+        counts[key] = counts.get(key, 0) + 1
+    operations = [
+        UpdateMany(
+            { "chat": chat, "last_activity": { "$lte": message["fecha"] } },
+            { "$set": { "last_message": preview_of(message), "last_activity": message["fecha"] } }
+        )
+        for chat, message in last_messages.items()
+    ]
+    #? Los mensajes propios no cuentan como no leídos, tampoco los que el participante recibió con el chat abierto
+    operations.extend(
+        UpdateMany({ "chat": chat, "owner": { "$nin": list(seen) } }, { "$inc": { "unread": count } })
+        for (chat, seen), count in counts.items()
+    )
+    return operations
+
+async def mark_read(chat_id: str, uid: str):
+    await db.inbox.update_one({ "chat": chat_id, "owner": uid, "unread": { "$ne": 0 } }, { "$set": { "unread": 0 } })
+
+async def get_inbox_page(uid: str, limit: int, cursor=None):
+    #* Chats del usuario con actividad más reciente primero, retorna (resúmenes, next_cursor)
+    query = { "owner": uid }
+    if cursor:
+        query.update(keyset_filter(cursor, field="last_activity", key="chat"))
+    entries = await db.inbox.find(query, INBOX_PROJECTION) \
+        .sort([("last_activity", DESCENDING), ("chat", DESCENDING)]) \
+        .limit(limit + 1) \
+        .to_list(length=None)
+    return paginate(entries, limit, field="last_activity", key="chat")
@@ -0,0 +1,228 @@
+#* Registro declarativo de los índices de la base de datos, y revisión de los planes de las consultas de la aplicación.
+#? Uso: python indexes.py          -> crea los índices que falten (lo mismo que se hace al arrancar la aplicación)
+#?      python indexes.py check    -> además corre explain() sobre cada consulta de QUERIES y falla si alguna
+#?                                    recorre la colección completa (COLLSCAN) u ordena en memoria (SORT)
+#? Lo mismo corre en las pruebas (tests/test_indexes.py), junto con las consultas que envían las rutas, si se define WAVENET_TEST_MONGO_URL
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+import asyncio
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+#* Códigos de error al crear un índice que ya existe con otras opciones (p. ej. un índice que pasa a ser único)
+INDEX_CONFLICT_CODES = { 85, 86 }
+
+INDEXES = {
+    "users": [
+        #* Búsquedas por uid, username y email (incluido el $or de check_if_user_exists), únicos como lo indica el modelo
+        IndexModel("uid", unique=True),
+        IndexModel("username", unique=True),
+        IndexModel("email", unique=True),
+        #* Búsqueda de usuarios por prefijo, sin distinguir mayúsculas
+        IndexModel([("username_lower", ASCENDING), ("uid", ASCENDING)]),
+    ],
+    "posts": [
+        IndexModel("id", unique=True),
+        #* Índices compuestos del feed, cubren el filtro, el orden (fecha, id) y el cursor de paginación
+        IndexModel([("user", ASCENDING), ("fecha", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("public", ASCENDING), ("fecha", DESCENDING), ("id", DESCENDING)]),
+        #* Búsqueda de texto, un acierto en el título pesa más que en el contenido
+        #? Sin idioma por defecto (sin stemming ni stop words) porque los posts mezclan español e inglés
+        IndexModel([("title", "text"), ("content", "text")], weights={ "title": 3, "content": 1 }, default_language="none"),
+    ],
+    "comments": [
+        IndexModel("id", unique=True),
+        #* Hilos de comentarios y de respuestas de un post, paginados por (fecha, id); también sirve para borrar los de un post
+        IndexModel([("post", ASCENDING), ("parent", ASCENDING), ("fecha", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "messages": [
+        #* Historial de mensajes de un chat, paginado por (fecha, id) en ambas direcciones
+        IndexModel([("chat", ASCENDING), ("fecha", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "chat": [
+        IndexModel("id", unique=True),
+    ],
+    "inbox": [
+        #* Bandeja de chats: un resumen por (chat, participante), listado por actividad reciente
+        IndexModel([("chat", ASCENDING), ("owner", ASCENDING)], unique=True),
+        IndexModel([("owner", ASCENDING), ("last_activity", DESCENDING), ("chat", DESCENDING)]),
+    ],
+    "images": [
+        #* Caché de imágenes por hash de contenido, las URLs vencidas se eliminan solas con el índice TTL
+        IndexModel("hash", unique=True),
+        IndexModel("url"),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+    "wavebonds": [
+        #* Canje de wavebonds: búsqueda directa por (usuario, versión)
+        IndexModel([("user", ASCENDING), ("version", ASCENDING)], unique=True),
+    ],
+    "friendships": [
+        #* Amistades como aristas: únicas por par (escrituras idempotentes) y paginables por fecha
+        IndexModel([("user", ASCENDING), ("friend", ASCENDING)], unique=True),
+        IndexModel([("user", ASCENDING), ("fecha", DESCENDING), ("friend", DESCENDING)]),
+        #* Aristas que apuntan a un autor, para marcarlas cuando sus posts pasan a leerse al armar el feed
+        IndexModel("friend"),
+        #? Amigos cuyos posts se leen al armar el feed en vez de repartirse (autores con demasiados amigos)
+        IndexModel([("user", ASCENDING), ("pull", ASCENDING)], partialFilterExpression={ "pull": True }),
+    ],
+    "timelines": [
+        #* Timelines precalculados: uno por usuario, y las entradas indexadas para quitar un post borrado de todos ellos
+        IndexModel("owner", unique=True),
+        IndexModel("entries.id"),
+    ],
+}
+
+def _restore_model(name: str, info: dict) -> IndexModel:
+    #* Arma un IndexModel a partir de la especificación de un índice existente (index_information)
+    options = { option: value for option, value in info.items() if option not in ("key", "v", "ns") }
+    return IndexModel(info["key"], name=name, **options)
+
+async def _create(collection, model: IndexModel):
+    try:
+        await collection.create_indexes([model])
+    except OperationFailure as e:
+        if e.code not in INDEX_CONFLICT_CODES:
+            raise
+        await _replace(collection, model)
+
+async def _replace(collection, model: IndexModel):
+    #* Ya existe con otras opciones (p. ej. el índice de email antes de ser único), lo reemplazamos
+    #? MongoDB no admite dos índices con las mismas llaves y distintas opciones, así que el anterior se elimina primero.
+    #? Si el nuevo no se puede crear (p. ej. un único con datos duplicados) se vuelve a crear el anterior, para no quedar sin índice
+    name = model.document["name"]
+    keys = list(model.document["key"].items())
+    previous = {
+        index_name: info for index_name, info in (await collection.index_information()).items()
+        if index_name == name or list(info["key"]) == keys
+    }
+    for index_name in previous:
+        logger.warning("Replacing index %s.%s", collection.name, index_name)
+        await collection.drop_index(index_name)
+    try:
+        await collection.create_indexes([model])
+    except OperationFailure:
+        await collection.create_indexes([_restore_model(index_name, info) for index_name, info in previous.items()])
+        raise
+
+async def apply_indexes(db) -> list:
+    #* Crea todos los índices del registro, es idempotente y se puede llamar en cada arranque
+    #? Si un índice no se puede crear (p. ej. un único con datos duplicados) se registra el error y se sigue con el resto,
+    #? la aplicación funciona igual aunque más lenta. Retorna la lista de índices que fallaron.
+    failed = []
+    for name, models in INDEXES.items():
+        for model in models:
+            try:
+                await _create(db[name], model)
+            except OperationFailure as e:
+                logger.error("Could not create index %s.%s: %s", name, model.document["name"], e)
+                failed.append(f"{name}.{model.document['name']}")
+    return failed
+
+#* Consultas que emite la aplicación, con valores de ejemplo: (colección, filtro, orden)
+SAMPLE = "00000000-0000-0000-0000-000000000000"
+NOW = datetime(2024, 1, 1)
+FEED_ORDER = [("fecha", DESCENDING), ("id", DESCENDING)]
+QUERIES = [
+    ("users", { "uid": SAMPLE }, None),
+    ("users", { "username": SAMPLE }, None),
+    ("users", { "email": SAMPLE }, None),
+    ("users", { "$or": [{ "uid": SAMPLE }, { "email": SAMPLE }, { "username": SAMPLE }] }, None),
+    ("users", { "uid": { "$in": [SAMPLE, "other"] } }, None),
+    ("users", { "email": { "$in": [SAMPLE, "other"] } }, None),
+    ("users", { "username_lower": { "$regex": "^sample" }, "$or": [{ "public_profile": True }, { "uid": { "$in": [SAMPLE] } }] }, [("username_lower", ASCENDING), ("uid", ASCENDING)]),
+    ("posts", { "id": SAMPLE }, None),
+    #? El orden por relevancia de la búsqueda siempre se calcula en memoria sobre los aciertos del índice de texto, solo se revisa el filtro
+    ("posts", { "$text": { "$search": "sample" }, "$or": [{ "public": True }, { "user": { "$in": [SAMPLE] } }] }, None),
+    ("posts", { "id": { "$in": [SAMPLE, "other"] } }, None),
+    ("posts", { "user": SAMPLE }, FEED_ORDER),
+    ("posts", { "$and": [{ "user": SAMPLE }, { "$or": [{ "fecha": { "$lt": NOW } }, { "fecha": NOW, "id": { "$lt": SAMPLE } }] }] }, FEED_ORDER),
+    ("posts", { "user": { "$in": [SAMPLE, "other"] }, "public": False }, FEED_ORDER),
+    #* Feed pasado el tope del timeline (timeline.get_home_page)
+    ("posts", { "$and": [{ "user": { "$in": [SAMPLE, "other"] }, "public": False }, { "$or": [{ "fecha": { "$lt": NOW } }, { "fecha": NOW, "id": { "$lt": SAMPLE } }] }] }, FEED_ORDER),
+    ("posts", { "$or": [{ "public": True }, { "user": { "$in": [SAMPLE, "other"] } }] }, FEED_ORDER),
+    #* Parte pull del feed con cursor (timeline.get_home_page)
+    ("posts", { "$and": [{ "$or": [{ "public": True }, { "user": { "$in": [SAMPLE, "other"] } }] }, { "$or": [{ "fecha": { "$lt": NOW } }, { "fecha": NOW, "id": { "$lt": SAMPLE } }] }] }, FEED_ORDER),
+    ("comments", { "id": SAMPLE }, None),
+    ("comments", { "id": SAMPLE, "post": SAMPLE }, None),
+    ("comments", { "post": SAMPLE, "parent": None }, FEED_ORDER),
+    ("comments", { "post": SAMPLE, "parent": None, "$or": [{ "fecha": { "$lt": NOW } }, { "fecha": NOW, "id": { "$lt": SAMPLE } }] }, FEED_ORDER),
+    ("comments", { "post": SAMPLE, "parent": SAMPLE }, [("fecha", ASCENDING), ("id", ASCENDING)]),
+    ("comments", { "post": SAMPLE }, None),
+    ("messages", { "chat": SAMPLE }, [("fecha", DESCENDING), ("id", DESCENDING)]),
+    ("messages", { "chat": SAMPLE, "$or": [{ "fecha": { "$lt": NOW } }, { "fecha": NOW, "id": { "$lt": SAMPLE } }] }, [("fecha", DESCENDING), ("id", DESCENDING)]),
+    ("messages", { "chat": SAMPLE, "$or": [{ "fecha": { "$gt": NOW } }, { "fecha": NOW, "id": { "$gt": SAMPLE } }] }, [("fecha", ASCENDING), ("id", ASCENDING)]),
+    ("chat", { "id": SAMPLE }, None),
+    ("chat", { "id": SAMPLE, "users": SAMPLE }, None),
+    ("inbox", { "owner": SAMPLE }, [("last_activity", DESCENDING), ("chat", DESCENDING)]),
+    ("inbox", { "owner": SAMPLE, "$or": [{ "last_activity": { "$lt": NOW } }, { "last_activity": NOW, "chat": { "$lt": SAMPLE } }] }, [("last_activity", DESCENDING), ("chat", DESCENDING)]),
+    ("inbox", { "chat": SAMPLE }, None),
+    ("inbox", { "chat": SAMPLE, "owner": SAMPLE, "unread": { "$ne": 0 } }, None),
+    ("images", { "hash": SAMPLE, "expires_at": { "$gt": NOW } }, None),
+    ("images", { "url": SAMPLE }, None),
+    ("wavebonds", { "user": SAMPLE }, None),
+    ("wavebonds", { "user": SAMPLE, "version": 0.1 }, None),
+    ("wavebonds", { "$or": [{ "user": SAMPLE, "version": 0.1 }, { "user": "other", "version": 0.2 }] }, None),
+    ("friendships", { "user": SAMPLE }, [("fecha", DESCENDING), ("friend", DESCENDING)]),
+    ("friendships", { "user": SAMPLE, "$or": [{ "fecha": { "$lt": NOW } }, { "fecha": NOW, "friend": { "$lt": SAMPLE } }] }, [("fecha", DESCENDING), ("friend", DESCENDING)]),
+    ("friendships", { "user": SAMPLE, "friend": SAMPLE }, None),
+    ("friendships", { "user": SAMPLE, "pull": True }, None),
+    ("friendships", { "user": SAMPLE, "pull": { "$ne": True } }, None),
+    ("friendships", { "friend": SAMPLE, "pull": { "$ne": True } }, None),
+    ("timelines", { "owner": SAMPLE }, None),
+    ("timelines", { "entries.id": SAMPLE }, None),
+]
+
+#* Etapas de un plan que indican que la consulta no usa un índice
+BAD_STAGES = { "COLLSCAN", "SORT" }
+
+def _stages(plan) -> set:
+    #* Recorre el plan ganador (incluidos los del motor SBE) y junta los nombres de todas sus etapas
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= _stages(value)
+    return stages
+
+async def bad_stages(db, name: str, query: dict, sort=None) -> list:
+    #* Etapas problemáticas (COLLSCAN o SORT en memoria) del plan ganador de una consulta
+    cursor = db[name].find(query).limit(20)
+    if sort:
+        cursor = cursor.sort(sort)
+    explanation = await cursor.explain()
+    return sorted(_stages(explanation["queryPlanner"]["winningPlan"]) & BAD_STAGES)
+
+async def check_query_plans(db, queries: list = QUERIES) -> list:
+    #* Retorna [(colección, filtro, etapas problemáticas)] para cada consulta que cae en COLLSCAN o en un SORT en memoria
+    problems = []
+    for name, query, sort in queries:
+        bad = await bad_stages(db, name, query, sort)
+        if bad:
+            problems.append((name, query, bad))
+    return problems
+
+async def main(args: list) -> int:
+    from db import db, close_client
+    failed = await apply_indexes(db)
+    for index in failed:
+        print(f"No se pudo crear el índice {index}")
+    status = 1 if failed else 0
+    if "check" in args:
+        problems = await check_query_plans(db)
+        for name, query, stages in problems:
+            print(f"{name}: {query} -> {', '.join(stages)}")
+        print(f"{len(QUERIES) - len(problems)}/{len(QUERIES)} consultas usan índices")
+        status = 1 if problems else status
+    close_client()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
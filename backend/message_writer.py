@@ -0,0 +1,88 @@
+from pymongo.errors import BulkWriteError, PyMongoError
+from db import db
+from inbox import message_operations
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MessageWriter:
+    #* Cola write-behind para los mensajes del chat
+    #* Los mensajes se emiten al instante y se persisten por lotes: un insert_many por lote y un único bulk_write
+    #* sobre la bandeja (último mensaje y no leídos de cada chat), aunque en ese lote hayan llegado cientos de mensajes al mismo chat.
+    def __init__(self, flush_interval: float = 0.05, batch_size: int = 500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.written = 0
+        self._pending = []
+        self._readers = {}
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = None
+
+    @property
+    def depth(self) -> int:
+        #* Cantidad de mensajes esperando a ser escritos
+        return len(self._pending)
+
+    def enqueue(self, message: dict, readers=()):
+        #* readers: uids conectados al room cuando se envió el mensaje, para ellos no cuenta como no leído
+        self._pending.append(message)
+        if readers:
+            self._readers[message["id"]] = readers
+        #? Si ya se juntó un lote completo no esperamos al intervalo
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            if not await self._write(batch):
+                #? Si la base de datos no responde devolvemos el lote al inicio de la cola y lo reintentamos en el próximo ciclo
+                self._pending[:0] = batch
+                return
+
+    async def _write(self, batch: list) -> bool:
+        #* Armamos las actualizaciones de la bandeja antes de que insert_many le agregue el _id a los mensajes
+        inbox_operations = message_operations(batch, self._readers)
+        try:
+            await db.messages.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            #? Con ordered=False el resto del lote sí se escribe, solo se pierden los documentos inválidos (p. ej. ids duplicados)
+            logger.error("Error writing messages: %s", e.details.get("writeErrors"))
+        except PyMongoError as e:
+            logger.warning("Error writing %d messages, retrying: %s", len(batch), e)
+            return False
+        try:
+            await db.inbox.bulk_write(inbox_operations, ordered=False)
+        except PyMongoError as e:
+            logger.error("Error updating chat inboxes: %s", e)
+        for message in batch:
+            self._readers.pop(message["id"], None)
+        self.written += len(batch)
+        return True
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        #* Al apagar escribimos todo lo que quede en la cola
+        await self.flush()
+        if self._pending:
+            logger.error("Shutting down with %d unwritten messages", len(self._pending))
+
+    def start(self):
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
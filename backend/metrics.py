@@ -0,0 +1,158 @@
+from env_handler import env
+from functools import wraps
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+import asyncio
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+#* Métricas de la aplicación en formato Prometheus, expuestas en /metrics
+#? Con varios workers, prometheus_client junta las métricas de todos los procesos si PROMETHEUS_MULTIPROC_DIR está definido
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+MONGO_SECONDS = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ["collection", "command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+UPLOAD_SECONDS = Histogram(
+    "image_upload_duration_seconds", "ImgBB upload request latency",
+    ["outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+TOKEN_VERIFY_SECONDS = Histogram(
+    "token_verify_duration_seconds", "Firebase ID token verification time (including cache hits)",
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+)
+SOCKET_EVENT_SECONDS = Histogram(
+    "socketio_event_duration_seconds", "Socket.IO event handler time",
+    ["event"],
+)
+SOCKET_CONNECTIONS = Gauge("socketio_connections", "Open Socket.IO connections in this process", multiprocess_mode="livesum")
+SLOW_REQUESTS = Counter("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", ["route"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Work rejected by admission control (rate limits and upload budget)", ["limit"])
+
+def route_of(scope) -> str:
+    #* Usamos la plantilla de la ruta (p. ej. /post/{post_id}) para no crear una serie por cada id
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    if scope.get("path", "").startswith("/socket.io"):
+        return "/socket.io"
+    return "unmatched"
+
+def _start_profiler():
+    #* Perfilador por muestreo opcional (pyinstrument), solo si PROFILE_SAMPLE_RATE > 0
+    if env.PROFILE_SAMPLE_RATE <= 0 or random.random() >= env.PROFILE_SAMPLE_RATE:
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return None
+    profiler = Profiler(async_mode="enabled")
+    profiler.start()
+    return profiler
+
+class MetricsMiddleware:
+    #* Middleware ASGI: latencia por ruta y estado, y registro (con perfil opcional) de las peticiones lentas
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = _start_profiler()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = route_of(scope)
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(elapsed)
+            if profiler is not None:
+                profiler.stop()
+            if env.SLOW_REQUEST_MS and elapsed * 1000 >= env.SLOW_REQUEST_MS:
+                SLOW_REQUESTS.labels(route).inc()
+                logger.warning("Slow request %s %s: %.1f ms", scope["method"], route, elapsed * 1000)
+                if profiler is not None:
+                    logger.warning("Profile of %s %s:\n%s", scope["method"], route, profiler.output_text(unicode=True))
+
+class MongoCommandListener(monitoring.CommandListener):
+    #* Tiempo de cada comando de MongoDB por colección y operación, y registro de las consultas lentas
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._pending[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event, outcome: str):
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1_000_000
+        MONGO_SECONDS.labels(collection, event.command_name, outcome).observe(seconds)
+        if env.DB_SLOW_QUERY_MS and seconds * 1000 >= env.DB_SLOW_QUERY_MS:
+            logger.warning("Slow MongoDB %s on %s: %.1f ms", event.command_name, collection or "-", seconds * 1000)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+def instrument_event(handler):
+    #* Mide el tiempo de un handler de Socket.IO, va debajo de @sio.event (conserva el nombre del evento)
+    @wraps(handler)
+    async def wrapper(*args, **kwargs):
+        with SOCKET_EVENT_SECONDS.labels(handler.__name__).time():
+            return await handler(*args, **kwargs)
+    return wrapper
+
+#* Gauges calculados a partir del estado del proceso, se actualizan con refresh_gauges
+_computed_gauges = []
+
+def gauge_from(name: str, documentation: str, function, multiprocess_mode: str = "livesum"):
+    #* Gauge que se calcula a partir de una función (p. ej. el largo de una cola)
+    #? No se usa set_function: en modo multiproceso (PROMETHEUS_MULTIPROC_DIR) esos gauges no se escriben en los archivos
+    #? compartidos y desaparecen de /metrics. El valor se fija explícitamente al exponer las métricas y periódicamente en
+    #? cada worker (refresh_gauges_forever), así el worker que responde /metrics también ve el valor de los demás
+    gauge = Gauge(name, documentation, multiprocess_mode=multiprocess_mode)
+    _computed_gauges.append((gauge, function))
+    return gauge
+
+def refresh_gauges():
+    for gauge, function in _computed_gauges:
+        try:
+            gauge.set(function())
+        except Exception as e:
+            logger.debug("Error computing gauge %s: %s", gauge._name, e)
+
+async def refresh_gauges_forever(interval: float):
+    while True:
+        refresh_gauges()
+        await asyncio.sleep(interval)
+
+def render_metrics() -> tuple:
+    #* Retorna (cuerpo, content type) para el endpoint /metrics
+    refresh_gauges()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,63 @@
+#* Migración: reemplaza los User embebidos en posts, comentarios, mensajes y chats por el uid del autor.
+#* Es idempotente (solo toca documentos que todavía embeben un User) y muestra el tamaño promedio de los documentos antes y después.
+#? Uso: python migrate_authors.py
+from pymongo import MongoClient
+from env_handler import env
+
+#* Cada paso es (colección, filtro de documentos sin migrar, pipeline de actualización)
+#? Dentro de un mismo $set todas las expresiones leen el documento original, por eso "public" alcanza a copiar user.public_profile
+STEPS = [
+    ("posts", { "user.uid": { "$exists": True } }, [
+        { "$set": { "public": { "$ifNull": ["$user.public_profile", False] }, "user": "$user.uid" } }
+    ]),
+    ("posts", { "comments.user.uid": { "$exists": True } }, [
+        { "$set": { "comments": { "$map": {
+            "input": "$comments",
+            "as": "c",
+            "in": { "$mergeObjects": ["$$c", { "user": { "$ifNull": ["$$c.user.uid", "$$c.user"] } }] }
+        } } } }
+    ]),
+    ("messages", { "user.uid": { "$exists": True } }, [
+        { "$set": { "user": "$user.uid" } }
+    ]),
+    ("chat", { "users.uid": { "$exists": True } }, [
+        { "$set": { "users": { "$map": { "input": "$users", "as": "u", "in": { "$ifNull": ["$$u.uid", "$$u"] } } } } }
+    ]),
+    ("chat", { "last_message.user.uid": { "$exists": True } }, [
+        { "$set": { "last_message.user": "$last_message.user.uid" } }
+    ]),
+]
+
+#* Índices del feed que dependían del User embebido
+OBSOLETE_INDEXES = [
+    ("posts", "user.uid_1_fecha_-1_id_-1"),
+    ("posts", "user.public_profile_1_fecha_-1_id_-1"),
+]
+
+def collection_stats(db, name):
+    stats = db.command("collStats", name)
+    return stats.get("count", 0), stats.get("avgObjSize", 0)
+
+def main():
+    client = MongoClient(env.DB_URL)
+    db = client[env.DB_NAME]
+    collections = sorted({ name for name, _, _ in STEPS })
+    before = { name: collection_stats(db, name) for name in collections }
+
+    for name, query, pipeline in STEPS:
+        result = db[name].update_many(query, pipeline)
+        print(f"{name}: {result.modified_count} documentos migrados")
+
+    for name, index in OBSOLETE_INDEXES:
+        if index in db[name].index_information():
+            db[name].drop_index(index)
+            print(f"{name}: índice {index} eliminado")
+
+    #* Tamaño promedio por documento, antes y después
+    for name in collections:
+        count, size_after = collection_stats(db, name)
+        _, size_before = before[name]
+        print(f"{name}: {count} documentos, tamaño promedio {size_before} B -> {size_after} B")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#* Migración: mueve los comentarios embebidos en los posts a la colección comments y deja en cada post solo comment_count.
+#* Las respuestas se reconocen por la lista responses de su comentario, y quedan con parent apuntando a él.
+#* Es idempotente (upserts por id), se puede correr varias veces. Los posts sin comment_count quedan con 0.
+#? Uso: python migrate_comments.py
+from pymongo import MongoClient, UpdateOne
+from env_handler import env
+
+BATCH_SIZE = 1000
+
+def _uid_of(value):
+    #? Comentarios anteriores a la migración de autores
+    return value["uid"] if isinstance(value, dict) else value
+
+def flush(db, operations: list, counts: dict) -> int:
+    #* Primero se escriben los comentarios y solo después se quitan de sus posts, así un corte a medias no pierde ninguno
+    upserted = db.comments.bulk_write(operations, ordered=False).upserted_count if operations else 0
+    if counts:
+        db.posts.bulk_write([
+            UpdateOne({ "id": post_id }, { "$set": { "comment_count": count }, "$unset": { "comments": "" } })
+            for post_id, count in counts.items()
+        ], ordered=False)
+    return upserted
+
+def main():
+    client = MongoClient(env.DB_URL)
+    db = client[env.DB_NAME]
+    operations = []
+    counts = {}
+    upserted = 0
+    posts = 0
+    for post in db.posts.find({ "comments": { "$exists": True } }, { "_id": 0, "id": 1, "comments": 1 }):
+        comments = post.get("comments") or []
+        parents = {}
+        for comment in comments:
+            for response in comment.get("responses") or []:
+                parents.setdefault(response, comment["id"])
+        reply_counts = {}
+        for comment in comments:
+            parent = parents.get(comment["id"])
+            if parent:
+                reply_counts[parent] = reply_counts.get(parent, 0) + 1
+        for comment in comments:
+            likes = comment.get("likes") or []
+            operations.append(UpdateOne(
+                { "id": comment["id"] },
+                { "$setOnInsert": {
+                    "fecha": comment["fecha"],
+                    "post": post["id"],
+                    "parent": parents.get(comment["id"]),
+                    "content": comment["content"],
+                    "user": _uid_of(comment["user"]),
+                    "likes": likes,
+                    "like_count": len(likes),
+                    "reply_count": reply_counts.get(comment["id"], 0),
+                } },
+                upsert=True
+            ))
+        counts[post["id"]] = len(comments)
+        posts += 1
+        if len(operations) >= BATCH_SIZE or len(counts) >= BATCH_SIZE:
+            upserted += flush(db, operations, counts)
+            operations = []
+            counts = {}
+    upserted += flush(db, operations, counts)
+    print(f"comments: {upserted} comentarios migrados desde {posts} posts")
+
+    result = db.posts.update_many({ "comment_count": { "$exists": False } }, { "$set": { "comment_count": 0 } })
+    print(f"posts: {result.modified_count} documentos sin comentarios con comment_count en 0")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+#* Migración: crea las aristas de friendships a partir de los arreglos users.friends existentes.
+#* Es idempotente (upserts), se puede correr varias veces.
+#? Uso: python migrate_friendships.py
+from datetime import datetime, timezone
+from pymongo import MongoClient, UpdateOne
+from env_handler import env
+
+BATCH_SIZE = 1000
+
+def main():
+    client = MongoClient(env.DB_URL)
+    db = client[env.DB_NAME]
+    now = datetime.now(timezone.utc)
+    operations = []
+    upserted = 0
+    for user in db.users.find({ "friends.0": { "$exists": True } }, { "_id": 0, "uid": 1, "friends": 1 }):
+        for friend in user["friends"]:
+            #? Creamos ambos sentidos, por si algún arreglo quedó desincronizado por canjes concurrentes
+            operations.append(UpdateOne({ "user": user["uid"], "friend": friend }, { "$setOnInsert": { "fecha": now } }, upsert=True))
+            operations.append(UpdateOne({ "user": friend, "friend": user["uid"] }, { "$setOnInsert": { "fecha": now } }, upsert=True))
+        if len(operations) >= BATCH_SIZE:
+            upserted += db.friendships.bulk_write(operations, ordered=False).upserted_count
+            operations = []
+    if operations:
+        upserted += db.friendships.bulk_write(operations, ordered=False).upserted_count
+    print(f"friendships: {upserted} aristas creadas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#* Migración: crea la bandeja (inbox) de cada participante a partir de los chats existentes, con el último mensaje de cada chat,
+#* y elimina de los chats el arreglo messages y el last_message que ahora viven en la bandeja.
+#* Es idempotente (upserts), se puede correr varias veces. Los contadores de no leídos empiezan en 0.
+#? Uso: python migrate_inbox.py
+from pymongo import MongoClient, UpdateOne, DESCENDING
+from env_handler import env
+from inbox import preview_of
+
+BATCH_SIZE = 1000
+
+def main():
+    client = MongoClient(env.DB_URL)
+    db = client[env.DB_NAME]
+    operations = []
+    upserted = 0
+    for chat in db.chat.find({}, { "_id": 0, "id": 1, "fecha": 1, "users": 1 }):
+        last = db.messages.find_one({ "chat": chat["id"] }, { "_id": 0 }, sort=[("fecha", DESCENDING), ("id", DESCENDING)])
+        if last and isinstance(last.get("user"), dict):
+            #? Mensajes anteriores a la migración de autores
+            last["user"] = last["user"]["uid"]
+        users = [user["uid"] if isinstance(user, dict) else user for user in chat["users"]]
+        for owner in users:
+            operations.append(UpdateOne(
+                { "chat": chat["id"], "owner": owner },
+                { "$set": {
+                    "peer": next((user for user in users if user != owner), owner),
+                    "last_activity": last["fecha"] if last else chat["fecha"],
+                    "last_message": preview_of(last) if last else None,
+                }, "$setOnInsert": { "unread": 0 } },
+                upsert=True
+            ))
+        if len(operations) >= BATCH_SIZE:
+            upserted += db.inbox.bulk_write(operations, ordered=False).upserted_count
+            operations = []
+    if operations:
+        upserted += db.inbox.bulk_write(operations, ordered=False).upserted_count
+    print(f"inbox: {upserted} resúmenes creados")
+
+    result = db.chat.update_many(
+        { "$or": [{ "messages": { "$exists": True } }, { "last_message": { "$exists": True } }] },
+        { "$unset": { "messages": "", "last_message": "" } }
+    )
+    print(f"chat: {result.modified_count} documentos sin messages ni last_message")
+
+if __name__ == "__main__":
+    main()
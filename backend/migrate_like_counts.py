@@ -0,0 +1,17 @@
+#* Migración: calcula like_count en los posts creados antes de que existiera el contador.
+#* Es idempotente, solo toca los documentos que todavía no tienen like_count.
+#? Uso: python migrate_like_counts.py
+from pymongo import MongoClient
+from env_handler import env
+
+def main():
+    client = MongoClient(env.DB_URL)
+    db = client[env.DB_NAME]
+    result = db.posts.update_many(
+        { "like_count": { "$exists": False } },
+        [{ "$set": { "like_count": { "$size": { "$ifNull": ["$likes", []] } } } }]
+    )
+    print(f"posts: {result.modified_count} documentos migrados")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+#* Migración: agrega username_lower a los usuarios existentes, lo usa la búsqueda de usuarios por prefijo.
+#* Es idempotente (solo toca usuarios sin username_lower o con uno desactualizado).
+#? Uso: python migrate_usernames.py
+from pymongo import MongoClient
+from env_handler import env
+
+def main():
+    client = MongoClient(env.DB_URL)
+    db = client[env.DB_NAME]
+    result = db.users.update_many(
+        { "$expr": { "$ne": ["$username_lower", { "$toLower": "$username" }] } },
+        [{ "$set": { "username_lower": { "$toLower": "$username" } } }]
+    )
+    print(f"users: {result.modified_count} documentos migrados")
+
+if __name__ == "__main__":
+    main()
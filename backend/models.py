@@ -1,6 +1,11 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PlainSerializer
+from typing import Annotated, Optional, Union
 from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timezone
+
+def utcnow() -> datetime:
+    #* Todas las fechas se crean con zona horaria UTC, Mongo las guarda en UTC y al leerlas las retorna sin zona horaria
+    return datetime.now(timezone.utc)
 
 class _User(BaseModel):
     uid: str
@@ -17,52 +22,143 @@ class User(BaseModel):
     profile_picture: str = Field(default="/no_pfp.webp")
     public_profile: bool = False
 
-class CommentaryResponse(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid4()))
-    fecha: datetime = Field(default_factory=datetime.now)
-    content: str
-    files: list[str] # lista con las URLs de los archivos adjuntos
-    user: User
-    likes: list[str] # lista con las IDs de los usuarios que han dado like
+class UserRef(BaseModel):
+    #* Perfil mínimo de un usuario, es lo que se agrega como autor al leer posts, mensajes y chats
+    uid: str
+    username: str
+    profile_picture: str = Field(default="/no_pfp.webp")
+
+class ImageFile(BaseModel):
+    url: str # URL de la imagen procesada (WebP)
+    thumbnail: str # URL de la miniatura
 
-class Commentary(BaseModel):
+class Comment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid4()))
-    fecha: datetime = Field(default_factory=datetime.now)
+    fecha: datetime = Field(default_factory=utcnow)
+    post: str # ID del post
+    parent: Optional[str] = None # ID del comentario al que responde, None si es un comentario del post
     content: str
-    files: list[str] # lista con las URLs de los archivos adjuntos
-    user: User
-    likes: list[str] # lista con las IDs de los usuarios que han dado like
-    responses: list[str] # lista con las IDs de los comentarios de respuesta
+    user: str # ID del autor
+    likes: list[str] = Field(default=[]) # lista con las IDs de los usuarios que han dado like
+    like_count: int = Field(default=0) # se mantiene con $inc junto a likes
+    reply_count: int = Field(default=0) # se mantiene con $inc al crear o eliminar respuestas
 
 class Post(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid4()))
-    fecha: datetime = Field(default_factory=datetime.now)
+    fecha: datetime = Field(default_factory=utcnow)
     title: str
     content: str
-    files: list[str] # lista con las URLs de los archivos adjuntos
-    user: User
+    files: list[ImageFile] # imágenes adjuntas, cada una con su miniatura
+    user: str # ID del autor
+    public: bool = False # copia de public_profile del autor, para filtrar el feed público sin consultar usuarios
     likes: list[str] = Field(default=[]) # lista con las IDs de los usuarios que han dado like
-    comments: list[Commentary] = Field(default=[]) # lista con los comentarios del post
+    like_count: int = Field(default=0) # se mantiene con $inc junto a likes
+    comment_count: int = Field(default=0) # los comentarios viven en su propia colección, acá solo el contador
     pinned: bool = Field(default=False)
 
 class Wavebond(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid4()))
-    fecha: datetime = Field(default_factory=datetime.now)
+    fecha: datetime = Field(default_factory=utcnow)
     user: str # ID del usuario
     wave: bytes # hash generado con la función generate_wavebond
     version: float = 0.1
 
 class Message(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid4()))
-    fecha: datetime = Field(default_factory=datetime.now)
+    fecha: datetime = Field(default_factory=utcnow)
     content: str
     files: str # URL de los archivos adjuntos
-    user: User
+    user: str # ID del autor
     chat: str # ID del chat
 
 class Chat(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid4()))
-    fecha: datetime = Field(default_factory=datetime.now)
-    users: list[User] # lista con las IDs de los usuarios que participan en el chat
-    messages: list[str] = Field(default=[]) # lista con las IDs de los mensajes del chat
-    last_message: Message = Field(default=None) # Último mensaje enviado
\ No newline at end of file
+    fecha: datetime = Field(default_factory=utcnow)
+    users: list[str] # lista con las IDs de los usuarios que participan en el chat
+    #? Los mensajes viven en su propia colección y el último mensaje de cada chat en la bandeja (inbox)
+
+#* Modelos de respuesta: solo los campos que usa el frontend, sin pasar por bson.json_util
+#? Mongo retorna las fechas en UTC pero sin zona horaria, así que se envían explícitamente en UTC
+UTCDatetime = Annotated[datetime, PlainSerializer(
+    lambda value: (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat(),
+    return_type=str,
+    when_used="json"
+)]
+
+class ErrorResponse(BaseModel):
+    status: str = "error"
+    message: str
+
+class PostOut(BaseModel):
+    id: str
+    fecha: UTCDatetime
+    title: str
+    content: str
+    files: list[Union[ImageFile, str]] = [] # los posts antiguos guardan solo la URL
+    user: UserRef
+    like_count: int = 0
+    liked: bool = False # si el usuario que consulta le dio like
+    comment_count: int = 0
+    pinned: bool = False
+
+class PostPage(BaseModel):
+    result: list[PostOut]
+    next_cursor: Optional[str] = None
+
+class CommentOut(BaseModel):
+    id: str
+    fecha: UTCDatetime
+    post: str
+    parent: Optional[str] = None
+    content: str
+    user: UserRef
+    like_count: int = 0
+    liked: bool = False
+    reply_count: int = 0
+
+class CommentPage(BaseModel):
+    status: str = "success"
+    result: list[CommentOut]
+    next_cursor: Optional[str] = None
+
+class UserSearchPage(BaseModel):
+    result: list[UserRef]
+    next_cursor: Optional[str] = None
+
+class FriendsPage(BaseModel):
+    friends: list[UserRef]
+    next_cursor: Optional[str] = None
+
+class MessagePreview(BaseModel):
+    id: str
+    fecha: UTCDatetime
+    content: str
+    files: str = ""
+    user: str # ID del autor
+
+class ChatSummary(BaseModel):
+    id: str # ID del chat
+    peer: UserRef # el otro participante
+    last_message: Optional[MessagePreview] = None
+    last_activity: UTCDatetime
+    unread: int = 0
+
+class ChatList(BaseModel):
+    status: str = "success"
+    result: list[ChatSummary]
+    next_cursor: Optional[str] = None
+
+class MessageOut(BaseModel):
+    id: str
+    fecha: UTCDatetime
+    content: str
+    files: str = ""
+    chat: str
+    user: UserRef
+
+class MessagePage(BaseModel):
+    status: str = "success"
+    result: list[MessageOut]
+    prev_cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+    has_more: bool = False
@@ -0,0 +1,83 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timezone
+import json
+
+#* Límites de página compartidos por los endpoints paginados
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def _encode(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":"))
+    return urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode(cursor: str) -> dict:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(urlsafe_b64decode(padded.encode("ascii")))
+    if not isinstance(data, dict):
+        raise ValueError("Invalid cursor")
+    return data
+
+def _as_utc(fecha: datetime) -> datetime:
+    #* Las fechas leídas de Mongo vienen en UTC sin zona horaria, las de un cursor se llevan a esa misma forma
+    #? Así se pueden comparar en Python (p. ej. en el timeline) sin mezclar fechas con y sin zona horaria
+    if fecha.tzinfo is None:
+        return fecha
+    return fecha.astimezone(timezone.utc).replace(tzinfo=None)
+
+def encode_cursor(fecha: datetime, id: str) -> str:
+    #* Codificamos la posición (fecha, id) del último documento de la página en un string opaco para el cliente
+    return _encode({ "f": _as_utc(fecha).isoformat(), "i": id })
+
+def decode_cursor(cursor: str):
+    #* Revertimos encode_cursor, en caso de que el cursor sea inválido retornamos None
+    try:
+        data = _decode(cursor)
+        return _as_utc(datetime.fromisoformat(data["f"])), str(data["i"])
+    except (ValueError, KeyError, TypeError, UnicodeEncodeError):
+        return None
+
+def encode_key_cursor(value: str, id: str) -> str:
+    #* Igual que encode_cursor, pero para listas ordenadas por un texto (p. ej. username) en vez de una fecha
+    return _encode({ "k": value, "i": id })
+
+def decode_key_cursor(cursor: str):
+    try:
+        data = _decode(cursor)
+        return str(data["k"]), str(data["i"])
+    except (ValueError, KeyError, TypeError, UnicodeEncodeError):
+        return None
+
+def encode_offset(offset: int) -> str:
+    #* Para resultados ordenados por relevancia, donde no hay una clave estable sobre la cual continuar
+    return _encode({ "o": offset })
+
+def decode_offset(cursor: str):
+    try:
+        offset = int(_decode(cursor)["o"])
+        return offset if offset >= 0 else None
+    except (ValueError, KeyError, TypeError, UnicodeEncodeError):
+        return None
+
+def keyset_filter(cursor, field: str = "fecha", descending: bool = True, key: str = "id"):
+    #* Filtro para continuar justo después del cursor ordenando por (field, key)
+    #? Al usar el id como desempate, dos documentos con la misma fecha nunca se saltan ni se repiten
+    fecha, id = cursor
+    op = "$lt" if descending else "$gt"
+    return {
+        "$or": [
+            { field: { op: fecha } },
+            { field: fecha, key: { op: id } }
+        ]
+    }
+
+def cursor_of(doc: dict, field: str = "fecha", key: str = "id") -> str:
+    return encode_cursor(doc[field], doc[key])
+
+def paginate(docs: list, limit: int, field: str = "fecha", key: str = "id"):
+    #* Las consultas piden limit + 1 documentos, si sobra uno significa que existe una página siguiente
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = cursor_of(last, field, key)
+    return docs, next_cursor
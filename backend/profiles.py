@@ -0,0 +1,59 @@
+from cache import TTLCache
+from db import db
+from env_handler import env
+from models import UserRef
+
+#* Los documentos (posts, mensajes, chats) solo guardan el uid de su autor, el perfil se agrega al momento de leerlos
+PROFILE_PROJECTION = { "_id": 0, "uid": 1, "username": 1, "profile_picture": 1 }
+
+#* Caché de perfiles, evita consultar los mismos autores en cada página
+profile_cache = TTLCache(env.PROFILE_CACHE_SIZE, env.PROFILE_CACHE_TTL)
+
+def _uid_of(value):
+    #? Los documentos anteriores a la migración todavía embeben el User completo
+    return value["uid"] if isinstance(value, dict) else value
+
+async def get_profiles(uids) -> dict:
+    #* Retorna { uid: perfil } usando la caché, y los que falten se buscan con una sola consulta $in
+    profiles = {}
+    missing = []
+    for uid in set(uids):
+        profile = profile_cache.get(uid)
+        if profile is None:
+            missing.append(uid)
+        else:
+            profiles[uid] = profile
+    if missing:
+        async for user in db.users.find({ "uid": { "$in": missing } }, PROFILE_PROJECTION):
+            profile = UserRef(**user).model_dump()
+            profile_cache.set(user["uid"], profile)
+            profiles[user["uid"]] = profile
+    return profiles
+
+async def hydrate_authors(docs: list, field: str = "user") -> list:
+    #* Reemplazamos el uid (o la lista de uids) guardado en `field` por el perfil de cada usuario
+    uids = set()
+    for doc in docs:
+        value = doc.get(field)
+        if isinstance(value, list):
+            uids.update(_uid_of(v) for v in value)
+        elif value is not None:
+            uids.add(_uid_of(value))
+    profiles = await get_profiles(uids)
+
+    def profile_of(value):
+        uid = _uid_of(value)
+        #? Si el usuario ya no existe, retornamos un perfil genérico en vez de romper la página
+        return profiles.get(uid) or UserRef(uid=uid, username="Unknown").model_dump()
+
+    for doc in docs:
+        value = doc.get(field)
+        if isinstance(value, list):
+            doc[field] = [profile_of(v) for v in value]
+        elif value is not None:
+            doc[field] = profile_of(value)
+    return docs
+
+def invalidate_profile(uid: str):
+    #* Se llama al editar un perfil para que el cambio se vea en la siguiente lectura de este proceso
+    profile_cache.pop(uid)
@@ -0,0 +1,168 @@
+import socketio
+
+#* Infraestructura de Socket.IO para correr con uno o varios procesos (workers de uvicorn)
+#? Con un solo proceso basta con el estado en memoria. Con varios, los emits a un room se reparten por una cola de mensajes
+#? (Redis o RabbitMQ) y la membresía de los rooms se guarda en Redis para que cualquier proceso la pueda consultar.
+
+def create_client_manager(url: str):
+    #* Retorna el client manager de python-socketio según el esquema de la URL, o None para el modo de un solo proceso
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return socketio.AsyncRedisManager(url)
+    if url.startswith(("amqp://", "amqps://")):
+        #? Requiere aio-pika instalado
+        return socketio.AsyncAioPikaManager(url)
+    raise ValueError(f"Unsupported Socket.IO message queue: {url}")
+
+class Connection:
+    #* Registro de una conexión de Socket.IO: a qué usuario pertenece y en qué rooms está
+    __slots__ = ("sid", "uid", "rooms")
+
+    def __init__(self, sid: str, uid: str):
+        self.sid = sid
+        self.uid = uid
+        self.rooms = set()
+
+class MemoryPresence:
+    #* Membresía de rooms en memoria, solo sirve cuando hay un único proceso (modo por defecto)
+    #? Todas las operaciones son O(1) por room: un usuario puede tener varias pestañas (sids) en el mismo room, y solo se
+    #? considera que "entró" con su primer sid y que "salió" con el último
+    def __init__(self):
+        self._connections = {}  #* sid -> Connection
+        self._rooms = {}        #* room -> { uid: sids en el room }
+        self._uids = {}         #* uid -> sids conectados (índice inverso)
+
+    async def join(self, sid: str, room: str, uid: str) -> bool:
+        #* Retorna True si el usuario no estaba en el room antes de este sid
+        connection = self._connections.get(sid)
+        if connection is None:
+            connection = self._connections[sid] = Connection(sid, uid)
+            self._uids.setdefault(uid, set()).add(sid)
+        if room in connection.rooms:
+            return False
+        connection.rooms.add(room)
+        sids = self._rooms.setdefault(room, {}).setdefault(connection.uid, set())
+        sids.add(sid)
+        return len(sids) == 1
+
+    def _leave(self, connection: Connection, room: str) -> bool:
+        if room not in connection.rooms:
+            return False
+        connection.rooms.discard(room)
+        members = self._rooms[room]
+        sids = members[connection.uid]
+        sids.discard(connection.sid)
+        if sids:
+            return False
+        del members[connection.uid]
+        if not members:
+            del self._rooms[room]
+        return True
+
+    async def leave(self, sid: str, room: str) -> bool:
+        #* Retorna True si con esto el usuario ya no tiene ningún sid en el room
+        connection = self._connections.get(sid)
+        return connection is not None and self._leave(connection, room)
+
+    async def disconnect(self, sid: str):
+        #* Saca al sid de todos sus rooms, retorna (uid, rooms de los que el usuario salió por completo)
+        connection = self._connections.pop(sid, None)
+        if connection is None:
+            return None, []
+        gone = [room for room in list(connection.rooms) if self._leave(connection, room)]
+        sids = self._uids[connection.uid]
+        sids.discard(sid)
+        if not sids:
+            del self._uids[connection.uid]
+        return connection.uid, gone
+
+    def room_count(self) -> int:
+        return len(self._rooms)
+
+    async def uid_of(self, sid: str):
+        connection = self._connections.get(sid)
+        return connection.uid if connection else None
+
+    async def members(self, room: str) -> list:
+        #* uids distintos conectados al room
+        return list(self._rooms.get(room, ()))
+
+    async def sids_of(self, uid: str) -> set:
+        return set(self._uids.get(uid, ()))
+
+    async def close(self):
+        pass
+
+#* Scripts de Lua para que entrar y salir de un room sean atómicos en Redis
+#? KEYS: conexión (sid -> uid), rooms del sid (hash room -> 1), room (hash uid -> cantidad de sids), sids del uid
+_JOIN_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX') then redis.call('SADD', KEYS[4], ARGV[3]) end
+if redis.call('HSETNX', KEYS[2], ARGV[2], 1) == 0 then return 0 end
+if redis.call('HINCRBY', KEYS[3], redis.call('GET', KEYS[1]), 1) == 1 then return 1 end
+return 0
+"""
+_LEAVE_SCRIPT = """
+if redis.call('HDEL', KEYS[2], ARGV[1]) == 0 then return 0 end
+local uid = redis.call('GET', KEYS[1])
+if not uid then return 0 end
+if redis.call('HINCRBY', KEYS[3], uid, -1) > 0 then return 0 end
+redis.call('HDEL', KEYS[3], uid)
+return 1
+"""
+
+class RedisPresence:
+    #* Misma interfaz que MemoryPresence, pero compartida entre procesos a través de Redis
+    #! Si un proceso muere sin pasar por disconnect, sus sids quedan registrados hasta que se limpie el prefijo
+    def __init__(self, url: str, prefix: str = "wavenet:presence"):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._join = self._redis.register_script(_JOIN_SCRIPT)
+        self._leave = self._redis.register_script(_LEAVE_SCRIPT)
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self._prefix}:{kind}:{name}"
+
+    async def join(self, sid: str, room: str, uid: str) -> bool:
+        keys = [self._key("conn", sid), self._key("sid", sid), self._key("room", room), self._key("uid", uid)]
+        return bool(await self._join(keys=keys, args=[uid, room, sid]))
+
+    async def leave(self, sid: str, room: str) -> bool:
+        keys = [self._key("conn", sid), self._key("sid", sid), self._key("room", room)]
+        return bool(await self._leave(keys=keys, args=[room]))
+
+    async def disconnect(self, sid: str):
+        uid = await self._redis.get(self._key("conn", sid))
+        if uid is None:
+            return None, []
+        gone = [room for room in await self._redis.hkeys(self._key("sid", sid)) if await self.leave(sid, room)]
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key("conn", sid), self._key("sid", sid))
+            pipe.srem(self._key("uid", uid), sid)
+            await pipe.execute()
+        return uid, gone
+
+    async def uid_of(self, sid: str):
+        return await self._redis.get(self._key("conn", sid))
+
+    async def members(self, room: str) -> list:
+        return await self._redis.hkeys(self._key("room", room))
+
+    async def sids_of(self, uid: str) -> set:
+        return await self._redis.smembers(self._key("uid", uid))
+
+    async def close(self):
+        await self._redis.aclose()
+
+def create_presence(url: str, message_queue: str = None):
+    #* La membresía compartida solo se puede guardar en Redis, sin cola de mensajes (un solo proceso) se usa la memoria del proceso
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisPresence(url)
+    #! Con una cola de mensajes hay varios procesos, y la memoria de cada uno solo vería a sus propias conexiones:
+    #! los avisos de presencia y los no leídos quedarían mal sin dar ningún error, así que no arrancamos
+    if message_queue:
+        raise ValueError(f"SOCKETIO_MESSAGE_QUEUE is set, so PRESENCE_URL must be a Redis URL (got {url!r})")
+    if url:
+        raise ValueError(f"Unsupported presence URL: {url}")
+    return MemoryPresence()
@@ -0,0 +1,21 @@
+from fastapi import Request, Response
+from pydantic import BaseModel
+import hashlib
+
+#* Respuestas con ETag para las páginas que el cliente vuelve a pedir seguido (feed y lista de chats)
+#? El ETag es débil porque la compresión cambia los bytes enviados, pero no el contenido
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    tags = { tag.strip() for tag in if_none_match.split(",") }
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+def etag_response(request: Request, content: BaseModel) -> Response:
+    #* Serializa el modelo una sola vez (pydantic-core), y si el cliente ya tiene esa versión responde 304 sin cuerpo
+    body = content.model_dump_json().encode("utf-8")
+    etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    #? "private, no-cache": el navegador puede guardar la respuesta, pero debe revalidarla en cada petición
+    headers = { "ETag": etag, "Cache-Control": "private, no-cache" }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
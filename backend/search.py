@@ -0,0 +1,62 @@
+from pymongo import ASCENDING, DESCENDING
+from db import db
+from env_handler import env
+from pagination import decode_key_cursor, decode_offset, encode_key_cursor, encode_offset, keyset_filter
+import re
+
+#* Búsqueda de posts (índice de texto sobre title y content) y de usuarios (prefijo de username_lower)
+#? Ambas respetan las mismas reglas de visibilidad que el feed public-friends: perfiles públicos, amigos y uno mismo
+
+def visible_filter(field: str, public_field: str, uid: str, friends: list) -> dict:
+    return {
+        "$or": [
+            { public_field: True },
+            { field: { "$in": friends + [uid] } }
+        ]
+    }
+
+async def search_posts(uid: str, friends: list, text: str, limit: int, cursor: str = None, projection: dict = None):
+    #* Posts ordenados por relevancia (textScore) y luego por fecha, retorna (posts, next_cursor)
+    #? El puntaje de texto no sirve como clave de un cursor, así que se pagina por offset hasta SEARCH_MAX_RESULTS
+    offset = decode_offset(cursor) if cursor else 0
+    if offset is None:
+        raise ValueError("Invalid cursor.")
+    limit = min(limit, env.SEARCH_MAX_RESULTS - offset)
+    if limit <= 0:
+        return [], None
+    query = { "$text": { "$search": text }, **visible_filter("user", "public", uid, friends) }
+    projection = { **(projection or { "_id": 0 }), "score": { "$meta": "textScore" } }
+    posts = await db.posts.find(query, projection) \
+        .sort([("score", { "$meta": "textScore" }), ("fecha", DESCENDING), ("id", DESCENDING)]) \
+        .skip(offset) \
+        .limit(limit + 1) \
+        .to_list(length=None)
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_offset(offset + limit)
+    for post in posts:
+        post.pop("score", None)
+    return posts, next_cursor
+
+async def search_users(uid: str, friends: list, text: str, limit: int, cursor: str = None):
+    #* Usuarios cuyo username empieza con el texto (sin distinguir mayúsculas), en orden alfabético, retorna (usuarios, next_cursor)
+    #? Una regex anclada al inicio y sin opciones recorre solo el rango del índice de username_lower
+    query = {
+        "username_lower": { "$regex": f"^{re.escape(text.lower())}" },
+        **visible_filter("uid", "public_profile", uid, friends)
+    }
+    if cursor:
+        position = decode_key_cursor(cursor)
+        if not position:
+            raise ValueError("Invalid cursor.")
+        query = { "$and": [query, keyset_filter(position, field="username_lower", descending=False, key="uid")] }
+    users = await db.users.find(query, { "_id": 0, "uid": 1, "username": 1, "username_lower": 1, "profile_picture": 1 }) \
+        .sort([("username_lower", ASCENDING), ("uid", ASCENDING)]) \
+        .limit(limit + 1) \
+        .to_list(length=None)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_key_cursor(users[-1]["username_lower"], users[-1]["uid"])
+    return users, next_cursor
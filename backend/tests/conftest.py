@@ -0,0 +1,142 @@
+#* Configuración de las pruebas: una base de datos en memoria (mongomock_motor) en vez de MongoDB y tokens falsos en vez de Firebase
+#? Uso (desde backend/): pip install -r requirements-dev.txt && python -m pytest
+import os
+
+#* Entorno de las pruebas, se aplica antes de importar cualquier módulo de la aplicación (env_handler lee el entorno al importarse)
+#? Los límites de frecuencia quedan desactivados, las pruebas del control de admisión arman sus propios límites
+TEST_ENV = {
+    "DB_NAME": "wavenet_test",
+    "FIREBASE_PROJECT_ID": "wavenet-test",
+    "CYPH_SECRET_KEY": "wavenet-test-key",
+    "POST_RATE": "0",
+    "LIKE_RATE": "0",
+    "SOCKET_MESSAGE_RATE": "0",
+    "LOG_LEVEL": "WARNING",
+}
+for key, value in TEST_ENV.items():
+    os.environ.setdefault(key, value)
+
+import asyncio
+import httpx
+import pytest
+from motor.motor_asyncio import AsyncIOMotorCollection
+from mongomock_motor import AsyncMongoMockClient
+from bench.backends import FakeTokenVerifier, patch_mongomock, token_for
+from db import use_database
+from indexes import apply_indexes
+from message_writer import MessageWriter
+import friends
+import profiles
+import util
+
+#? Diferencias de mongomock con MongoDB que afectan a la aplicación (ver bench.backends)
+patch_mongomock()
+
+class WrappedCollection:
+    #* Colección que pasa cada método asíncrono por `wrap(colección, método, función)` antes de llamarlo
+    def __init__(self, collection, wrap):
+        self._collection = collection
+        self._wrap = wrap
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+        return self._wrap(self._collection.name, name, attr)
+
+class WrappedDatabase:
+    #? mongomock_motor crea un objeto nuevo en cada acceso a una colección, así que los reemplazos se aplican desde la base de datos
+    def __init__(self, database, wrap):
+        self._database = database
+        self._wrap = wrap
+        self.name = database.name
+
+    def __getattr__(self, name):
+        value = getattr(self._database, name)
+        return WrappedCollection(value, self._wrap) if isinstance(value, AsyncIOMotorCollection) else value
+
+    def __getitem__(self, name):
+        return WrappedCollection(self._database[name], self._wrap)
+
+def _interleave(collection: str, method: str, function):
+    #* Cede el event loop antes de cada operación
+    #? mongomock_motor ejecuta cada operación de una sola vez, sin esto dos corrutinas "concurrentes" nunca se intercalan
+    async def interleaved(*args, **kwargs):
+        await asyncio.sleep(0)
+        return await function(*args, **kwargs)
+    return interleaved
+
+def auth(uid: str) -> dict:
+    #* Cabecera de autorización para el verificador falso
+    return { "Authorization": f"Bearer {token_for(uid)}" }
+
+@pytest.fixture
+async def db():
+    #* Base de datos vacía para cada prueba, con los mismos índices que producción (los únicos se respetan en mongomock)
+    database = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    await apply_indexes(database)
+    use_database(database)
+    #? Las cachés de los módulos sobreviven entre pruebas, se vacían para no arrastrar datos de otra base de datos
+    for cache in (profiles.profile_cache, friends._chat_members, util.wavebond_cache):
+        cache.clear()
+    yield database
+
+@pytest.fixture
+def interleaved(db):
+    #* La misma base de datos, pero cada operación cede el event loop (para probar escrituras concurrentes)
+    use_database(WrappedDatabase(db, _interleave))
+    yield db
+    use_database(db)
+
+@pytest.fixture
+def patch_collection(db):
+    #* Reemplaza un método de una colección para la aplicación: patch_collection("messages", "insert_many", replacement),
+    #* donde replacement(original, *args, **kwargs) recibe el método original
+    replacements = {}
+
+    def wrap(collection: str, method: str, function):
+        replacement = replacements.get((collection, method))
+        if not replacement:
+            return function
+
+        async def patched(*args, **kwargs):
+            return await replacement(function, *args, **kwargs)
+        return patched
+
+    def patch(collection: str, method: str, replacement):
+        replacements[(collection, method)] = replacement
+    use_database(WrappedDatabase(db, wrap))
+    yield patch
+    use_database(db)
+
+@pytest.fixture
+def make_user(db):
+    async def make_user(uid: str, public: bool = False, **fields) -> dict:
+        user = {
+            "uid": uid,
+            "username": uid,
+            "username_lower": uid.lower(),
+            "email": f"{uid}@wavenet.test",
+            "profile_picture": "/no_pfp.webp",
+            "public_profile": public,
+            "friends": [],
+            **fields,
+        }
+        await db.users.insert_one(dict(user))
+        return user
+    return make_user
+
+@pytest.fixture
+def application(db, monkeypatch):
+    import app as app_module
+    #? Cada prueba tiene su propia cola de mensajes, así lo que quede sin escribir no pasa a la siguiente
+    monkeypatch.setattr(app_module, "message_writer", MessageWriter())
+    #? La base de datos ya quedó en uso con el fixture db (o su versión intercalada), no se vuelve a reemplazar
+    return app_module.create_app(verifier=FakeTokenVerifier(), create_indexes=False)
+
+@pytest.fixture
+async def client(application):
+    #? Sin lifespan: las rutas no necesitan el escritor de mensajes ni las llaves de Firebase
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://wavenet.test") as client:
+        yield client
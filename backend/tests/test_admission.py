@@ -0,0 +1,155 @@
+#* Control de admisión: token buckets sobre un reloj falso, presupuesto de bytes y las respuestas 429/413/503
+from types import SimpleNamespace
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from conftest import auth
+from admission import BodySizeLimitMiddleware, ByteBudget, Overloaded, RateLimiter, RequestTooLarge
+import admission
+import cache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    #? Los buckets usan time.monotonic y viven en una TTLCache que también lo usa, ambos leen el mismo reloj falso
+    clock = FakeClock()
+    fake_time = SimpleNamespace(monotonic=clock.monotonic)
+    monkeypatch.setattr(admission, "time", fake_time)
+    monkeypatch.setattr(cache, "time", fake_time)
+    return clock
+
+def test_burst_then_refill(clock):
+    limiter = RateLimiter("test", rate=2, burst=3)
+    assert [limiter.take("ana") for _ in range(3)] == [0, 0, 0]
+    #* Sin tokens, hay que esperar 1 / rate segundos por el siguiente
+    assert limiter.take("ana") == pytest.approx(0.5)
+    clock.advance(0.25)
+    assert limiter.take("ana") == pytest.approx(0.25)
+    clock.advance(0.25)
+    assert limiter.take("ana") == 0
+    assert limiter.take("ana") == pytest.approx(0.5)
+
+def test_buckets_are_per_key_and_capped_at_burst(clock):
+    limiter = RateLimiter("test", rate=1, burst=2)
+    assert limiter.take("ana", 2) == 0
+    assert limiter.take("ana") == pytest.approx(1)
+    assert limiter.take("bruno", 2) == 0
+    #* Un bucket que pasa mucho tiempo sin usarse no acumula más de burst tokens
+    clock.advance(3600)
+    assert limiter.take("ana", 2) == 0
+    assert limiter.take("ana") == pytest.approx(1)
+
+def test_idle_buckets_are_forgotten(clock):
+    limiter = RateLimiter("test", rate=1, burst=4, maxsize=2)
+    for uid in ("ana", "bruno"):
+        limiter.take(uid, 4)
+    assert len(limiter._buckets) == 2
+    #? Pasado burst / rate segundos un bucket ya estaría lleno, así que expira de la caché
+    clock.advance(4)
+    assert limiter._buckets.get("ana") is None
+    assert limiter.take("ana", 4) == 0
+    #* La memoria queda acotada a maxsize claves
+    for uid in ("carla", "dani", "eli"):
+        limiter.take(uid)
+    assert len(limiter._buckets) == 2
+
+def test_rejections_do_not_consume_tokens(clock):
+    limiter = RateLimiter("test", rate=1, burst=1)
+    assert limiter.take("ana") == 0
+    for _ in range(5):
+        assert limiter.take("ana") == pytest.approx(1)
+    clock.advance(1)
+    assert limiter.take("ana") == 0
+
+def test_zero_rate_disables_the_limit(clock):
+    limiter = RateLimiter("test", rate=0, burst=1)
+    assert all(limiter.take("ana") == 0 for _ in range(100))
+
+async def test_byte_budget():
+    budget = ByteBudget("test", 100)
+    with pytest.raises(RequestTooLarge):
+        async with budget.reserve(101):
+            pass
+    async with budget.reserve(60):
+        assert budget.in_use == 60
+        with pytest.raises(Overloaded):
+            async with budget.reserve(50):
+                pass
+        async with budget.reserve(40):
+            assert budget.in_use == 100
+    assert budget.in_use == 0
+    #* El presupuesto se devuelve aunque el bloque falle
+    with pytest.raises(RuntimeError):
+        async with budget.reserve(100):
+            raise RuntimeError
+    assert budget.in_use == 0
+
+async def test_posts_return_429_with_retry_after(client, make_user, clock, monkeypatch):
+    import app as app_module
+    await make_user("ana")
+    monkeypatch.setattr(app_module, "post_limiter", RateLimiter("posts", rate=0.4, burst=2))
+
+    post = lambda: client.post("/create-post/", data={ "title": "Wave", "content": "Wave" }, headers=auth("ana"))
+    assert [(await post()).status_code for _ in range(2)] == [200, 200]
+    response = await post()
+    assert response.status_code == 429
+    assert response.json() == { "status": "error", "message": "Too many requests, try again later." }
+    #? 1 / 0.4 = 2.5 segundos, Retry-After se redondea hacia arriba
+    assert response.headers["Retry-After"] == "3"
+    clock.advance(2)
+    assert (await post()).headers["Retry-After"] == "1"
+    clock.advance(0.5)
+    assert (await post()).status_code == 200
+    #* Otro usuario tiene su propio bucket
+    await make_user("bruno")
+    response = await client.post("/create-post/", data={ "title": "Wave", "content": "Wave" }, headers=auth("bruno"))
+    assert response.status_code == 200
+
+async def test_post_uploads_are_limited(client, make_user, monkeypatch):
+    import app as app_module
+    await make_user("ana")
+    files = { "files": ("wave.png", b"x" * 64, "image/png") }
+    data = { "title": "Wave", "content": "Wave" }
+
+    #* Un archivo que nunca cabría en el presupuesto es un 413, quedarse sin presupuesto por otras subidas es un 503
+    monkeypatch.setattr(app_module, "upload_budget", ByteBudget("upload_bytes", 32))
+    response = await client.post("/create-post/", data=data, files=files, headers=auth("ana"))
+    assert response.status_code == 413
+
+    budget = ByteBudget("upload_bytes", 100)
+    monkeypatch.setattr(app_module, "upload_budget", budget)
+    async with budget.reserve(50):
+        response = await client.post("/create-post/", data=data, files=files, headers=auth("ana"))
+    assert response.status_code == 503
+    assert response.json()["message"] == "Server is busy, try again later."
+    assert budget.in_use == 0
+
+def body_size_client(max_bytes: int) -> httpx.AsyncClient:
+    async def echo(request):
+        return JSONResponse({ "size": len(await request.body()) })
+    application = BodySizeLimitMiddleware(Starlette(routes=[Route("/", echo, methods=["POST"])]), max_bytes=max_bytes)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url="http://wavenet.test")
+
+async def test_body_size_limit():
+    async with body_size_client(10) as client:
+        assert (await client.post("/", content=b"x" * 10)).json() == { "size": 10 }
+        response = await client.post("/", content=b"x" * 11)
+        assert response.status_code == 413
+        assert response.json() == { "status": "error", "message": "Request body is too large." }
+
+        #? Sin Content-Length (chunked) se cuentan los bytes a medida que llegan
+        async def chunks():
+            for _ in range(3):
+                yield b"x" * 5
+        assert (await client.post("/", content=chunks())).status_code == 413
@@ -0,0 +1,113 @@
+#* Comentarios y respuestas: crear, eliminar, dar like y paginar, y que sin sesión no se lea nada
+import pytest
+from conftest import auth
+from friends import add_friendship
+
+@pytest.fixture
+async def post(client, make_user):
+    #* Post privado de ana, bruno es su amigo y carla no
+    for uid in ("ana", "bruno", "carla"):
+        await make_user(uid)
+    await add_friendship("ana", "bruno")
+    response = await client.post("/create-post/", data={ "title": "Wave", "content": "Wave" }, headers=auth("ana"))
+    return response.json()["post"]["id"]
+
+async def comment(client, post_id: str, uid: str, content: str, parent: str = None) -> dict:
+    response = await client.post(f"/posts/{post_id}/comments", json={ "content": content, "parent": parent }, headers=auth(uid))
+    assert response.status_code == 201, response.json()
+    return response.json()["comment"]
+
+async def page(client, url: str, uid: str = "ana", **params) -> dict:
+    response = await client.get(url, params=params, headers=auth(uid))
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+async def comment_count(db, post_id: str) -> int:
+    return (await db.posts.find_one({ "id": post_id }))["comment_count"]
+
+@pytest.mark.parametrize("headers", [{}, { "Authorization": "Bearer garbage" }, auth("nobody")])
+async def test_comments_need_a_session(client, post, headers):
+    first = await comment(client, post, "bruno", "secreto")
+    await comment(client, post, "ana", "respuesta", parent=first["id"])
+    for url in (f"/posts/{post}/comments", f"/comments/{first['id']}/replies"):
+        response = await client.get(url, headers=headers)
+        assert response.status_code == 404
+        assert response.json() == { "status": "error", "message": "Invalid session." }
+    response = await client.post(f"/posts/{post}/comments", json={ "content": "hola" }, headers=headers)
+    assert response.status_code == 404
+    assert (await client.delete(f"/comment/{first['id']}", headers=headers)).status_code == 404
+
+async def test_only_viewers_of_the_post_see_its_comments(client, post):
+    first = await comment(client, post, "bruno", "hola")
+    for url in (f"/posts/{post}/comments", f"/comments/{first['id']}/replies"):
+        assert (await client.get(url, headers=auth("carla"))).status_code == 404
+    response = await client.post(f"/posts/{post}/comments", json={ "content": "hola" }, headers=auth("carla"))
+    assert response.status_code == 404
+
+async def test_comments_and_replies(client, db, post):
+    first = await comment(client, post, "bruno", "primero")
+    assert first["user"]["uid"] == "bruno" and first["liked"] is False
+    second = await comment(client, post, "ana", "segundo")
+    reply = await comment(client, post, "ana", "respuesta", parent=first["id"])
+    #? Responder a una respuesta la deja en el mismo hilo
+    nested = await comment(client, post, "bruno", "otra", parent=reply["id"])
+    assert nested["parent"] == first["id"]
+    assert await comment_count(db, post) == 4
+
+    #* Los comentarios del post van del más reciente al más antiguo, sin las respuestas
+    body = await page(client, f"/posts/{post}/comments")
+    assert [c["id"] for c in body["result"]] == [second["id"], first["id"]]
+    assert body["result"][1]["reply_count"] == 2
+    assert body["result"][1]["user"]["username"] == "bruno"
+    #* Las respuestas van en orden de llegada
+    body = await page(client, f"/comments/{first['id']}/replies")
+    assert [c["id"] for c in body["result"]] == [reply["id"], nested["id"]]
+
+async def test_comment_pages(client, post):
+    ids = [(await comment(client, post, "bruno", f"c{i}"))["id"] for i in range(5)]
+    replies = [(await comment(client, post, "ana", f"r{i}", parent=ids[0]))["id"] for i in range(5)]
+    for url, expected in ((f"/posts/{post}/comments", ids[::-1]), (f"/comments/{ids[0]}/replies", replies)):
+        seen, cursor = [], None
+        while True:
+            body = await page(client, url, limit=2, **({ "cursor": cursor } if cursor else {}))
+            seen += [c["id"] for c in body["result"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        assert seen == expected
+        response = await client.get(url, params={ "cursor": "broken" }, headers=auth("ana"))
+        assert response.status_code == 400
+
+async def test_like_comments(client, post):
+    first = await comment(client, post, "bruno", "hola")
+    like = lambda uid: client.post("/like/", json={ "id": first["id"], "type": "comments" }, headers=auth(uid))
+    assert (await like("ana")).json() == { "status": "success", "action": "like", "liked": True, "like_count": 1 }
+    assert (await like("bruno")).json()["like_count"] == 2
+    assert (await like("ana")).json() == { "status": "success", "action": "dislike", "liked": False, "like_count": 1 }
+    #* Cada usuario ve si él mismo dio like
+    assert (await page(client, f"/posts/{post}/comments", "bruno"))["result"][0]["liked"] is True
+    assert (await page(client, f"/posts/{post}/comments", "ana"))["result"][0]["liked"] is False
+    response = await client.post("/like/", json={ "id": "missing", "type": "comments" }, headers=auth("ana"))
+    assert response.status_code == 404
+
+async def test_delete_comments(client, db, post):
+    first = await comment(client, post, "bruno", "primero")
+    replies = [(await comment(client, post, "ana", f"r{i}", parent=first["id"]))["id"] for i in range(2)]
+    other = await comment(client, post, "bruno", "segundo")
+
+    #* Solo el autor del comentario o el del post pueden eliminarlo
+    response = await client.delete(f"/comment/{replies[0]}", headers=auth("bruno"))
+    assert response.status_code == 401
+    response = await client.delete(f"/comment/{replies[0]}", headers=auth("ana"))
+    assert response.json()["deleted"] == 1
+    assert (await page(client, f"/posts/{post}/comments"))["result"][1]["reply_count"] == 1
+
+    #* Eliminar un comentario se lleva sus respuestas y descuenta todo del post
+    response = await client.delete(f"/comment/{first['id']}", headers=auth("ana"))
+    assert response.json()["deleted"] == 2
+    assert await comment_count(db, post) == 1
+    assert [c["id"] for c in (await page(client, f"/posts/{post}/comments"))["result"]] == [other["id"]]
+    assert await db.comments.count_documents({ "parent": first["id"] }) == 0
+    assert (await client.delete(f"/comment/{first['id']}", headers=auth("ana"))).status_code == 404
+    response = await client.post(f"/posts/{post}/comments", json={ "content": "x", "parent": first["id"] }, headers=auth("ana"))
+    assert response.status_code == 404
@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from pymongo.errors import BulkWriteError
+from friends import add_friendship, are_friends, chat_id_for, get_friends_page
+from pagination import decode_cursor
+
+async def test_concurrent_add_friendship_creates_one_edge_pair(interleaved, make_user):
+    await make_user("ana")
+    await make_user("beto")
+    #* Los dos canjes (uno por cada sentido) corren intercalados
+    results = await asyncio.gather(add_friendship("ana", "beto"), add_friendship("beto", "ana"))
+
+    assert sorted(results) == [False, True]
+    edges = await interleaved.friendships.find({}, { "_id": 0, "user": 1, "friend": 1 }).to_list(length=None)
+    assert sorted((edge["user"], edge["friend"]) for edge in edges) == [("ana", "beto"), ("beto", "ana")]
+    assert await interleaved.chat.count_documents({}) == 1
+    assert await interleaved.inbox.count_documents({ "chat": chat_id_for("ana", "beto") }) == 2
+    for uid, friend in (("ana", "beto"), ("beto", "ana")):
+        user = await interleaved.users.find_one({ "uid": uid })
+        assert user["friends"] == [friend]
+
+async def test_add_friendship_again_writes_nothing(db, make_user):
+    await make_user("ana")
+    await make_user("beto")
+    assert await add_friendship("ana", "beto")
+    assert not await add_friendship("beto", "ana")
+    assert await db.friendships.count_documents({}) == 2
+    assert await are_friends("ana", "beto") and await are_friends("beto", "ana")
+
+async def test_add_friendship_losing_the_upsert_race(db, make_user, patch_collection):
+    #* En MongoDB dos upserts simultáneos sobre el índice único terminan con un DuplicateKeyError para el que llegó segundo
+    await make_user("ana")
+    await make_user("beto")
+    calls = []
+
+    async def lost_race(bulk_write, operations, **kwargs):
+        #? El otro canje escribe ambas aristas justo antes, y este recibe el error de clave duplicada
+        calls.append(True)
+        await bulk_write(operations, **kwargs)
+        raise BulkWriteError({ "writeErrors": [{ "index": 0, "code": 11000 }, { "index": 1, "code": 11000 }], "nUpserted": 0 })
+    patch_collection("friendships", "bulk_write", lost_race)
+
+    assert not await add_friendship("beto", "ana")
+    assert calls
+    assert await db.friendships.count_documents({}) == 2
+
+async def test_add_friendship_other_bulk_errors_are_raised(db, make_user, patch_collection):
+    await make_user("ana")
+    await make_user("beto")
+
+    async def failing(bulk_write, operations, **kwargs):
+        raise BulkWriteError({ "writeErrors": [{ "index": 0, "code": 2 }], "nUpserted": 0 })
+    patch_collection("friendships", "bulk_write", failing)
+    with pytest.raises(BulkWriteError):
+        await add_friendship("ana", "beto")
+
+async def test_friends_page_is_most_recent_first(db, make_user):
+    for uid in ("ana", "beto", "carla", "dani"):
+        await make_user(uid)
+    for uid in ("beto", "carla", "dani"):
+        await add_friendship("ana", uid)
+        await asyncio.sleep(0.002)
+    first, cursor = await get_friends_page("ana", 2)
+    second, last = await get_friends_page("ana", 2, decode_cursor(cursor))
+    assert first == ["dani", "carla"]
+    assert second == ["beto"]
+    assert last is None
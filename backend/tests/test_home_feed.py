@@ -0,0 +1,62 @@
+#* Feed de inicio: paginación por cursor al mezclar el timeline acotado con los posts que se leen al armar el feed
+from datetime import datetime, timedelta
+from conftest import auth
+from env_handler import env
+from friends import add_friendship
+from timeline import fan_out_post, on_friendship
+
+START = datetime(2024, 1, 1)
+
+async def add_posts(db, author: str, public: bool, times: list):
+    #* Posts con fechas controladas (algunas repetidas, para que el desempate por id también se ejercite)
+    posts = [{
+        "id": f"{author}-{i:02d}",
+        "fecha": START + timedelta(minutes=minute),
+        "title": "Hola", "content": "wave", "files": [], "user": author, "public": public,
+        "likes": [], "like_count": 0, "comment_count": 0, "pinned": False,
+    } for i, minute in enumerate(times)]
+    for post in posts:
+        await db.posts.insert_one(dict(post))
+        await fan_out_post(post)
+    return [post["id"] for post in posts]
+
+async def walk(client, uid: str, limit: int) -> list:
+    seen = []
+    params = { "user": "public-friends", "limit": limit }
+    for _ in range(100):
+        body = (await client.get("/posts/", params=params, headers=auth(uid))).json()
+        seen += [post["id"] for post in body["result"]]
+        if not body["next_cursor"]:
+            return seen
+        params = { **params, "cursor": body["next_cursor"] }
+    raise AssertionError("the feed never ended")
+
+async def test_paging_past_the_timeline_cap(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(env, "TIMELINE_CAP", 5)
+    monkeypatch.setattr(env, "TIMELINE_FANOUT_LIMIT", 3)
+    await make_user("ana")
+    await make_user("beto")
+    await make_user("carla", public=True)
+    await make_user("star")
+    for uid in ("beto", "star"):
+        await add_friendship("ana", uid)
+        await on_friendship("ana", uid)
+    #? star tiene más amigos que TIMELINE_FANOUT_LIMIT, sus posts se leen al armar el feed
+    for i in range(4):
+        await make_user(f"fan{i}")
+        await add_friendship("star", f"fan{i}")
+        await on_friendship("star", f"fan{i}")
+
+    #* beto reparte 14 posts, pero el timeline de ana solo guarda los 5 más recientes
+    beto = await add_posts(db, "beto", False, [0, 3, 3, 7, 10, 12, 15, 15, 20, 21, 30, 31, 32, 40])
+    carla = await add_posts(db, "carla", True, [1, 3, 11, 22, 41])
+    star = await add_posts(db, "star", False, [2, 15, 33])
+    own = await add_posts(db, "ana", False, [5, 25])
+    assert len((await db.timelines.find_one({ "owner": "ana" }))["entries"]) == 5
+
+    #* Todos los posts son visibles para ana: de amigos, públicos o propios
+    ordered = sorted([(post["fecha"], post["id"]) async for post in db.posts.find({})], reverse=True)
+    expected = [post_id for _, post_id in ordered]
+    assert len(expected) == len(beto + carla + star + own)
+    for limit in (1, 2, 3, 4, 7, 50):
+        assert await walk(client, "ana", limit) == expected
@@ -0,0 +1,224 @@
+#* Procesamiento de imágenes en el pool de procesos, y subidas a un ImgBB falso (reintentos, caché por hash y subidas coalescidas)
+from cache import TTLCache
+from datetime import datetime, timedelta, timezone
+import asyncio
+import hashlib
+import httpx
+import io
+import pytest
+from PIL import Image
+from env_handler import env
+from images import InvalidImageError, UploadError, _get_process_pool, close_upload_client, process_image, upload_image
+import images
+
+@pytest.fixture
+async def pool():
+    yield _get_process_pool()
+    await close_upload_client()
+
+def png(size: tuple) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (0, 128, 255)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+async def test_workers_are_spawned(pool):
+    #? Los workers no se crean con fork, que copiaría el event loop y los hilos del proceso de la aplicación
+    assert pool._mp_context.get_start_method() == "spawn"
+
+async def test_process_image(pool):
+    full, thumbnail = await process_image(png((3000, 1500)))
+    with Image.open(io.BytesIO(full)) as image:
+        assert image.format == "WEBP"
+        assert image.size == (env.IMAGE_MAX_SIZE, env.IMAGE_MAX_SIZE // 2)
+    with Image.open(io.BytesIO(thumbnail)) as image:
+        assert image.size == (env.IMAGE_THUMBNAIL_SIZE, env.IMAGE_THUMBNAIL_SIZE // 2)
+
+async def test_invalid_image(pool):
+    with pytest.raises(InvalidImageError):
+        await process_image(b"not an image")
+
+def gif(size: tuple, colors: list) -> bytes:
+    #* GIF animado, un cuadro por color
+    frames = [Image.new("RGB", size, color) for color in colors]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, "GIF", save_all=True, append_images=frames[1:], duration=80, loop=0)
+    return buffer.getvalue()
+
+async def test_animated_gif_stays_animated(pool):
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+    full, thumbnail = await process_image(gif((2000, 1000), colors))
+    for data, size in ((full, env.IMAGE_MAX_SIZE), (thumbnail, env.IMAGE_THUMBNAIL_SIZE)):
+        with Image.open(io.BytesIO(data)) as image:
+            assert image.format == "WEBP"
+            assert image.is_animated and image.n_frames == len(colors)
+            assert image.size == (size, size // 2)
+            for i, color in enumerate(colors):
+                image.seek(i)
+                assert image.convert("RGB").getpixel((10, 10)) == pytest.approx(color, abs=8)
+                assert image.info["duration"] == 80
+
+async def test_long_animations_are_scaled_down(pool, monkeypatch):
+    #* El total de píxeles de todos los cuadros queda acotado, para no llenar la memoria del worker
+    monkeypatch.setattr(env, "IMAGE_MAX_ANIMATION_PIXELS", 40 * 100 * 100)
+    full, _ = await process_image(gif((400, 400), [(i * 6, 255 - i * 6, (i % 2) * 255) for i in range(40)]))
+    with Image.open(io.BytesIO(full)) as image:
+        assert image.n_frames == 40
+        assert image.size == (100, 100)
+
+async def test_static_gif(pool):
+    full, _ = await process_image(gif((300, 200), [(0, 0, 255)]))
+    with Image.open(io.BytesIO(full)) as image:
+        assert image.format == "WEBP"
+        assert not getattr(image, "is_animated", False)
+        assert image.size == (300, 200)
+
+class FakeImgBB:
+    #* Responde como la API de ImgBB, o con los errores que se encolen en `failures` (un código de estado o una excepción)
+    def __init__(self):
+        self.calls = 0
+        self.failures = []
+        self.expiration = 0
+        self.release = None
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        number = self.calls
+        if self.release:
+            await self.release.wait()
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return httpx.Response(failure, json={ "error": { "message": "failure" } })
+        return httpx.Response(200, json={ "data": { "url": f"https://i.ibb.test/{number}.webp", "expiration": self.expiration } })
+
+@pytest.fixture
+async def imgbb(db, monkeypatch):
+    host = FakeImgBB()
+    monkeypatch.setattr(env, "IMGDB_URL", "https://imgbb.test/1/upload")
+    monkeypatch.setattr(env, "UPLOAD_BACKOFF", 0)
+    monkeypatch.setattr(images, "_client", httpx.AsyncClient(transport=httpx.MockTransport(host)))
+    monkeypatch.setattr(images, "_url_cache", TTLCache(100, env.IMAGE_URL_TTL))
+    monkeypatch.setattr(images, "image_cache_stats", { "memory_hits": 0, "db_hits": 0, "misses": 0 })
+    yield host
+    await images._client.aclose()
+
+def digest_of(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+@pytest.mark.parametrize("failure", [503, 500, 429, httpx.ReadTimeout("timeout"), httpx.ConnectError("refused")])
+async def test_upload_retries_temporary_errors(imgbb, failure):
+    imgbb.failures = [failure] * env.UPLOAD_RETRIES
+    assert await upload_image(b"image") == f"https://i.ibb.test/{env.UPLOAD_RETRIES + 1}.webp"
+    assert imgbb.calls == env.UPLOAD_RETRIES + 1
+
+async def test_upload_backoff(imgbb, monkeypatch):
+    #* Entre intentos se espera con backoff exponencial
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record(delay, *args, **kwargs):
+        delays.append(delay)
+        await sleep(0)
+    monkeypatch.setattr(env, "UPLOAD_BACKOFF", 0.5)
+    monkeypatch.setattr(images.asyncio, "sleep", record)
+    imgbb.failures = [502] * env.UPLOAD_RETRIES
+    await upload_image(b"image")
+    assert delays == [0.5 * 2 ** attempt for attempt in range(env.UPLOAD_RETRIES)]
+
+async def test_upload_gives_up(imgbb, db):
+    imgbb.failures = [502] * (env.UPLOAD_RETRIES + 1)
+    with pytest.raises(UploadError):
+        await upload_image(b"image")
+    assert imgbb.calls == env.UPLOAD_RETRIES + 1
+    #? Un fallo no queda en caché, la siguiente subida vuelve a intentarlo
+    assert await db.images.count_documents({}) == 0
+    assert await upload_image(b"image")
+    assert imgbb.calls == env.UPLOAD_RETRIES + 2
+
+@pytest.mark.parametrize("status", [400, 403])
+async def test_upload_does_not_retry_rejections(imgbb, status):
+    imgbb.failures = [status]
+    with pytest.raises(UploadError):
+        await upload_image(b"image")
+    assert imgbb.calls == 1
+
+async def test_same_bytes_are_uploaded_once(imgbb, db):
+    url = await upload_image(b"image")
+    #* Los mismos bytes salen de la caché en memoria
+    assert await upload_image(b"image") == url
+    assert await upload_image(io.BytesIO(b"image")) == url
+    assert imgbb.calls == 1
+    assert images.image_cache_stats == { "memory_hits": 2, "db_hits": 0, "misses": 1 }
+    #* Otro proceso (sin la caché en memoria) la encuentra en la colección images
+    images._url_cache.clear()
+    assert await upload_image(b"image") == url
+    assert imgbb.calls == 1
+    assert images.image_cache_stats["db_hits"] == 1
+    stored = await db.images.find_one({ "hash": digest_of(b"image") })
+    assert stored["url"] == url
+    #* Bytes distintos sí se suben
+    assert await upload_image(b"other image") != url
+    assert imgbb.calls == 2
+
+async def test_expired_urls_are_uploaded_again(imgbb, db):
+    #* ImgBB puede hacer expirar la imagen antes que IMAGE_URL_TTL, la entrada vence con ella
+    imgbb.expiration = 60
+    url = await upload_image(b"image")
+    stored = await db.images.find_one({ "hash": digest_of(b"image") })
+    expires_at = stored["expires_at"].replace(tzinfo=timezone.utc)
+    assert timedelta(seconds=55) < expires_at - datetime.now(timezone.utc) <= timedelta(seconds=60)
+
+    #* Vencida, pero todavía sin borrar por el índice TTL (corre cada minuto): no se usa y se vuelve a subir
+    await db.images.update_one({ "hash": digest_of(b"image") }, { "$set": { "expires_at": datetime.now(timezone.utc) - timedelta(seconds=1) } })
+    images._url_cache.clear()
+    new_url = await upload_image(b"image")
+    assert new_url != url
+    assert imgbb.calls == 2
+    stored = await db.images.find_one({ "hash": digest_of(b"image") })
+    assert stored["url"] == new_url
+    assert stored["expires_at"].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+    #? Una sola entrada por hash, la vencida se reemplaza
+    assert await db.images.count_documents({}) == 1
+
+async def test_expired_memory_entries_fall_back_to_the_database(imgbb):
+    url = await upload_image(b"image")
+    images._url_cache.set(digest_of(b"image"), url, ttl=0.01)
+    await asyncio.sleep(0.02)
+    assert await upload_image(b"image") == url
+    assert imgbb.calls == 1
+    assert images.image_cache_stats["db_hits"] == 1
+
+async def test_images_ttl_index(db):
+    #* Las entradas vencidas las borra MongoDB con el índice TTL sobre expires_at
+    indexes = await db.images.index_information()
+    assert any(list(index["key"]) == [("expires_at", 1)] and index.get("expireAfterSeconds") == 0 for index in indexes.values())
+
+async def test_concurrent_uploads_are_coalesced(imgbb, db):
+    #* Los mismos bytes subidos a la vez esperan a la primera subida en vez de subirse otra vez
+    imgbb.release = asyncio.Event()
+    uploads = [asyncio.create_task(upload_image(b"image")) for _ in range(20)]
+    other = asyncio.create_task(upload_image(b"other image"))
+    while imgbb.calls < 2:
+        await asyncio.sleep(0)
+    imgbb.release.set()
+    urls = await asyncio.gather(*uploads)
+    assert len(set(urls)) == 1
+    assert await other != urls[0]
+    assert imgbb.calls == 2
+    assert images._inflight == {}
+
+async def test_coalesced_uploads_share_the_error(imgbb):
+    imgbb.release = asyncio.Event()
+    imgbb.failures = [400]
+    uploads = [asyncio.create_task(upload_image(b"image")) for _ in range(5)]
+    while imgbb.calls < 1:
+        await asyncio.sleep(0)
+    imgbb.release.set()
+    results = await asyncio.gather(*uploads, return_exceptions=True)
+    assert all(isinstance(result, UploadError) for result in results)
+    assert imgbb.calls == 1
+    #? La subida fallida ya no está en curso, la siguiente vuelve a ImgBB
+    imgbb.release = None
+    assert await upload_image(b"image")
+    assert imgbb.calls == 2
@@ -0,0 +1,148 @@
+#* Índices: reemplazo de un índice existente y planes de las consultas de la aplicación
+#? Los planes se revisan con explain() contra un MongoDB real (mongomock no tiene planificador), indicado con
+#? WAVENET_TEST_MONGO_URL=mongodb://localhost:27017. Sin esa variable esas pruebas se omiten.
+from datetime import datetime, timedelta, timezone
+import os
+import pytest
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from pymongo.monitoring import CommandListener
+from conftest import auth
+import friends
+import indexes
+import profiles
+import util
+
+class FakeCollection:
+    #* Colección con un índice { email: 1 } no único, y la creación del único falla o no según `duplicates`
+    name = "users"
+
+    def __init__(self, duplicates: bool):
+        self.duplicates = duplicates
+        self.indexes = { "_id_": { "key": [("_id", 1)], "v": 2 }, "email_1": { "key": [("email", 1)], "v": 2 } }
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    async def drop_index(self, name):
+        del self.indexes[name]
+
+    async def create_indexes(self, models):
+        for model in models:
+            document = model.document
+            name = document["name"]
+            if name in self.indexes:
+                raise OperationFailure("Index with name email_1 already exists with different options", code=85)
+            if document.get("unique") and self.duplicates:
+                raise OperationFailure("E11000 duplicate key error", code=11000)
+            self.indexes[name] = { "key": list(document["key"].items()), "v": 2, **{ k: v for k, v in document.items() if k not in ("key", "name") } }
+
+async def test_conflicting_index_is_replaced():
+    collection = FakeCollection(duplicates=False)
+    await indexes._create(collection, IndexModel("email", unique=True))
+    assert collection.indexes["email_1"]["unique"] is True
+
+async def test_failed_rebuild_restores_the_previous_index():
+    collection = FakeCollection(duplicates=True)
+    with pytest.raises(OperationFailure):
+        await indexes._create(collection, IndexModel("email", unique=True))
+    #* El índice anterior sigue ahí, con sus mismas opciones
+    assert collection.indexes["email_1"]["key"] == [("email", ASCENDING)]
+    assert "unique" not in collection.indexes["email_1"]
+
+#* Planes de consultas contra MongoDB
+class FindRecorder(CommandListener):
+    #* Guarda (colección, filtro, orden) de cada consulta que llega al servidor, incluidos los filtros de updates y deletes
+    def __init__(self):
+        self.queries = []
+
+    def started(self, event):
+        command = event.command
+        if event.command_name == "find":
+            self.queries.append((command["find"], command.get("filter", {}), list(command.get("sort", {}).items()) or None))
+        elif event.command_name in ("update", "delete"):
+            for statement in command.get(event.command_name + "s", []):
+                self.queries.append((command[event.command_name], statement["q"], None))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+recorder = FindRecorder()
+
+@pytest.fixture
+async def mongo_db():
+    url = os.environ.get("WAVENET_TEST_MONGO_URL")
+    if not url:
+        pytest.skip("WAVENET_TEST_MONGO_URL is not set")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from db import use_database
+    client = AsyncIOMotorClient(url, event_listeners=[recorder])
+    database = client["wavenet_test_plans"]
+    await client.drop_database(database.name)
+    assert await indexes.apply_indexes(database) == []
+    use_database(database)
+    for cache in (profiles.profile_cache, friends._chat_members, util.wavebond_cache):
+        cache.clear()
+    yield database
+    await client.drop_database(database.name)
+    client.close()
+
+async def test_registered_queries_use_indexes(mongo_db):
+    assert await indexes.check_query_plans(mongo_db) == []
+
+async def test_route_queries_use_indexes(mongo_db):
+    import app as app_module
+    import httpx
+    from bench.backends import FakeTokenVerifier
+    from timeline import on_friendship
+
+    application = app_module.create_app(database=mongo_db, verifier=FakeTokenVerifier(), create_indexes=False)
+    for uid, public in (("ana", False), ("beto", False), ("carla", True)):
+        await mongo_db.users.insert_one({ "uid": uid, "username": uid, "username_lower": uid, "email": f"{uid}@wavenet.test", "public_profile": public, "friends": [] })
+    for other in ("beto", "carla"):
+        await friends.add_friendship("ana", other)
+        await on_friendship("ana", other)
+    #? carla se lee al armar el feed (como un autor con demasiados amigos), así también se envía la parte pull con cursor
+    await mongo_db.friendships.update_many({ "friend": "carla" }, { "$set": { "pull": True } })
+
+    recorder.queries.clear()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url="http://wavenet.test") as client:
+        for uid in ("ana", "beto", "carla", "ana", "beto", "carla"):
+            await client.post("/create-post/", data={ "title": "Hola", "content": "wave" }, headers=auth(uid))
+        post_id = (await mongo_db.posts.find_one({ "user": "beto" }))["id"]
+
+        async def walk(path: str, params: dict, cursor_param: str = "cursor", cursor_field: str = "next_cursor"):
+            #* Recorre todas las páginas, así se envían las consultas con y sin cursor
+            params = { "limit": 1, **params }
+            for _ in range(10):
+                body = (await client.get(path, params=params, headers=auth("ana"))).json()
+                if not body.get(cursor_field):
+                    return
+                params = { **params, cursor_param: body[cursor_field] }
+
+        await walk("/posts/", { "user": "public-friends" })
+        await walk("/posts/", { "user": "beto" })
+        await walk("/chats/", {})
+        await walk("/friends/", {})
+        await walk("/search/", { "q": "b", "type": "users" })
+        chat_id = friends.chat_id_for("ana", "beto")
+        await mongo_db.messages.insert_many([{ "id": f"m{i}", "fecha": datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=i), "content": "hola", "files": "", "user": "ana", "chat": chat_id } for i in range(3)])
+        await walk(f"/messages/{chat_id}", {}, "before", "prev_cursor")
+        latest = (await client.get(f"/messages/{chat_id}", headers=auth("ana"))).json()
+        await client.get(f"/messages/{chat_id}", params={ "since": latest["next_cursor"] }, headers=auth("ana"))
+        await client.post("/chats/" + chat_id + "/read", headers=auth("ana"))
+        comment = (await client.post(f"/posts/{post_id}/comments", json={ "content": "hola" }, headers=auth("ana"))).json()["comment"]
+        await client.post(f"/posts/{post_id}/comments", json={ "content": "re", "parent": comment["id"] }, headers=auth("ana"))
+        await walk(f"/posts/{post_id}/comments", {})
+        await walk(f"/comments/{comment['id']}/replies", {})
+        await client.post("/like/", json={ "type": "posts", "id": post_id }, headers=auth("ana"))
+        await client.delete(f"/comment/{comment['id']}", headers=auth("ana"))
+        await client.delete(f"/post/{post_id}", headers=auth("beto"))
+
+    sent = recorder.queries[:]
+    assert sent
+    problems = await indexes.check_query_plans(mongo_db, sent)
+    assert problems == []
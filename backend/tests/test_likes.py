@@ -0,0 +1,48 @@
+#* Likes bajo concurrencia: miles de toggles a la vez sobre el mismo post o comentario
+import asyncio
+import random
+from conftest import auth
+from util import toggle_like
+
+USERS = 300
+
+async def stored(db, collection: str, id: str) -> dict:
+    return await db[collection].find_one({ "id": id }, { "_id": 0, "likes": 1, "like_count": 1 })
+
+async def test_concurrent_like_toggles(client, interleaved, make_user):
+    db = interleaved
+    await make_user("ana", public=True)
+    post = (await client.post("/create-post/", data={ "title": "Wave", "content": "Wave" }, headers=auth("ana"))).json()["post"]["id"]
+    rng = random.Random(7)
+    toggles = { f"fan{i:03d}": rng.randint(1, 8) for i in range(USERS) }
+    for uid in toggles:
+        await make_user(uid, public=True)
+
+    async def toggle(uid: str, times: int) -> list:
+        results = []
+        for _ in range(times):
+            response = await client.post("/like/", json={ "id": post, "type": "posts" }, headers=auth(uid))
+            assert response.status_code == 200
+            results.append(response.json()["liked"])
+        return results
+
+    #* Todos los usuarios a la vez, cada operación de la base de datos cede el event loop
+    results = await asyncio.gather(*(toggle(uid, times) for uid, times in toggles.items()))
+    assert sum(toggles.values()) > 1000
+    #* Cada toggle de un mismo usuario alterna el estado, y al final quedan con like los que hicieron un número impar
+    for (uid, times), liked in zip(toggles.items(), results):
+        assert liked == [i % 2 == 0 for i in range(times)], uid
+    likers = sorted(uid for uid, times in toggles.items() if times % 2)
+    post = await stored(db, "posts", post)
+    assert sorted(post["likes"]) == likers
+    assert post["like_count"] == len(likers)
+
+async def test_concurrent_toggles_by_the_same_user(interleaved, make_user):
+    db = interleaved
+    await db.comments.insert_one({ "id": "c1", "post": "p1", "parent": None, "user": "ana", "likes": [], "like_count": 0 })
+    #* El mismo usuario dispara muchos toggles a la vez (p. ej. doble clic repetido): el contador nunca se desfasa
+    results = await asyncio.gather(*(toggle_like(db.comments, "c1", "bruno") for _ in range(1001)))
+    comment = await stored(db, "comments", "c1")
+    assert comment["like_count"] == len(comment["likes"]) == 1
+    assert [liked for liked, _ in results].count(True) == 501
+    assert all(0 <= like_count <= 1 for _, like_count in results)
@@ -0,0 +1,69 @@
+from pymongo.errors import AutoReconnect
+from friends import add_friendship, chat_id_for
+from message_writer import MessageWriter
+from models import Message
+
+async def two_chats(make_user):
+    for uid in ("ana", "beto", "carla"):
+        await make_user(uid)
+    await add_friendship("ana", "beto")
+    await add_friendship("ana", "carla")
+    return chat_id_for("ana", "beto"), chat_id_for("ana", "carla")
+
+async def test_stop_persists_everything_queued(db, make_user):
+    beto_chat, carla_chat = await two_chats(make_user)
+    #* Un intervalo largo: nada se escribe por tiempo, solo por lotes completos o al apagar
+    writer = MessageWriter(flush_interval=60, batch_size=3)
+    writer.start()
+    sent = []
+    for i in range(7):
+        chat, user = (beto_chat, "ana" if i % 2 else "beto") if i < 5 else (carla_chat, "carla")
+        message = Message(content=f"hola {i}", files="", user=user, chat=chat).model_dump()
+        sent.append(message["id"])
+        writer.enqueue(message)
+    await writer.stop()
+
+    assert writer.depth == 0
+    assert writer.written == 7
+    stored = await db.messages.find({}, { "_id": 0, "id": 1 }).to_list(length=None)
+    assert sorted(message["id"] for message in stored) == sorted(sent)
+    #* Los no leídos cuentan solo los mensajes del otro participante, y la vista previa es el último mensaje de cada chat
+    inbox = { (entry["chat"], entry["owner"]): entry async for entry in db.inbox.find({}, { "_id": 0 }) }
+    assert inbox[(beto_chat, "ana")]["unread"] == 3
+    assert inbox[(beto_chat, "beto")]["unread"] == 2
+    assert inbox[(carla_chat, "ana")]["unread"] == 2
+    assert inbox[(carla_chat, "carla")]["unread"] == 0
+    assert inbox[(beto_chat, "ana")]["last_message"]["content"] == "hola 4"
+    assert inbox[(carla_chat, "carla")]["last_message"]["id"] == sent[-1]
+
+async def test_failed_batches_stay_queued(db, make_user, patch_collection):
+    beto_chat, _ = await two_chats(make_user)
+    writer = MessageWriter(flush_interval=60, batch_size=10)
+    calls = []
+
+    async def flaky_insert_many(insert_many, *args, **kwargs):
+        calls.append(True)
+        if len(calls) == 1:
+            raise AutoReconnect("connection reset")
+        return await insert_many(*args, **kwargs)
+    patch_collection("messages", "insert_many", flaky_insert_many)
+
+    writer.enqueue(Message(content="hola", files="", user="ana", chat=beto_chat).model_dump())
+    await writer.flush()
+    assert writer.depth == 1
+    assert await db.messages.count_documents({}) == 0
+    await writer.flush()
+    assert writer.depth == 0
+    assert await db.messages.count_documents({}) == 1
+
+async def test_readers_are_not_counted_as_unread(db, make_user):
+    beto_chat, carla_chat = await two_chats(make_user)
+    writer = MessageWriter(flush_interval=60, batch_size=10)
+    #* Beto tenía el chat abierto al llegar el primer mensaje, el segundo le llegó con el chat cerrado
+    writer.enqueue(Message(content="hola", files="", user="ana", chat=beto_chat).model_dump(), readers=["ana", "beto"])
+    writer.enqueue(Message(content="chao", files="", user="ana", chat=beto_chat).model_dump(), readers=["ana"])
+    writer.enqueue(Message(content="hola", files="", user="ana", chat=carla_chat).model_dump(), readers=["ana", "carla"])
+    await writer.flush()
+    inbox = { (entry["chat"], entry["owner"]): entry["unread"] async for entry in db.inbox.find({}, { "_id": 0 }) }
+    assert inbox == { (beto_chat, "ana"): 0, (beto_chat, "beto"): 1, (carla_chat, "ana"): 0, (carla_chat, "carla"): 0 }
+    assert writer._readers == {}
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from conftest import auth
+from friends import add_friendship, chat_id_for
+from pagination import encode_cursor
+
+async def make_chat(db, make_user, messages: int = 0):
+    await make_user("ana")
+    await make_user("beto")
+    await make_user("carla")
+    await add_friendship("ana", "beto")
+    chat_id = chat_id_for("ana", "beto")
+    start = datetime(2024, 1, 1)
+    if messages:
+        await db.messages.insert_many([{
+            "id": f"m{i:03d}",
+            "fecha": start + timedelta(seconds=i),
+            "content": f"hola {i}",
+            "files": "",
+            "user": "ana" if i % 2 else "beto",
+            "chat": chat_id,
+        } for i in range(messages)])
+    return chat_id
+
+async def test_members_read_the_latest_messages(client, db, make_user):
+    chat_id = await make_chat(db, make_user, messages=3)
+    response = await client.get(f"/messages/{chat_id}", headers=auth("beto"))
+    assert response.status_code == 200
+    body = response.json()
+    assert [message["id"] for message in body["result"]] == ["m000", "m001", "m002"]
+    assert body["result"][0]["user"]["uid"] == "beto"
+    assert body["prev_cursor"] is None
+
+async def test_non_members_cant_read_a_chat(client, db, make_user):
+    chat_id = await make_chat(db, make_user, messages=3)
+    response = await client.get(f"/messages/{chat_id}", headers=auth("carla"))
+    assert response.status_code == 404
+    assert response.json() == { "status": "error", "message": "Chat not found." }
+    #? Lo mismo con un cursor, la membresía se revisa antes de paginar
+    response = await client.get(f"/messages/{chat_id}", params={ "since": encode_cursor(datetime(2024, 1, 1), "m000") }, headers=auth("carla"))
+    assert response.status_code == 404
+
+async def test_unknown_chat(client, db, make_user):
+    await make_chat(db, make_user)
+    response = await client.get("/messages/missing", headers=auth("ana"))
+    assert response.status_code == 404
+
+async def test_older_pages_with_before(client, db, make_user):
+    chat_id = await make_chat(db, make_user, messages=5)
+    seen = []
+    params = { "limit": 2 }
+    while True:
+        body = (await client.get(f"/messages/{chat_id}", params=params, headers=auth("ana"))).json()
+        seen = [message["id"] for message in body["result"]] + seen
+        if not body["prev_cursor"]:
+            break
+        params = { "limit": 2, "before": body["prev_cursor"] }
+    assert seen == ["m000", "m001", "m002", "m003", "m004"]
+
+async def unread(client, uid: str) -> dict:
+    response = await client.get("/chats/", headers=auth(uid))
+    return { chat["id"]: chat["unread"] for chat in response.json()["result"] }
+
+async def test_read_chat(client, db, make_user):
+    import app as app_module
+    from models import Message
+    chat_id = await make_chat(db, make_user)
+    for i in range(3):
+        app_module.message_writer.enqueue(Message(content=f"hola {i}", files="", user="ana", chat=chat_id).model_dump())
+    await app_module.message_writer.flush()
+    assert await unread(client, "beto") == { chat_id: 3 }
+    assert await unread(client, "ana") == { chat_id: 0 }
+
+    response = await client.post(f"/chats/{chat_id}/read", headers=auth("beto"))
+    assert response.json() == { "status": "success" }
+    assert await unread(client, "beto") == { chat_id: 0 }
+    #* Sin sesión o sin ser participante, como si el chat no existiera
+    for headers in ({}, { "Authorization": "Bearer garbage" }, auth("carla")):
+        response = await client.post(f"/chats/{chat_id}/read", headers=headers)
+        assert response.status_code == 404
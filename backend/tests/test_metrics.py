@@ -0,0 +1,31 @@
+#* Gauges calculados (metrics.gauge_from) en un solo proceso y en modo multiproceso
+import os
+import subprocess
+import sys
+import textwrap
+from metrics import gauge_from, render_metrics
+
+def test_gauge_follows_its_function():
+    depth = [3]
+    gauge_from("test_queue_depth", "Test queue depth", lambda: depth[0])
+    assert b"test_queue_depth 3.0" in render_metrics()[0]
+    depth[0] = 7
+    assert b"test_queue_depth 7.0" in render_metrics()[0]
+
+def test_broken_gauge_does_not_break_metrics():
+    gauge_from("test_broken_gauge", "Gauge whose function fails", lambda: 1 / 0)
+    body, _ = render_metrics()
+    assert b"test_queue_depth" in body
+
+def test_gauges_in_multiprocess_mode(tmp_path):
+    #? prometheus_client elige dónde guardar los valores al importarse, por eso se prueba en otro proceso
+    script = textwrap.dedent("""
+        from metrics import gauge_from, render_metrics
+        gauge_from("test_queue_depth", "Test queue depth", lambda: 4)
+        gauge_from("test_hit_ratio", "Test hit ratio", lambda: 0.5, multiprocess_mode="liveall")
+        print(render_metrics()[0].decode())
+    """)
+    env = { **os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path) }
+    result = subprocess.run([sys.executable, "-c", script], env=env, cwd=os.path.dirname(os.path.dirname(__file__)), capture_output=True, text=True, timeout=60, check=True)
+    assert "test_queue_depth 4.0" in result.stdout
+    assert 'test_hit_ratio{pid="' in result.stdout
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+from conftest import auth
+from pagination import decode_cursor, encode_cursor
+
+async def test_create_post_returns_utc_dates(client, db, make_user):
+    await make_user("ana")
+    before = datetime.now(timezone.utc)
+    response = await client.post("/create-post/", data={ "title": "Hola", "content": "Primer post" }, headers=auth("ana"))
+    assert response.status_code == 200
+    post = response.json()["post"]
+    fecha = datetime.fromisoformat(post["fecha"])
+    #* La fecha de la respuesta lleva su zona horaria y es la misma que queda guardada (Mongo la retorna en UTC sin zona)
+    assert fecha.utcoffset() == timedelta(0)
+    assert fecha - before < timedelta(minutes=1)
+    stored = await db.posts.find_one({ "id": post["id"] })
+    assert stored["fecha"].replace(tzinfo=timezone.utc) == fecha.replace(microsecond=fecha.microsecond // 1000 * 1000)
+
+async def test_post_pages_are_serialized_in_utc(client, db, make_user):
+    await make_user("ana")
+    await client.post("/create-post/", data={ "title": "Hola", "content": "Primer post" }, headers=auth("ana"))
+    response = await client.get("/posts/", params={ "user": "ana" }, headers=auth("ana"))
+    assert response.json()["result"][0]["fecha"].endswith("+00:00")
+
+def test_cursors_are_normalized_to_naive_utc():
+    local = datetime(2024, 1, 1, 9, 30, tzinfo=timezone(timedelta(hours=-3)))
+    fecha, id = decode_cursor(encode_cursor(local, "p1"))
+    assert (fecha, id) == (datetime(2024, 1, 1, 12, 30), "p1")
+    assert decode_cursor(encode_cursor(datetime(2024, 1, 1, 12, 30), "p1")) == (fecha, id)
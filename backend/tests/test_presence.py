@@ -0,0 +1,139 @@
+#* Membresía de rooms en memoria bajo mucha rotación de conexiones, y compartida entre procesos con Redis
+import fakeredis
+import pytest
+import random
+from realtime import MemoryPresence, RedisPresence, create_presence
+
+SIDS = 20000
+ROOMS = 500
+USERS = 5000
+
+async def test_presence_under_churn():
+    presence = MemoryPresence()
+    rng = random.Random(1)
+    sids = [f"sid{i}" for i in range(SIDS)]
+    uid_of = { sid: f"user{rng.randrange(USERS)}" for sid in sids }
+    rooms_of = { sid: { f"room{rng.randrange(ROOMS)}" for _ in range(3) } for sid in sids }
+    #* Registro esperado: room -> uid -> sids
+    expected = {}
+    joined_events = 0
+    for sid in sids:
+        for room in rooms_of[sid]:
+            first = not expected.get(room, {}).get(uid_of[sid])
+            assert await presence.join(sid, room, uid_of[sid]) == first
+            #? Entrar dos veces al mismo room no cambia nada
+            assert not await presence.join(sid, room, uid_of[sid])
+            expected.setdefault(room, {}).setdefault(uid_of[sid], set()).add(sid)
+            joined_events += first
+    assert presence.room_count() == len(expected)
+    assert joined_events == sum(len(members) for members in expected.values())
+
+    #* La mitad sale de un room y la otra mitad se desconecta
+    rng.shuffle(sids)
+    for sid in sids[:SIDS // 2]:
+        room = sorted(rooms_of[sid])[0]
+        expected[room][uid_of[sid]].discard(sid)
+        assert await presence.leave(sid, room) == (not expected[room][uid_of[sid]])
+        assert not await presence.leave(sid, room)
+        rooms_of[sid].discard(room)
+    for sid in sids[SIDS // 2:]:
+        gone = []
+        for room in rooms_of[sid]:
+            expected[room][uid_of[sid]].discard(sid)
+            if not expected[room][uid_of[sid]]:
+                gone.append(room)
+        uid, left = await presence.disconnect(sid)
+        assert uid == uid_of[sid]
+        assert sorted(left) == sorted(gone)
+        assert await presence.uid_of(sid) is None
+
+    for room, members in expected.items():
+        assert sorted(await presence.members(room)) == sorted(uid for uid, room_sids in members.items() if room_sids)
+    for sid in sids[:SIDS // 2]:
+        assert sid in await presence.sids_of(uid_of[sid])
+    for sid in sids[SIDS // 2:]:
+        assert sid not in await presence.sids_of(uid_of[sid])
+    assert presence.room_count() == sum(1 for members in expected.values() if any(members.values()))
+
+    #* Al desconectarse todos, no queda ningún registro
+    for sid in sids[:SIDS // 2]:
+        await presence.disconnect(sid)
+    assert presence.room_count() == 0
+    assert presence._connections == {} and presence._uids == {}
+
+#* Membresía compartida en Redis, con un servidor falso (fakeredis ejecuta los scripts de Lua con lupa)
+#? Cada RedisPresence representa un proceso distinto conectado al mismo Redis
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    import redis.asyncio
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.asyncio, "from_url", lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs))
+    return server
+
+async def test_redis_presence_is_shared_between_instances(redis_server):
+    first, second = RedisPresence("redis://presence"), RedisPresence("redis://presence")
+    #* Entrar por un proceso se ve desde el otro
+    assert await first.join("ana-1", "room", "ana")
+    assert await second.members("room") == ["ana"]
+    assert await second.uid_of("ana-1") == "ana"
+    #? Una segunda pestaña del mismo usuario, conectada al otro proceso, no vuelve a "entrar"
+    assert not await second.join("ana-2", "room", "ana")
+    assert await second.join("bruno-1", "room", "bruno")
+    assert sorted(await first.members("room")) == ["ana", "bruno"]
+    assert await first.sids_of("ana") == { "ana-1", "ana-2" }
+
+    #* Salir por un proceso también se ve desde el otro, y solo cuenta como salida con el último sid
+    assert not await first.leave("ana-1", "room")
+    assert sorted(await second.members("room")) == ["ana", "bruno"]
+    assert await first.leave("ana-2", "room")
+    assert await second.members("room") == ["bruno"]
+
+    #* Cualquier proceso puede desconectar un sid, aunque haya entrado por el otro
+    assert await second.disconnect("bruno-1") == ("bruno", ["room"])
+    assert await first.members("room") == []
+    assert await first.uid_of("bruno-1") is None
+    assert await first.disconnect("bruno-1") == (None, [])
+    await first.close()
+    await second.close()
+
+async def test_redis_presence_under_churn(redis_server):
+    #* Las mismas reglas que MemoryPresence, con cada operación llegando a un proceso al azar
+    instances = [RedisPresence("redis://presence") for _ in range(3)]
+    reference = MemoryPresence()
+    rng = random.Random(2)
+    sids = [f"sid{i}" for i in range(300)]
+    uid_of = { sid: f"user{rng.randrange(40)}" for sid in sids }
+    rooms = [f"room{i}" for i in range(20)]
+    for _ in range(2000):
+        sid = rng.choice(sids)
+        presence = rng.choice(instances)
+        action = rng.random()
+        if action < 0.6:
+            room = rng.choice(rooms)
+            assert await presence.join(sid, room, uid_of[sid]) == await reference.join(sid, room, uid_of[sid])
+        elif action < 0.9:
+            room = rng.choice(rooms)
+            assert await presence.leave(sid, room) == await reference.leave(sid, room)
+        else:
+            uid, gone = await presence.disconnect(sid)
+            expected_uid, expected_gone = await reference.disconnect(sid)
+            assert (uid, sorted(gone)) == (expected_uid, sorted(expected_gone))
+    for room in rooms:
+        expected = sorted(await reference.members(room))
+        for presence in instances:
+            assert sorted(await presence.members(room)) == expected
+    for presence in instances:
+        await presence.close()
+
+def test_create_presence(redis_server):
+    assert isinstance(create_presence(None), MemoryPresence)
+    assert isinstance(create_presence("redis://presence"), RedisPresence)
+    assert isinstance(create_presence("redis://presence", "amqp://queue"), RedisPresence)
+    #! Con varios procesos (cola de mensajes) la memoria de cada uno no alcanza, no se arranca en vez de fallar en silencio
+    with pytest.raises(ValueError, match="PRESENCE_URL"):
+        create_presence(None, "amqp://queue")
+    with pytest.raises(ValueError, match="PRESENCE_URL"):
+        create_presence("amqp://queue", "amqp://queue")
+    with pytest.raises(ValueError):
+        create_presence("memcached://presence")
@@ -0,0 +1,167 @@
+#* Sockets: autenticación en el handshake y membresía de los rooms, con un cliente de Socket.IO real contra uvicorn
+from datetime import datetime, timedelta
+import asyncio
+import io
+import json
+import pytest
+import socketio
+import uvicorn
+from PIL import Image
+from bench.backends import token_for
+from conftest import auth
+from env_handler import env
+from friends import add_friendship, chat_id_for
+
+@pytest.fixture
+async def server_url(application):
+    #? El servidor corre en el mismo event loop que la prueba, así comparte la base de datos en memoria
+    server = uvicorn.Server(uvicorn.Config(application, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    await task
+
+@pytest.fixture
+async def people(db, make_user):
+    for uid in ("ana", "beto", "carla"):
+        await make_user(uid)
+    await add_friendship("ana", "beto")
+    return chat_id_for("ana", "beto")
+
+class Client:
+    #* Cliente de Socket.IO que deja cada evento recibido en una cola
+    def __init__(self):
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.events = asyncio.Queue()
+        for event in ("message", "error", "room_users", "presence"):
+            self.sio.on(event, self._handler(event))
+
+    def _handler(self, event):
+        async def handler(data):
+            await self.events.put((event, data))
+        return handler
+
+    async def connect(self, url: str, auth):
+        await self.sio.connect(url, auth=auth, transports=["websocket"])
+        #? El primer evento es el aviso de conexión
+        assert (await self.next("message"))["info"]
+        return self
+
+    async def next(self, event: str, timeout: float = 2):
+        while True:
+            name, data = await asyncio.wait_for(self.events.get(), timeout)
+            if name == event:
+                return data
+
+@pytest.fixture
+async def connect(server_url):
+    clients = []
+
+    async def connect(uid: str):
+        client = await Client().connect(server_url, { "token": token_for(uid) })
+        clients.append(client)
+        return client
+    yield connect
+    for client in clients:
+        await client.sio.disconnect()
+
+@pytest.mark.parametrize("auth", [None, {}, { "token": "" }, { "token": "forged" }, { "token": token_for("nobody") }])
+async def test_handshake_refuses_bad_tokens(server_url, people, auth):
+    with pytest.raises(socketio.exceptions.ConnectionError):
+        await Client().connect(server_url, auth)
+
+async def test_spoofed_user_cant_join_someone_elses_chat(connect, people):
+    carla = await connect("carla")
+    #* El uid sale de la sesión del handshake, el "user" del payload se ignora
+    await carla.sio.emit("join_room", { "room": people, "user": { "uid": "ana" } })
+    assert (await carla.next("error"))["error"] == "No perteneces a este chat"
+
+async def test_non_member_cant_send(connect, people):
+    carla = await connect("carla")
+    await carla.sio.emit("send_message", { "room": people, "content": "hola", "user": { "uid": "ana" } })
+    assert (await carla.next("error"))["error"] == "No perteneces a este chat"
+
+async def test_members_send_as_themselves(connect, people):
+    ana = await connect("ana")
+    beto = await connect("beto")
+    for client in (ana, beto):
+        await client.sio.emit("join_room", { "room": people })
+        await client.next("room_users")
+    await ana.sio.emit("send_message", { "room": people, "content": "hola", "user": { "uid": "beto", "username": "beto" } })
+    message = json.loads((await beto.next("message"))["message"])
+    assert message["content"] == "hola"
+    assert message["user"]["uid"] == "ana"
+    assert datetime.fromisoformat(message["fecha"]).utcoffset() == timedelta(0)
+
+async def unread(client, uid: str) -> dict:
+    import app as app_module
+    #? El escritor de mensajes no corre sin lifespan, se vacía a mano antes de leer la bandeja
+    await app_module.message_writer.flush()
+    response = await client.get("/chats/", headers=auth(uid))
+    return { chat["id"]: chat["unread"] for chat in response.json()["result"] }
+
+async def send(sender: Client, receivers: list, room: str, content: str):
+    await sender.sio.emit("send_message", { "room": room, "content": content })
+    for receiver in receivers:
+        assert json.loads((await receiver.next("message"))["message"])["content"] == content
+
+async def test_messages_read_live_are_not_unread(client, connect, people):
+    ana = await connect("ana")
+    beto = await connect("beto")
+    for member in (ana, beto):
+        await member.sio.emit("join_room", { "room": people })
+        await member.next("room_users")
+    await send(ana, [ana, beto], people, "hola")
+    await send(beto, [ana, beto], people, "qué tal")
+    #* Beto cierra la pestaña con el chat abierto (sin leave_room): lo que vio no queda como no leído
+    await beto.sio.disconnect()
+    await send(ana, [ana], people, "¿sigues ahí?")
+    assert (await unread(client, "beto"))[people] == 1
+    assert (await unread(client, "ana"))[people] == 0
+
+async def test_unread_until_the_chat_is_opened(client, connect, people):
+    ana = await connect("ana")
+    beto = await connect("beto")
+    await ana.sio.emit("join_room", { "room": people })
+    await ana.next("room_users")
+    #* Beto está conectado pero con el chat cerrado
+    for content in ("uno", "dos"):
+        await send(ana, [ana], people, content)
+    assert (await unread(client, "beto"))[people] == 2
+    await beto.sio.emit("join_room", { "room": people })
+    await beto.next("room_users")
+    assert (await unread(client, "beto"))[people] == 0
+    await send(ana, [ana, beto], people, "tres")
+    await beto.sio.emit("leave_room", { "room": people })
+    await send(ana, [ana], people, "cuatro")
+    assert (await unread(client, "beto"))[people] == 1
+
+async def test_attachments_are_processed(connect, people, monkeypatch):
+    import app as app_module
+    from images import close_upload_client
+    uploaded = []
+
+    async def upload_image(image):
+        uploaded.append(image)
+        return "https://i.ibb.test/adjunto.webp"
+    monkeypatch.setattr(app_module, "upload_image", upload_image)
+    ana = await connect("ana")
+    await ana.sio.emit("join_room", { "room": people })
+    await ana.next("room_users")
+    #* El adjunto pasa por process_image como las imágenes de los posts: se sube el WebP reducido, no los bytes recibidos
+    photo = io.BytesIO()
+    Image.new("RGB", (3000, 2000), (200, 30, 30)).save(photo, "JPEG", exif=Image.Exif())
+    await ana.sio.emit("send_message", { "room": people, "content": "mira", "file_content": photo.getvalue() })
+    message = json.loads((await ana.next("message", timeout=30))["message"])
+    assert message["files"] == "https://i.ibb.test/adjunto.webp"
+    with Image.open(io.BytesIO(uploaded[0])) as image:
+        assert image.format == "WEBP"
+        assert max(image.size) == env.IMAGE_MAX_SIZE
+    #* Algo que no es una imagen se rechaza sin subirlo
+    await ana.sio.emit("send_message", { "room": people, "content": "mira", "file_content": b"not an image" })
+    assert (await ana.next("error", timeout=30))["code"] == 400
+    assert len(uploaded) == 1
+    await close_upload_client()
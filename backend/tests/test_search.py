@@ -0,0 +1,97 @@
+#* Búsqueda de usuarios y de posts (GET /search/)
+#? mongomock no implementa $text: la búsqueda de posts se prueba con una colección falsa que guarda la consulta,
+#? el plan real lo revisa tests/test_indexes.py contra MongoDB
+import pytest
+from conftest import auth
+from friends import add_friendship
+import search
+
+async def people(make_user):
+    await make_user("ana")
+    await make_user("Bea", public=True)
+    await make_user("beto")
+    await make_user("bruno")
+    await make_user("carla", public=True)
+    await add_friendship("ana", "bruno")
+
+async def find_users(client, q: str, **params) -> list:
+    response = await client.get("/search/", params={ "q": q, "type": "users", **params }, headers=auth("ana"))
+    assert response.status_code == 200
+    return response.json()
+
+@pytest.mark.parametrize("type", ["users", "posts"])
+@pytest.mark.parametrize("q", [" ", "   ", "\t"])
+async def test_blank_queries_are_rejected(client, make_user, type, q):
+    await people(make_user)
+    response = await client.get("/search/", params={ "q": q, "type": type }, headers=auth("ana"))
+    assert response.status_code == 400
+    assert response.json() == { "status": "error", "message": "Search query can't be empty." }
+
+@pytest.mark.parametrize("type", ["users", "posts"])
+async def test_missing_query_and_bad_type(client, make_user, type):
+    await people(make_user)
+    assert (await client.get("/search/", params={ "type": type }, headers=auth("ana"))).status_code == 422
+    assert (await client.get("/search/", params={ "q": "b", "type": "comments" }, headers=auth("ana"))).status_code == 400
+
+async def test_user_search_by_visible_prefix(client, make_user):
+    await people(make_user)
+    #* Sin distinguir mayúsculas y solo perfiles públicos, amigos o uno mismo (beto es privado y no es amigo)
+    body = await find_users(client, "  B ")
+    assert [user["uid"] for user in body["result"]] == ["Bea", "bruno"]
+    assert (await find_users(client, "an"))["result"][0]["uid"] == "ana"
+    assert (await find_users(client, ".*"))["result"] == []
+
+async def test_user_search_pages(client, make_user):
+    await people(make_user)
+    first = await find_users(client, "b", limit=1)
+    second = await find_users(client, "b", limit=1, cursor=first["next_cursor"])
+    assert [user["uid"] for user in first["result"] + second["result"]] == ["Bea", "bruno"]
+    assert second["next_cursor"] is None
+    response = await client.get("/search/", params={ "q": "b", "type": "users", "cursor": "broken" }, headers=auth("ana"))
+    assert response.status_code == 400
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def skip(self, offset):
+        self.docs = self.docs[offset:]
+        return self
+
+    def limit(self, limit):
+        self.docs = self.docs[:limit]
+        return self
+
+    async def to_list(self, length=None):
+        return [dict(doc) for doc in self.docs]
+
+class FakePosts:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return FakeCursor(self.docs)
+
+async def test_post_search(client, db, make_user, monkeypatch):
+    await people(make_user)
+    found = [{ "id": f"p{i}", "fecha": "2024-01-01T00:00:00", "title": "wave", "content": "wave", "files": [], "user": "bruno", "like_count": 0, "score": 1.0 } for i in range(3)]
+    posts = FakePosts(found)
+    monkeypatch.setattr(search, "db", type("FakeDatabase", (), { "posts": posts })())
+
+    response = await client.get("/search/", params={ "q": "  wave  ", "limit": 2 }, headers=auth("ana"))
+    assert response.status_code == 200
+    body = response.json()
+    assert [post["id"] for post in body["result"]] == ["p0", "p1"]
+    assert body["result"][0]["user"]["uid"] == "bruno"
+    #* El texto llega sin espacios y con el mismo filtro de visibilidad del feed
+    assert posts.queries[0] == { "$text": { "$search": "wave" }, "$or": [{ "public": True }, { "user": { "$in": ["bruno", "ana"] } }] }
+
+    response = await client.get("/search/", params={ "q": "wave", "limit": 2, "cursor": body["next_cursor"] }, headers=auth("ana"))
+    assert [post["id"] for post in response.json()["result"]] == ["p2"]
+    response = await client.get("/search/", params={ "q": "wave", "cursor": "broken" }, headers=auth("ana"))
+    assert response.status_code == 400
@@ -0,0 +1,88 @@
+#* Timelines: reparto de posts privados, autores que se leen al armar el feed (pull) y reparación al borrar
+from conftest import auth
+from env_handler import env
+from friends import add_friendship
+from timeline import on_friendship
+
+async def befriend(uid: str, other: str):
+    await add_friendship(uid, other)
+    await on_friendship(uid, other)
+
+async def create_post(client, uid: str, title: str = "Hola") -> str:
+    response = await client.post("/create-post/", data={ "title": title, "content": "wave" }, headers=auth(uid))
+    assert response.status_code == 200
+    return response.json()["post"]["id"]
+
+async def home(client, uid: str, limit: int = 100) -> list:
+    response = await client.get("/posts/", params={ "user": "public-friends", "limit": limit }, headers=auth(uid))
+    return [post["id"] for post in response.json()["result"]]
+
+async def timeline_ids(db, owner: str) -> list:
+    timeline = await db.timelines.find_one({ "owner": owner }) or {}
+    return [entry["id"] for entry in timeline.get("entries", [])]
+
+async def test_private_posts_fan_out_to_every_friend(client, db, make_user):
+    await make_user("ana")
+    friends = [f"friend{i}" for i in range(5)]
+    for uid in friends:
+        await make_user(uid)
+        await befriend("ana", uid)
+    post_id = await create_post(client, "ana")
+    for uid in friends:
+        assert await timeline_ids(db, uid) == [post_id]
+        assert await home(client, uid) == [post_id]
+
+async def test_high_friend_count_author_is_pulled(client, db, make_user, monkeypatch):
+    #* Con más amigos que TIMELINE_FANOUT_LIMIT el post no se reparte, los amigos lo leen al armar el feed
+    monkeypatch.setattr(env, "TIMELINE_FANOUT_LIMIT", 3)
+    await make_user("star")
+    fans = [f"fan{i}" for i in range(6)]
+    for uid in fans:
+        await make_user(uid)
+        await befriend("star", uid)
+    post_id = await create_post(client, "star")
+
+    assert await db.timelines.count_documents({ "entries.id": post_id }) == 0
+    assert await db.friendships.count_documents({ "friend": "star", "pull": True }) == len(fans)
+    for uid in fans:
+        assert await home(client, uid) == [post_id]
+    #? Quien no es amigo no lo ve
+    await make_user("stranger")
+    assert await home(client, "stranger") == []
+
+async def test_new_friend_of_a_pulled_author_reads_it(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(env, "TIMELINE_FANOUT_LIMIT", 2)
+    await make_user("star")
+    for uid in ("fan0", "fan1", "fan2"):
+        await make_user(uid)
+        await befriend("star", uid)
+    post_id = await create_post(client, "star")
+    await make_user("late")
+    await befriend("star", "late")
+    assert await db.friendships.find_one({ "user": "late", "friend": "star", "pull": True })
+    assert await home(client, "late") == [post_id]
+
+async def test_deleting_a_post_removes_it_from_every_timeline(client, db, make_user):
+    await make_user("ana")
+    friends = [f"friend{i}" for i in range(4)]
+    for uid in friends:
+        await make_user(uid)
+        await befriend("ana", uid)
+    kept = await create_post(client, "ana", "Queda")
+    deleted = await create_post(client, "ana", "Se borra")
+    assert await db.timelines.count_documents({ "entries.id": deleted }) == len(friends)
+
+    response = await client.delete(f"/post/{deleted}", headers=auth("ana"))
+    assert response.status_code == 200
+    assert await db.timelines.count_documents({ "entries.id": deleted }) == 0
+    for uid in friends:
+        assert await timeline_ids(db, uid) == [kept]
+        assert await home(client, uid) == [kept]
+
+async def test_public_posts_are_not_fanned_out(client, db, make_user):
+    await make_user("ana", public=True)
+    await make_user("beto")
+    await befriend("ana", "beto")
+    post_id = await create_post(client, "ana")
+    assert await db.timelines.count_documents({ "entries.id": post_id }) == 0
+    assert await home(client, "beto") == [post_id]
@@ -0,0 +1,115 @@
+#* Verificación local de ID tokens, firmando con una llave RSA propia en vez de las de Google (sin red)
+from base64 import urlsafe_b64encode
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+import asyncio
+import json
+import pytest
+import time
+from token_verifier import InvalidTokenError, KeySet, TokenVerifier
+
+PROJECT_ID = "wavenet-test"
+
+def _b64(data: bytes) -> str:
+    return urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+KEY = make_key()
+OTHER_KEY = make_key()
+
+def sign(key=KEY, kid: str = "k1", **overrides) -> str:
+    now = time.time()
+    claims = {
+        "aud": PROJECT_ID,
+        "iss": f"https://securetoken.google.com/{PROJECT_ID}",
+        "sub": "ana",
+        "iat": now - 10,
+        "exp": now + 3600,
+        **overrides,
+    }
+    header_b64 = _b64(json.dumps({ "alg": "RS256", "kid": kid }).encode())
+    payload_b64 = _b64(json.dumps(claims).encode())
+    signature = key.sign(f"{header_b64}.{payload_b64}".encode("ascii"), padding.PKCS1v15(), hashes.SHA256())
+    return f"{header_b64}.{payload_b64}.{_b64(signature)}"
+
+def make_verifier(**options) -> TokenVerifier:
+    keys = KeySet()
+    keys.set_keys({ "k1": KEY.public_key() }, max_age=3600)
+    return TokenVerifier(project_id=PROJECT_ID, keys=keys, **options)
+
+def test_valid_token():
+    claims = make_verifier().verify(sign())
+    assert claims["uid"] == "ana"
+
+@pytest.mark.parametrize("token, message", [
+    (sign(key=OTHER_KEY), "Invalid signature."),
+    (sign(aud="other-project"), "Invalid audience."),
+    (sign(iss="https://securetoken.google.com/other-project"), "Invalid issuer."),
+    (sign(sub=""), "Invalid subject."),
+    (sign(exp=time.time() - 120, iat=time.time() - 3720), "Token expired."),
+    (sign(iat=time.time() + 600), "Token used too early."),
+    ("not.a-token", "Malformed token."),
+])
+def test_invalid_tokens(token, message):
+    with pytest.raises(InvalidTokenError, match=message):
+        make_verifier().verify(token)
+
+def test_tampered_payload():
+    header, _, signature = sign().split(".")
+    payload = _b64(json.dumps({ "aud": PROJECT_ID, "sub": "beto" }).encode())
+    with pytest.raises(InvalidTokenError, match="Invalid signature."):
+        make_verifier().verify(f"{header}.{payload}.{signature}")
+
+async def test_unknown_kid_triggers_a_refetch(monkeypatch):
+    #* Google rotó las llaves: el token nuevo se rechaza, pero despierta el refresco en segundo plano
+    keys = KeySet(retry_delay=0)
+    fetched = []
+
+    async def refresh():
+        fetched.append(True)
+        current = { "k1": KEY.public_key() }
+        if len(fetched) > 1:
+            current["k2"] = OTHER_KEY.public_key()
+        keys.set_keys(current, max_age=3600)
+    monkeypatch.setattr(keys, "refresh", refresh)
+    verifier = TokenVerifier(project_id=PROJECT_ID, keys=keys)
+    await keys.start()
+    try:
+        token = sign(key=OTHER_KEY, kid="k2")
+        with pytest.raises(InvalidTokenError, match="Unknown signing key."):
+            verifier.verify(token)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert len(fetched) == 2
+        assert verifier.verify(token)["uid"] == "ana"
+    finally:
+        await keys.stop()
+
+def test_verified_tokens_are_cached():
+    verifier = make_verifier()
+    token = sign()
+    verifier.verify(token)
+    verifier.verify(token)
+    assert verifier.stats()["hits"] == 1
+    assert verifier.stats()["size"] == 1
+    #? Un token distinto nunca recibe los claims de otro
+    assert verifier.verify(sign(sub="beto"))["uid"] == "beto"
+
+def test_cache_expires_with_its_ttl():
+    verifier = make_verifier(cache_ttl=0.05)
+    token = sign()
+    verifier.verify(token)
+    time.sleep(0.06)
+    verifier.verify(token)
+    assert verifier.stats()["hits"] == 0
+
+def test_cache_never_outlives_the_token():
+    #* La entrada vence con el exp del token, después de eso se vuelve a verificar (y se rechaza)
+    verifier = make_verifier(clock_skew=0)
+    token = sign(exp=time.time() + 0.1)
+    verifier.verify(token)
+    time.sleep(0.15)
+    with pytest.raises(InvalidTokenError, match="Token expired."):
+        verifier.verify(token)
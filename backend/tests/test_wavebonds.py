@@ -0,0 +1,162 @@
+#* Canje de wavebonds bajo concurrencia (muchas peticiones a la vez contra el mismo usuario), descarga y rotación
+import asyncio
+import pytest
+from conftest import auth
+from friends import chat_id_for
+from models import User
+from util import rotate_wavebond
+import util
+
+FANS = 40
+
+async def wavebond_of(make_user, uid: str) -> bytes:
+    user = await make_user(uid)
+    return (await rotate_wavebond(User(**user))).wave
+
+async def redeem(client, uid: str, wavebond: bytes):
+    return await client.post("/wavebond/", files={ "file": ("star.wavebond", wavebond) }, headers=auth(uid))
+
+async def test_many_users_redeem_the_same_wavebond(client, interleaved, make_user):
+    wavebond = await wavebond_of(make_user, "star")
+    fans = [f"fan{i:02d}" for i in range(FANS)]
+    for uid in fans:
+        await make_user(uid)
+
+    responses = await asyncio.gather(*(redeem(client, uid, wavebond) for uid in fans))
+    assert [response.status_code for response in responses] == [201] * FANS
+
+    #* Ninguna escritura pisó a otra: todas las aristas, el arreglo friends completo, un chat y dos bandejas por amistad
+    db = interleaved
+    assert await db.friendships.count_documents({ "user": "star" }) == FANS
+    assert await db.friendships.count_documents({ "friend": "star" }) == FANS
+    assert sorted((await db.users.find_one({ "uid": "star" }))["friends"]) == fans
+    assert await db.chat.count_documents({}) == FANS
+    assert await db.inbox.count_documents({ "owner": "star" }) == FANS
+    assert await db.inbox.count_documents({ "peer": "star" }) == FANS
+
+    #* La bandeja de star se recorre completa por páginas, sin repetidos
+    seen = []
+    params = { "limit": 7 }
+    while True:
+        body = (await client.get("/chats/", params=params, headers=auth("star"))).json()
+        seen += [chat["id"] for chat in body["result"]]
+        if not body["next_cursor"]:
+            break
+        params = { "limit": 7, "cursor": body["next_cursor"] }
+    assert sorted(seen) == sorted(chat_id_for("star", uid) for uid in fans)
+
+async def test_same_user_redeems_the_same_wavebond_concurrently(client, interleaved, make_user):
+    wavebond = await wavebond_of(make_user, "star")
+    await make_user("fan")
+    responses = await asyncio.gather(*(redeem(client, "fan", wavebond) for _ in range(10)))
+
+    assert sorted(response.status_code for response in responses) == [201] + [400] * 9
+    assert await interleaved.friendships.count_documents({}) == 2
+    assert await interleaved.chat.count_documents({}) == 1
+    assert await interleaved.inbox.count_documents({}) == 2
+    assert (await interleaved.users.find_one({ "uid": "fan" }))["friends"] == ["star"]
+
+async def download(client, uid: str):
+    return await client.get("/wavebond/", headers=auth(uid))
+
+async def rotate(client, uid: str):
+    return await client.post("/wavebond/rotate", headers=auth(uid))
+
+async def test_download_is_stable(client, db, make_user):
+    await make_user("star")
+    first = await download(client, "star")
+    assert first.status_code == 200
+    assert first.headers["content-disposition"] == 'attachment; filename="star.wavebond"'
+    #* Descargarlo otra vez retorna el mismo archivo, también desde otro proceso (sin la caché en memoria)
+    assert (await download(client, "star")).content == first.content
+    util.wavebond_cache.clear()
+    assert (await download(client, "star")).content == first.content
+    assert await db.wavebonds.count_documents({ "user": "star" }) == 1
+    assert (await db.wavebonds.find_one({ "user": "star" }))["version"] == 0.1
+
+async def test_rotation_bumps_the_version(client, db, make_user):
+    await make_user("star")
+    original = (await download(client, "star")).content
+    rotated = await rotate(client, "star")
+    assert rotated.status_code == 200
+    assert rotated.content != original
+    assert (await db.wavebonds.find_one({ "user": "star" }))["version"] == 0.2
+    #* La descarga siguiente ya es la versión nueva
+    assert (await download(client, "star")).content == rotated.content
+    await rotate(client, "star")
+    assert (await db.wavebonds.find_one({ "user": "star" }))["version"] == 0.3
+    assert await db.wavebonds.count_documents({ "user": "star" }) == 1
+
+async def test_stale_wavebond_is_rejected(client, db, make_user):
+    await make_user("star")
+    await make_user("fan")
+    stale = (await download(client, "star")).content
+    current = (await rotate(client, "star")).content
+
+    response = await redeem(client, "fan", stale)
+    assert response.status_code == 400
+    assert response.json()["message"] == "That wavebond is outdated or doesn't belong to anybody."
+    assert await db.friendships.count_documents({}) == 0
+    assert (await redeem(client, "fan", current)).status_code == 201
+    assert await db.friendships.count_documents({}) == 2
+
+@pytest.mark.parametrize("request_wavebond", [download, rotate])
+async def test_wavebond_requires_a_session(client, db, make_user, request_wavebond):
+    response = await request_wavebond(client, "nobody")
+    assert response.status_code == 404
+    assert response.json() == { "status": "error", "message": "Invalid session." }
+
+async def test_bulk_redeem(client, db, make_user):
+    for uid in ("fan", "bruno", "carla", "dario", "elena"):
+        await make_user(uid)
+    bruno = (await download(client, "bruno")).content
+    carla = (await download(client, "carla")).content
+    stale = (await download(client, "dario")).content
+    await rotate(client, "dario")
+    own = (await download(client, "fan")).content
+    #? Los wavebonds generados antes de incluir el uid se resuelven por email
+    await download(client, "elena")
+    legacy = util.encrypt_aes("username=elena;email=elena@wavenet.test;version=0.1")
+
+    files = [
+        ("files", ("bruno.wavebond", bruno)),
+        ("files", ("carla.wavebond", carla)),
+        ("files", ("bruno-again.wavebond", bruno)),
+        ("files", ("dario.wavebond", stale)),
+        ("files", ("garbage.wavebond", b"not a wavebond at all")),
+        ("files", ("fan.wavebond", own)),
+        ("files", ("elena.wavebond", legacy)),
+    ]
+    response = await client.post("/wavebond/bulk", files=files, headers=auth("fan"))
+    assert response.status_code == 201
+    results = response.json()["results"]
+    #* Un resultado por archivo, en el mismo orden
+    assert [(result["file"], result["status"]) for result in results] == [
+        ("bruno.wavebond", "success"),
+        ("carla.wavebond", "success"),
+        ("bruno-again.wavebond", "error"),
+        ("dario.wavebond", "error"),
+        ("garbage.wavebond", "error"),
+        ("fan.wavebond", "error"),
+        ("elena.wavebond", "success"),
+    ]
+    assert results[0]["wavebond_user"]["uid"] == "bruno"
+    assert results[2]["message"] == "You already share a wavebond with that user."
+    assert results[3]["message"] == results[4]["message"] == "That wavebond is outdated or doesn't belong to anybody."
+    assert results[5]["message"] == "Sadly, you can't share a wavebond with yourself."
+    assert sorted(response.json()["updated_user"]["friends"]) == ["bruno", "carla", "elena"]
+
+    #* Una sola amistad (dos aristas), un chat y dos bandejas por par, aunque el mismo wavebond viniera dos veces
+    for uid in ("bruno", "carla", "elena"):
+        assert await db.friendships.count_documents({ "user": "fan", "friend": uid }) == 1
+        assert await db.friendships.count_documents({ "user": uid, "friend": "fan" }) == 1
+        assert await db.chat.count_documents({ "users": { "$all": ["fan", uid] } }) == 1
+        assert await db.inbox.count_documents({ "owner": { "$in": ["fan", uid] }, "peer": { "$in": ["fan", uid] } }) == 2
+    assert await db.friendships.count_documents({}) == 6
+    assert sorted((await db.users.find_one({ "uid": "fan" }))["friends"]) == ["bruno", "carla", "elena"]
+
+    #* Repetir el mismo lote no crea nada nuevo
+    again = await client.post("/wavebond/bulk", files=files, headers=auth("fan"))
+    assert all(result["status"] == "error" for result in again.json()["results"])
+    assert await db.friendships.count_documents({}) == 6
+    assert await db.chat.count_documents({}) == 3
@@ -0,0 +1,142 @@
+from pymongo import UpdateOne, DESCENDING
+from db import db
+from env_handler import env
+from friends import get_friend_uids
+from pagination import encode_cursor, keyset_filter
+
+#* Timeline materializado por usuario: un documento { owner, built, entries: [{ id, fecha }] } con los posts más recientes
+#* de sus amigos, ordenado y acotado a TIMELINE_CAP entradas.
+#? Modelo híbrido: los posts privados se reparten (fan-out) a los timelines de los amigos al crearse, mientras que los
+#? posts públicos y los de autores con más de TIMELINE_FANOUT_LIMIT amigos se leen (pull) al momento de armar el feed.
+
+POST_KEY_PROJECTION = { "_id": 0, "id": 1, "fecha": 1 }
+BULK_CHUNK = 1000
+
+def _push(owner: str, entries: list) -> UpdateOne:
+    return UpdateOne(
+        { "owner": owner },
+        { "$push": { "entries": { "$each": entries, "$sort": { "fecha": -1, "id": -1 }, "$slice": env.TIMELINE_CAP } } },
+        upsert=True
+    )
+
+async def _bulk(operations: list):
+    #* Las escrituras a muchos timelines se mandan en bloques para no armar un solo bulk gigante
+    for i in range(0, len(operations), BULK_CHUNK):
+        await db.timelines.bulk_write(operations[i:i + BULK_CHUNK], ordered=False)
+
+async def _is_pull_author(uid: str) -> bool:
+    return await db.friendships.count_documents({ "user": uid }, limit=env.TIMELINE_FANOUT_LIMIT + 1) > env.TIMELINE_FANOUT_LIMIT
+
+async def _recent_private_posts(authors: list) -> list:
+    return await db.posts.find({ "user": { "$in": authors }, "public": False }, POST_KEY_PROJECTION) \
+        .sort([("fecha", DESCENDING), ("id", DESCENDING)]) \
+        .limit(env.TIMELINE_CAP) \
+        .to_list(length=None)
+
+async def fan_out_post(post: dict):
+    #* Agrega un post nuevo al timeline de cada amigo del autor
+    #? Los posts públicos no se reparten, todos los leen desde el índice (public, fecha, id)
+    if post["public"]:
+        return
+    author = post["user"]
+    if await _is_pull_author(author):
+        #* El autor tiene demasiados amigos para repartir sus posts, marcamos sus aristas para que sus amigos los lean al armar el feed
+        await db.friendships.update_many({ "friend": author, "pull": { "$ne": True } }, { "$set": { "pull": True } })
+        return
+    entry = { "id": post["id"], "fecha": post["fecha"] }
+    friends = await get_friend_uids(author)
+    await _bulk([_push(friend, [entry]) for friend in friends])
+
+async def remove_post(post_id: str):
+    #* Reparación incremental al borrar un post: lo quitamos de los timelines que lo contengan (índice en entries.id)
+    await db.timelines.update_many({ "entries.id": post_id }, { "$pull": { "entries": { "id": post_id } } })
+
+async def backfill(author: str, owners: list):
+    #* Copia los posts privados recientes de `author` a los timelines de `owners`
+    #* Se usa con una amistad nueva o cuando un perfil público pasa a ser privado
+    if not owners or await _is_pull_author(author):
+        return
+    posts = await _recent_private_posts([author])
+    if posts:
+        await _bulk([_push(owner, posts) for owner in owners])
+
+async def on_friendship(uid: str, other_uid: str):
+    #* Reparación incremental al crear una amistad: cada uno recibe los posts recientes del otro
+    for author, reader in ((uid, other_uid), (other_uid, uid)):
+        if await _is_pull_author(author):
+            await db.friendships.update_one({ "user": reader, "friend": author }, { "$set": { "pull": True } })
+        else:
+            await backfill(author, [reader])
+
+async def rebuild_timeline(owner: str):
+    #* Construye el timeline de un usuario que todavía no tiene uno completo (p. ej. usuarios anteriores a esta función)
+    friends = [edge["friend"] async for edge in db.friendships.find({ "user": owner, "pull": { "$ne": True } }, { "_id": 0, "friend": 1 })]
+    posts = await _recent_private_posts(friends) if friends else []
+    #? Si ya había entradas (fan-out previo) las repetidas se descartan al leer
+    await db.timelines.update_one(
+        { "owner": owner },
+        {
+            "$push": { "entries": { "$each": posts, "$sort": { "fecha": -1, "id": -1 }, "$slice": env.TIMELINE_CAP } },
+            "$set": { "built": True }
+        },
+        upsert=True
+    )
+
+async def _posts_older_than(owner: str, position, limit: int) -> list:
+    #* Posts privados de los amigos cuyos posts se reparten, anteriores a `position` (fecha, id)
+    friends = [edge["friend"] async for edge in db.friendships.find({ "user": owner, "pull": { "$ne": True } }, { "_id": 0, "friend": 1 })]
+    if not friends:
+        return []
+    query = { "$and": [{ "user": { "$in": friends }, "public": False }, keyset_filter(position)] }
+    return await db.posts.find(query, POST_KEY_PROJECTION) \
+        .sort([("fecha", DESCENDING), ("id", DESCENDING)]) \
+        .limit(limit) \
+        .to_list(length=None)
+
+async def get_home_page(owner: str, limit: int, cursor=None, projection=None):
+    #* Retorna (posts, next_cursor) del feed de amigos y públicos, mezclando el timeline materializado con la parte pull
+    timeline = await db.timelines.find_one({ "owner": owner }, { "_id": 0, "built": 1, "entries": 1 })
+    if not timeline or not timeline.get("built"):
+        await rebuild_timeline(owner)
+        timeline = await db.timelines.find_one({ "owner": owner }, { "_id": 0, "entries": 1 })
+    entries = timeline.get("entries", []) if timeline else []
+    #? Un timeline lleno no tiene los posts más antiguos que su última entrada
+    oldest = (entries[-1]["fecha"], entries[-1]["id"]) if len(entries) >= env.TIMELINE_CAP else None
+    if cursor:
+        entries = [entry for entry in entries if (entry["fecha"], entry["id"]) < cursor]
+
+    #* Parte pull: posts públicos, los propios, y los de amigos con demasiados amigos como para repartirlos
+    pull_authors = [edge["friend"] async for edge in db.friendships.find({ "user": owner, "pull": True }, { "_id": 0, "friend": 1 })]
+    query = {
+        "$or": [
+            { "public": True },
+            { "user": { "$in": pull_authors + [owner] } }
+        ]
+    }
+    if cursor:
+        query = { "$and": [query, keyset_filter(cursor)] }
+    pulled = await db.posts.find(query, POST_KEY_PROJECTION) \
+        .sort([("fecha", DESCENDING), ("id", DESCENDING)]) \
+        .limit(limit + 1) \
+        .to_list(length=None)
+    #* Pasado el tope del timeline, los posts de los amigos que se reparten se leen directo de la colección de posts
+    #? Solo hace falta cuando las entradas que quedan no alcanzan para llenar la página
+    if oldest and len(entries) <= limit:
+        pulled += await _posts_older_than(owner, min(cursor, oldest) if cursor else oldest, limit + 1)
+
+    #* Mezclamos ambas fuentes por (fecha, id) sin repetir posts y nos quedamos con la página pedida
+    candidates = {}
+    for entry in entries + pulled:
+        candidates[entry["id"]] = entry["fecha"]
+    ordered = sorted(candidates.items(), key=lambda item: (item[1], item[0]), reverse=True)[:limit + 1]
+    has_more = len(ordered) > limit
+    page_ids = [post_id for post_id, _ in ordered[:limit]]
+
+    found = {
+        post["id"]: post
+        async for post in db.posts.find({ "id": { "$in": page_ids } }, projection or { "_id": 0, "comments": 0 })
+    }
+    #? Un post borrado que todavía no se reparó en el timeline simplemente se omite
+    posts = [found[post_id] for post_id in page_ids if post_id in found]
+    next_cursor = encode_cursor(ordered[limit - 1][1], ordered[limit - 1][0]) if has_more else None
+    return posts, next_cursor
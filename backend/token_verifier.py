@@ -0,0 +1,161 @@
+from base64 import urlsafe_b64decode
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cache import TTLCache
+import asyncio
+import hashlib
+import httpx
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+#* URL con los certificados públicos con los que Firebase firma los ID tokens
+GOOGLE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+class InvalidTokenError(Exception):
+    pass
+
+def _b64decode(segment: str) -> bytes:
+    return urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+def _max_age(cache_control: str, default: float) -> float:
+    #* Google indica en Cache-Control cuánto tiempo son válidos los certificados
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return float(match.group(1)) if match else default
+
+class KeySet:
+    #* Llaves públicas de firma indexadas por kid, se descargan por adelantado y se refrescan en segundo plano
+    #? Así la verificación de un token nunca espera a la red
+    def __init__(self, url: str = GOOGLE_CERTS_URL, default_max_age: float = 3600, refresh_margin: float = 300, retry_delay: float = 60):
+        self.url = url
+        self.default_max_age = default_max_age
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self.keys = {}
+        self.expires_at = 0.0
+        self._last_refresh = 0.0
+        self._task = None
+        self._wakeup = asyncio.Event()
+
+    def set_keys(self, keys: dict, max_age: float):
+        #* Reemplazamos el conjunto completo de llaves (también sirve para inyectar llaves locales en pruebas)
+        self.keys = dict(keys)
+        self.expires_at = time.monotonic() + max_age
+
+    def get(self, kid):
+        return self.keys.get(kid)
+
+    async def refresh(self):
+        self._last_refresh = time.monotonic()
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.get(self.url)
+            response.raise_for_status()
+        keys = {
+            kid: x509.load_pem_x509_certificate(pem.encode("utf-8")).public_key()
+            for kid, pem in response.json().items()
+        }
+        self.set_keys(keys, _max_age(response.headers.get("cache-control"), self.default_max_age))
+
+    def request_refresh(self):
+        #* Se llama al encontrar un kid desconocido (Google rotó las llaves), despierta al refresco en segundo plano
+        self._wakeup.set()
+
+    async def _refresh_forever(self):
+        while True:
+            #? Refrescamos un poco antes de que expiren para nunca quedarnos sin llaves válidas
+            delay = max(self.expires_at - time.monotonic() - self.refresh_margin, self.retry_delay)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                #? Aunque lleguen muchos kids desconocidos, no refrescamos más de una vez por retry_delay
+                await asyncio.sleep(max(self._last_refresh + self.retry_delay - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                pass
+            #? Se limpia justo antes de descargar: un pedido que llega durante la descarga (o antes de la primera espera) no se pierde
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Error refreshing Firebase signing keys: %s", e)
+
+    async def start(self):
+        #* Descargamos las llaves antes de aceptar peticiones y dejamos el refresco corriendo en segundo plano
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning("Error fetching Firebase signing keys: %s", e)
+        self._task = asyncio.create_task(self._refresh_forever())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class TokenVerifier:
+    #* Verifica ID tokens de Firebase (RS256) y guarda en caché los ya verificados, indexados por el hash del token
+    def __init__(self, project_id: str, keys: KeySet, cache_size: int = 10000, cache_ttl: float = 3600, clock_skew: int = 60):
+        self.project_id = project_id
+        self.keys = keys
+        self.clock_skew = clock_skew
+        self.cache = TTLCache(cache_size, cache_ttl)
+
+    def verify(self, token: str) -> dict:
+        cache_key = hashlib.sha256(token.encode("utf-8")).digest()
+        claims = self.cache.get(cache_key)
+        if claims is not None:
+            return claims
+        claims = self._verify(token)
+        #* La entrada vive como máximo hasta el exp del token (más el margen de reloj)
+        self.cache.set(cache_key, claims, ttl=claims["exp"] + self.clock_skew - time.time())
+        return claims
+
+    def _verify(self, token: str) -> dict:
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+            claims = json.loads(_b64decode(payload_b64))
+            signature = _b64decode(signature_b64)
+            signed_content = f"{header_b64}.{payload_b64}".encode("ascii")
+        except (ValueError, TypeError):
+            raise InvalidTokenError("Malformed token.")
+        if not isinstance(header, dict) or not isinstance(claims, dict) or header.get("alg") != "RS256":
+            raise InvalidTokenError("Unsupported token.")
+
+        public_key = self.keys.get(header.get("kid"))
+        if not public_key:
+            self.keys.request_refresh()
+            raise InvalidTokenError("Unknown signing key.")
+        try:
+            public_key.verify(signature, signed_content, padding.PKCS1v15(), hashes.SHA256())
+        except InvalidSignature:
+            raise InvalidTokenError("Invalid signature.")
+
+        #* Validamos los claims tal como lo hace firebase_admin.auth.verify_id_token
+        now = time.time()
+        if claims.get("aud") != self.project_id:
+            raise InvalidTokenError("Invalid audience.")
+        if claims.get("iss") != f"https://securetoken.google.com/{self.project_id}":
+            raise InvalidTokenError("Invalid issuer.")
+        sub = claims.get("sub")
+        if not isinstance(sub, str) or not sub or len(sub) > 128:
+            raise InvalidTokenError("Invalid subject.")
+        exp, iat = claims.get("exp"), claims.get("iat")
+        if not isinstance(exp, (int, float)) or not isinstance(iat, (int, float)):
+            raise InvalidTokenError("Missing exp/iat claims.")
+        if exp + self.clock_skew < now:
+            raise InvalidTokenError("Token expired.")
+        if iat - self.clock_skew > now:
+            raise InvalidTokenError("Token used too early.")
+        claims["uid"] = sub
+        return claims
+
+    def stats(self):
+        return self.cache.stats()
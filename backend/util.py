@@ -2,50 +2,65 @@ from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.padding import PKCS7
 from models import User, Wavebond
 from db import db
+from cache import TTLCache
+from pymongo import ReturnDocument
+from functools import lru_cache
 import os
-from auth import get_user_by_email
-import requests
 from env_handler import env
 
 SECRET_KEY = env.CYPH_SECRET_KEY
-IMGDB_KEY = env.IMGDB_KEY
-IMGDB_URL = env.IMGDB_URL
-
-def upload_image(image: bytes):
-    #* Creamos el body de la petición con los Bytes de la Imagen
-    files = { 'image': image }
-    data = { 'key': IMGDB_KEY }
-    #* Subimos la imagen a ImgBB
-    response = requests.post(IMGDB_URL, data=data, files=files)
-    #* Rescatamos la URL de la respuesta.
-    json_data = response.json()
-    return json_data["data"]["url"]
-
-def update_posts_author(user: User):
-    #* Actualizamos los posts del usuario
-    result = db.posts.update_many({ "user.uid": user.uid }, { "$set": { "user": user.model_dump() } })
-
-def get_user_post_likes(user: User):
-    #* Iteramos los posts del usuario y sumamos los likes
-    posts = db.posts.find({ "user.uid": user.uid }, { "likes": 1, "_id": 0 })
-    likes = 0
-    for post in posts:
-        likes += len(post["likes"])
-    return likes
 
-def encrypt_aes(content: str) -> bytes:
-    #* Creamos la clave AES a partir de la SECRET_KEY
+async def get_user_post_likes(user: User):
+    #* Sumamos el contador de likes de los posts del usuario directamente en la base de datos
+    result = await db.posts.aggregate([
+        { "$match": { "user": user.uid } },
+        { "$group": { "_id": None, "likes": { "$sum": "$like_count" } } }
+    ]).to_list(length=1)
+    return result[0]["likes"] if result else 0
+
+async def toggle_like(collection, id: str, uid: str):
+    #* Da o quita el like de forma atómica, retorna (liked, like_count) o None si el documento no existe
+    #? Cada filtro solo coincide si el like está en el estado esperado, por lo que dos peticiones concurrentes nunca se pisan
+    for _ in range(3):
+        doc = await collection.find_one_and_update(
+            { "id": id, "likes": { "$ne": uid } },
+            { "$addToSet": { "likes": uid }, "$inc": { "like_count": 1 } },
+            projection={ "_id": 0, "like_count": 1 },
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            return True, doc["like_count"]
+        doc = await collection.find_one_and_update(
+            { "id": id, "likes": uid },
+            { "$pull": { "likes": uid }, "$inc": { "like_count": -1 } },
+            projection={ "_id": 0, "like_count": 1 },
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            return False, doc["like_count"]
+        #? Si ninguno coincidió, otra petición cambió el like entre ambos intentos (o el documento no existe)
+        if not await collection.find_one({ "id": id }, { "_id": 1 }):
+            return None
+    return None
+
+@lru_cache(maxsize=1)
+def _aes_algorithm():
+    #* Creamos la clave AES a partir de la SECRET_KEY una sola vez, el algoritmo se comparte entre todas las llamadas
     aes_key = SECRET_KEY.encode('utf-8').ljust(16)[:16]
-    
+    return algorithms.AES(aes_key)
+
+#? El esquema de padding no guarda estado, cada llamada crea su propio padder/unpadder a partir de él
+_PKCS7 = PKCS7(algorithms.AES.block_size)
+
+def encrypt_aes(content: str) -> bytes:
     #* creamos un vector de inivialización (iv) aleatorio
     iv = os.urandom(16)
     
-    #* Creamos el cibrado AES con CBC
-    cipher = Cipher(algorithms.AES(aes_key), modes.CBC(iv))
-    encryptor = cipher.encryptor()
+    #* Creamos el cibrado AES con CBC (solo el modo cambia, ya que depende del IV)
+    encryptor = Cipher(_aes_algorithm(), modes.CBC(iv)).encryptor()
     
     #* Agregamos Padding al contenido
-    padder = PKCS7(algorithms.AES.block_size).padder()
+    padder = _PKCS7.padder()
     padded_content = padder.update(content.encode('utf-8')) + padder.finalize()
     
     #* Ciframos el contenido
@@ -55,60 +70,109 @@ def encrypt_aes(content: str) -> bytes:
     return iv + ciphertext
 
 def decrypt_aes(encrypted_content: bytes) -> str:
-    #* Creamos la clave AES a partir de la SECRET_KEY
-    aes_key = SECRET_KEY.encode('utf-8').ljust(16)[:16]
-    
     #* Separamos el IV del Texto Cifrado
     iv = encrypted_content[:16]
     ciphertext = encrypted_content[16:]
     
     #* Creamos el descifrador AES con CBC
-    cipher = Cipher(algorithms.AES(aes_key), modes.CBC(iv))
-    decryptor = cipher.decryptor()
+    decryptor = Cipher(_aes_algorithm(), modes.CBC(iv)).decryptor()
     
     #* Desciframos el contenido
     padded_content = decryptor.update(ciphertext) + decryptor.finalize()
     
     #* Eliminamos el padding
-    unpadder = PKCS7(algorithms.AES.block_size).unpadder()
+    unpadder = _PKCS7.unpadder()
     content = unpadder.update(padded_content) + unpadder.finalize()
     
     #* Devolvemos el contenido descifrado
     return content.decode('utf-8')
 
-def generate_wavebond(user: User, wavebond: Wavebond, generateFromZero: bool = False):
+#* Caché del contenido cifrado de cada wavebond, indexada por (uid, versión)
+#? Como la versión forma parte de la llave, una rotación (incluso hecha por otra instancia) nunca sirve un wavebond viejo
+wavebond_cache = TTLCache(env.WAVEBOND_CACHE_SIZE, env.WAVEBOND_CACHE_TTL)
+
+async def rotate_wavebond(user: User, wavebond: Wavebond = None) -> Wavebond:
     #* En caso de que sea de cero, la versión será 0.1 en caso contrario, se sumará 0.1 a la versión actual
-    #* Esto es para una función futura en la cual se vuelvan obsoletos los wavebonds antiguos
-    if generateFromZero:
-        version = 0.1
-    else:
-        version = wavebond.version + 0.1
+    #* Al rotar, los wavebonds de versiones anteriores quedan obsoletos
+    version = round(wavebond.version + 0.1, 1) if wavebond else 0.1
     #* Creamos el contenido del wavebond y lo ciframos.
-    content = f"username={user.username};email={user.email};version={version}"
+    content = f"uid={user.uid};username={user.username};email={user.email};version={version}"
     cifrado = encrypt_aes(content)
 
-    #* Lo almacenamos en un archivo con el nombre del usuario y lo guardamos en la base de datos
-    file_path = f"./wavebonds/{user.username}.wavebond"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)  # Asegurar que la carpeta existe
-    
-    with open(file_path, "wb") as f:
-        f.write(cifrado)
+    #* Lo guardamos en la base de datos (no en disco) y en la caché
+    await db.wavebonds.update_one({ "user": user.uid }, { "$set": { "wave": cifrado, "version": version } }, upsert=True)
+    wavebond_cache.set((user.uid, version), cifrado)
+    return Wavebond(user=user.uid, wave=cifrado, version=version)
 
-    db.wavebonds.update_one({ "user": user.uid }, { "$set": { "wave": cifrado, "version": version } }, upsert=True)
+async def get_wavebond_content(user: User):
+    #* Retorna (versión, contenido cifrado) del wavebond actual del usuario, o None si nunca ha generado uno
+    #? Solo leemos la versión, el contenido se busca en la base de datos únicamente si no está en caché
+    current = await db.wavebonds.find_one({ "user": user.uid }, { "_id": 0, "version": 1 })
+    if not current:
+        return None
+    version = current["version"]
+    cifrado = wavebond_cache.get((user.uid, version))
+    if cifrado is None:
+        stored = await db.wavebonds.find_one({ "user": user.uid, "version": version }, { "_id": 0, "wave": 1 })
+        if not stored:
+            #? Rotaron el wavebond entre ambas consultas, lo volvemos a intentar
+            return await get_wavebond_content(user)
+        cifrado = stored["wave"]
+        wavebond_cache.set((user.uid, version), cifrado)
+    return version, cifrado
 
-    return file_path
-
-def get_wavebond(user: User):
+async def get_wavebond(user: User):
     #* Obtenemos el wavebond del usuario
-    wavebond = db.wavebonds.find_one({ "user": user.uid })
+    wavebond = await db.wavebonds.find_one({ "user": user.uid })
     if wavebond:
         return Wavebond(**wavebond)
     return None
 
-def get_user_from_wavebond(wavebond: bytes):
+def read_wavebond(wavebond: bytes):
+    #* Desciframos el wavebond y separamos su contenido clave=valor, retorna None si no es un wavebond válido
+    try:
+        data = {}
+        for field in decrypt_aes(wavebond).split(";"):
+            key, _, value = field.partition("=")
+            data[key] = value
+        data["version"] = float(data["version"])
+    except (ValueError, KeyError, UnicodeDecodeError):
+        return None
+    return data
+
+async def get_users_from_wavebonds(wavebonds: list) -> list:
+    #* Retorna el usuario dueño de cada wavebond (en el mismo orden), o None si es inválido o de una versión obsoleta
+    #? Sin importar cuántos wavebonds sean, se hacen como máximo tres consultas, todas sobre índices
+    entries = [read_wavebond(wavebond) for wavebond in wavebonds]
+
+    #* Los wavebonds generados antes de incluir el uid se resuelven por email
+    emails = { entry["email"] for entry in entries if entry and not entry.get("uid") and entry.get("email") }
+    if emails:
+        uid_by_email = {
+            user["email"]: user["uid"]
+            async for user in db.users.find({ "email": { "$in": list(emails) } }, { "_id": 0, "uid": 1, "email": 1 })
+        }
+        for entry in entries:
+            if entry and not entry.get("uid"):
+                entry["uid"] = uid_by_email.get(entry.get("email"))
+
+    #* Buscamos directamente el registro (uid, versión); si el wavebond fue rotado, la versión ya no coincide y se rechaza en la misma consulta
+    pairs = { (entry["uid"], entry["version"]) for entry in entries if entry and entry.get("uid") }
+    valid = set()
+    if pairs:
+        query = { "$or": [{ "user": uid, "version": version } for uid, version in pairs] }
+        async for stored in db.wavebonds.find(query, { "_id": 0, "user": 1, "version": 1 }):
+            valid.add((stored["user"], stored["version"]))
+
+    users = {}
+    if valid:
+        async for user in db.users.find({ "uid": { "$in": [uid for uid, _ in valid] } }, { "_id": 0 }):
+            users[user["uid"]] = User(**user)
+    return [
+        users.get(entry["uid"]) if entry and (entry.get("uid"), entry["version"]) in valid else None
+        for entry in entries
+    ]
+
+async def get_user_from_wavebond(wavebond: bytes):
     #* Desciframos el wavebond y obtenemos el usuario
-    content = decrypt_aes(wavebond)
-    #* La función lambda separa el contenido en un diccionario de clave=valor
-    data = dict(map(lambda x: x.split("="), content.split(";")))
-    user = get_user_by_email(data["email"])
-    return user
\ No newline at end of file
+    return (await get_users_from_wavebonds([wavebond]))[0]
@@ -9,21 +9,39 @@ export default function ChatInterface({ chat, onBack }) {
     const [formData, setFormData] = useState({});
     const [loadingMessages, setLoadingMessages] = useState(false);
     const [sending, setSending] = useState(false);
+    // Cursor de la página anterior (mensajes más antiguos), null cuando ya no quedan
+    const [prevCursor, setPrevCursor] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
+
+    const requestMessages = async (before) => {
+        const query = before ? `?before=${encodeURIComponent(before)}` : "";
+        const _ = await fetch(
+            `${import.meta.env.VITE_BACKEND_URL}/messages/${chat.id}${query}`,
+            {
+                method: "GET",
+                headers: {
+                    "Content-Type": "application/json",
+                    Authorization: `Bearer ${firebaseUser.accessToken}`,
+                },
+            }
+        );
+        return await _.json();
+    };
 
     useEffect(() => {
         if (!chat.id || !user.uid) return; 
         
         if (socket.connected) {
             console.log(`Conectado con ID: ${socket.id}`);
-            socket.emit("join_room", { room: chat.id, uid: user.uid });
+            socket.emit("join_room", { room: chat.id });
         } else {
-            console.error("Socket no está conectado");
+            socket.connect();
         }
         
         // Listener de conexión
         socket.on("connect", () => {
             console.log(`Conectado con ID: ${socket.id}`);
-            socket.emit("join_room", { room: chat.id, uid: user.uid });
+            socket.emit("join_room", { room: chat.id });
         });
 
         socket.on("message", (data) => {
@@ -37,23 +55,14 @@ export default function ChatInterface({ chat, onBack }) {
 
         const fetchMessages = async () => {
             setLoadingMessages(true);
-            const _ = await fetch(
-                `${import.meta.env.VITE_BACKEND_URL}/messages/${chat.id}`,
-                {
-                    method: "GET",
-                    headers: {
-                        "Content-Type": "application/json",
-                        Authorization: `Bearer ${firebaseUser.accessToken}`,
-                    },
-                }
-            );
-            const r = await _.json();
-            const messages = JSON.parse(r.result);
+            const r = await requestMessages();
+            const messages = r.result;
             if (!messages) {
                 setMessages([]);
             } else {
                 setMessages(messages);
             }
+            setPrevCursor(r.prev_cursor || null);
             setLoadingMessages(false);
         };
         
@@ -67,6 +76,18 @@ export default function ChatInterface({ chat, onBack }) {
         };
     }, [chat.id, user.uid]);
 
+    const loadOlderMessages = async () => {
+        if (!prevCursor || loadingOlder) return;
+        setLoadingOlder(true);
+        const r = await requestMessages(prevCursor);
+        if (r.result) {
+            // Los mensajes más antiguos van antes de los que ya se muestran
+            setMessages((prevMessages) => [...r.result, ...prevMessages]);
+            setPrevCursor(r.prev_cursor || null);
+        }
+        setLoadingOlder(false);
+    };
+
     const handleChange = (e) => {
         const { name, value } = e.target;
         setFormData({ ...formData, [name]: value });
@@ -83,7 +104,6 @@ export default function ChatInterface({ chat, onBack }) {
                     room: chat.id,
                     content: formData.message,
                     file_content: reader.result, // ArrayBuffer
-                    user: user.uid
                 });
                 setFormData(null);
                 document.getElementById("attachment").value = null;
@@ -94,7 +114,6 @@ export default function ChatInterface({ chat, onBack }) {
             socket.emit("send_message", {
                 room: chat.id,
                 content: formData.message,
-                user: user.uid
             });
             setFormData(null);
             document.getElementById("message").value = "";
@@ -128,11 +147,22 @@ export default function ChatInterface({ chat, onBack }) {
                 </button>
                 <h2 className="text-xl font-bold flex-grow text-center">
                     {
-                        chat.users.filter((u) => u.uid !== user.uid)[0].name
+                        chat.peer.username
                     }
                 </h2>
             </div>
             <div className="flex-grow overflow-y-auto p-4 space-y-4 h-full min-h-full">
+                {!loadingMessages && prevCursor && (
+                    <button
+                        onClick={loadOlderMessages}
+                        disabled={loadingOlder}
+                        className="block mx-auto text-sm py-1 px-3 border-2 border-black bg-gray-100 hover:bg-gray-200 cursor-pointer"
+                    >
+                        {
+                            loadingOlder ? "Loading..." : "Load older messages"
+                        }
+                    </button>
+                )}
                 {loadingMessages ? (
                     <p>Loading messages...</p>
                 ) : (
@@ -180,7 +210,7 @@ export default function ChatInterface({ chat, onBack }) {
                         name="attachment"
                         className="hidden"
                         onChange={handleAttachment}
-                        accept="image/jpg, image/jpeg, image/png"
+                        accept="image/jpg, image/jpeg, image/png, image/gif, image/webp"
                     />
                 </label>
                 <input
@@ -181,7 +181,7 @@ export default function CreatePostModal({ isOpen, onClose }) {
                             max={3}
                             onChange={handleFilesChange}
                             type="file"
-                            accept="image/jpg, image/png"
+                            accept="image/jpg, image/jpeg, image/png, image/gif, image/webp"
                             id="files"
                             name="files"
                             className="hidden"
@@ -8,14 +8,16 @@ export default function MyPosts({ refresh, onRefreshComplete, onNotification })
     const { user, firebaseUser } = useAuth();
     const [posts, setPosts] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
     const [confirmDeletePost, setConfirmDeletePost] = useState(false);
     const [postBeingDeleted, setPostBeingDeleted] = useState(null);
 
-    const getPosts = async () => {
-        setLoading(true);
+    //? El backend pagina los posts, con el cursor pedimos la página siguiente y la agregamos a las que ya tenemos
+    const getPosts = async (cursor = null) => {
+        if (!cursor) setLoading(true);
         try {
             const response = await fetch(
-                `${import.meta.env.VITE_BACKEND_URL}/posts/?user=${user.uid}`,
+                `${import.meta.env.VITE_BACKEND_URL}/posts/?user=${user.uid}${cursor ? `&cursor=${cursor}` : ""}`,
                 {
                     method: "GET",
                     headers: {
@@ -25,8 +27,9 @@ export default function MyPosts({ refresh, onRefreshComplete, onNotification })
                 }
             );
             const _posts = await response.json();
-            const _realPosts = JSON.parse(_posts.result);
-            setPosts(_realPosts);
+            const _realPosts = _posts.result;
+            setPosts((prevPosts) => cursor ? [...prevPosts, ..._realPosts] : _realPosts);
+            setNextCursor(_posts.next_cursor);
             onRefreshComplete();
             setLoading(false);
         } catch (error) {
@@ -83,6 +86,11 @@ export default function MyPosts({ refresh, onRefreshComplete, onNotification })
                         <p className="text-center">No posts found. Why don't you try to post some? :]</p>
                     )
             )}
+            {!loading && nextCursor && (
+                <button onClick={() => getPosts(nextCursor)} className="w-full bg-blue-500 hover:bg-blue-400 transition-all cursor-pointer text-white px-2 py-1 text-sm">
+                    Load more
+                </button>
+            )}
             <ConfirmModal isOpen={confirmDeletePost} onClose={() => setConfirmDeletePost(false)} onConfirm={onPostDelete} message="Are you sure you want to delete this post? This is irreversible!" />
         </div>
     );
@@ -1,10 +1,8 @@
-import { useAuth } from "../../contexts/AuthContext";
-
+//? Los archivos de un post son { url, thumbnail }, los posts antiguos guardaban solo la URL
 export default function Posts({ post, isSelfPost, showAuthor, onPostLike, onPinPost, onPostDelete }) {
-    const { user } = useAuth();
-    //? Ya que la fecha que genera PyDantic por defecto está en un formato distinto, la transformaremos a un formato más legible
+    //? La fecha llega en formato ISO (UTC), la transformaremos a un formato más legible
     //? El formato para mostrar será "DD/MM/YYYY HH:MM"
-    const normalDate = new Date(post.fecha.$date);
+    const normalDate = new Date(post.fecha);
     let _date = normalDate.toLocaleDateString().replaceAll('-', '/');
     let _hours = normalDate.getHours() < 10 ? `0${normalDate.getHours()}` : normalDate.getHours();
     let _minutes = normalDate.getMinutes() < 10 ? `0${normalDate.getMinutes()}` : normalDate.getMinutes();
@@ -31,15 +29,15 @@ export default function Posts({ post, isSelfPost, showAuthor, onPostLike, onPinP
                         {post.files && post.files.length > 0 && (
                             <div className="my-2 grid grid-cols-2 gap-2 md:flex md:items-center">
                                 {post.files.map((file, index) => (
-                                    <a key={index} href={file} target="_blank" rel="noreferrer">
-                                        <img className="w-24 h-24 object-contain hover:scale-105 transition-all" src={file} alt="uploaded_file" />
+                                    <a key={index} href={file.url ?? file} target="_blank" rel="noreferrer">
+                                        <img className="w-24 h-24 object-contain hover:scale-105 transition-all" src={file.thumbnail ?? file} alt="uploaded_file" />
                                     </a>
                                 ))}
                             </div>
                         )}
                         <div className="w-full flex items-center justify-between">
                             <p className="text-sm text-red-600 mt-2">
-                                ♥ {post.likes.length} Likes
+                                ♥ {post.like_count} Likes
                             </p>
                             <p className="text-gray-400 text-xs mt-2">
                                 {date}
@@ -59,8 +57,8 @@ export default function Posts({ post, isSelfPost, showAuthor, onPostLike, onPinP
                         {post.files.length > 0 && (
                             <div className="my-2 grid grid-cols-2 gap-2 md:flex md:items-center">
                                 {post.files.map((file, index) => (
-                                    <a key={index} href={file} target="_blank" rel="noreferrer">
-                                        <img className="w-24 h-24 object-contain hover:scale-105 transition-all" src={file} alt="uploaded_file" />
+                                    <a key={index} href={file.url ?? file} target="_blank" rel="noreferrer">
+                                        <img className="w-24 h-24 object-contain hover:scale-105 transition-all" src={file.thumbnail ?? file} alt="uploaded_file" />
                                     </a>
                                 ))}
                             </div>
@@ -69,12 +67,12 @@ export default function Posts({ post, isSelfPost, showAuthor, onPostLike, onPinP
                             <p
                                 onClick={() => onPostLike(post.id)}
                                 className={`${
-                                    post.likes.includes(user.uid)
+                                    post.liked
                                         ? "text-red-600"
                                         : "text-gray-800"
                                 } text-sm mt-2 cursor-pointer`}
                             >
-                                ♥ {post.likes.length} Likes
+                                ♥ {post.like_count} Likes
                             </p>
                             <p className="text-xs mt-2">{date}</p>
                         </div>
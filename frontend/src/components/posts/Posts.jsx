@@ -4,14 +4,16 @@ import { useEffect, useState } from "react";
 import Post from "./Post";
 
 export default function Posts({ refresh, onRefreshComplete }) {
-    const { user, firebaseUser } = useAuth();
+    const { firebaseUser } = useAuth();
     const [posts, setPosts] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
 
-    const getPosts = async () => {
-        setLoading(true);
+    //? El backend pagina los posts, con el cursor pedimos la página siguiente y la agregamos a las que ya tenemos
+    const getPosts = async (cursor = null) => {
+        if (!cursor) setLoading(true);
         try {
-            const response = await fetch(`${import.meta.env.VITE_BACKEND_URL}/posts/?user=public-friends`,
+            const response = await fetch(`${import.meta.env.VITE_BACKEND_URL}/posts/?user=public-friends${cursor ? `&cursor=${cursor}` : ""}`,
                 {
                     method: "GET",
                     headers: {
@@ -21,8 +23,9 @@ export default function Posts({ refresh, onRefreshComplete }) {
                 }
             );
             const _posts = await response.json();
-            const _realPosts = JSON.parse(_posts.result);
-            setPosts(_realPosts);
+            const _realPosts = _posts.result;
+            setPosts((prevPosts) => cursor ? [...prevPosts, ..._realPosts] : _realPosts);
+            setNextCursor(_posts.next_cursor);
             onRefreshComplete();
             setLoading(false);
         } catch (error) {
@@ -48,14 +51,7 @@ export default function Posts({ refresh, onRefreshComplete }) {
             setPosts((prevPosts) => {
                 return prevPosts.map((post) => {
                     if (post.id === postId) {
-                        if (_didLike.action === "like") {
-                            return { ...post, likes: [...post.likes, user.uid] };
-                        } else {
-                            return {
-                                ...post,
-                                likes: post.likes.filter((like) => like !== user.uid),
-                            };
-                        }
+                        return { ...post, liked: _didLike.liked, like_count: _didLike.like_count };
                     }
                     return post;
                 });
@@ -86,6 +82,11 @@ export default function Posts({ refresh, onRefreshComplete }) {
                     )
                 )
             }
+            {!loading && nextCursor && (
+                <button onClick={() => getPosts(nextCursor)} className="w-full bg-blue-500 hover:bg-blue-400 transition-all cursor-pointer text-white px-2 py-1 text-sm">
+                    Load more
+                </button>
+            )}
         </div>
     );
 }
@@ -27,7 +27,7 @@ export const AuthProvider = ({ children }) => {
         });
         const r = await response.json();
         if (r.status === "success") {
-            setChats(JSON.parse(r.result));
+            setChats(r.result);
         } else {
             setChats([]);
         }
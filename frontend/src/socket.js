@@ -1,11 +1,18 @@
 import { io } from "socket.io-client";
+import { auth } from "./firebase";
 
-//? Habilitamos el autoConnect para que se conecte automáticamente al servidor y reconnectionAttempts para que intente reconectar al menos 5 veces
+//? La conexión se abre cuando hay una sesión (ver Chat.jsx) y reconnectionAttempts hace que intente reconectar al menos 5 veces
+//* El servidor autentica el socket una sola vez al conectarse, con el ID token de Firebase (se pide en cada intento por si expiró)
 const SOCKET_URL = `${import.meta.env.VITE_BACKEND_URL}/`;
 const socket = io(SOCKET_URL, {
   transports: ["websocket"], // Forzamos WebSocket
-  autoConnect: true,
+  autoConnect: false,
   reconnectionAttempts: 5, // Intenta reconectar 5 veces
+  auth: (cb) => {
+    const user = auth.currentUser;
+    if (!user) return cb({});
+    user.getIdToken().then((token) => cb({ token })).catch(() => cb({}));
+  },
 });
 
 export default socket;
@@ -257,12 +257,15 @@ export default function Home() {
                 ) : (  
                   <div className="space-y-4">
                     {chats.map((chat) => {
-                      const friend = chat.users.find((u) => u.uid !== user.uid);
+                      const friend = chat.peer;
                       return (
                         <div onClick={() => handleChatClick(chat)} key={chat.id} className="flex items-start bg-gray-100 p-4 border-2 border-black cursor-pointer hover:bg-gray-200">
                           <img className='w-12 h-12 object-contain border-2 border-black' src={friend.profile_picture} alt="" />
                           <div className='ml-2'>
-                            <h3 className="font-bold">{friend.username}</h3>
+                            <h3 className="font-bold">
+                              {friend.username}
+                              {chat.unread > 0 && <span className="ml-2 bg-blue-500 text-white text-xs px-1">{chat.unread}</span>}
+                            </h3>
                             <p className="text-sm">
                               {
                                 chat.last_message ? chat.last_message.content : 'No messages'